@@ -4,6 +4,8 @@ from chromadb.utils.embedding_functions.ollama_embedding_function import (
 )
 from chromadb.config import Settings
 
+from ..utils.tracing import span
+
 
 class VectorSearch:
     def __init__(
@@ -33,7 +35,10 @@ class VectorSearch:
             self.collection.add(documents=documents, ids=id, metadatas=metadatas)
 
     def query(self, query: str, k: int):
-        return self.collection.query(query_texts=query, n_results=k)
+        with span("vector_search", collection=self.name, k=k) as s:
+            result = self.collection.query(query_texts=query, n_results=k)
+            s.set(results=sum(len(ids) for ids in result.get("ids") or []))
+            return result
 
     def reset(self):
         self.client.reset()
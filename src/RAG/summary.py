@@ -24,13 +24,15 @@ class Summary(object):
 
         self.length = 4
 
-    def summary(self, content: str):
+    async def summary(self, content: str, max_concurrency: int = 4):
         """
         input content read from markdown
         output a dict
         {
             id , url, title , summary , brief_summary , keywords
         }
+        chunks are summarised concurrently, each one only sees the summaries
+        of previous summary() calls
         """
         texts = content.split()
         counter = 0
@@ -44,13 +46,17 @@ class Summary(object):
                 paragraph = ""
                 counter = 0
         self.chunks.append(paragraph)
-        for chunk in self.chunks:
-            prompt = summary_prompt(chunk, self.db)
-            """
-            """
-            alphabet = string.ascii_letters + string.digit
 
-            r = self.model.completion(prompt)
+        prompts = [summary_prompt(chunk, self.db) for chunk in self.chunks]
+        responses = await self.model.completion_many(
+            prompts, max_concurrency=max_concurrency
+        )
+
+        alphabet = string.ascii_letters + string.digits
+        for r in responses:
+            if isinstance(r, Exception):
+                print(f"Failed to summarise chunk: {r}")
+                continue
             json_str = self.extract_json_from_codeblock(r)
             if json_str is None:
                 print("No JSON code block found in response")
@@ -3,9 +3,12 @@ from abc import ABC, abstractmethod
 import re
 import json
 import ast
+import heapq
 
 from pydantic import BaseModel
 
+from .context import current_run
+
 """
     This is an abstract class for Agent
     Here we will list out method that an Agent should have 
@@ -36,6 +39,17 @@ class Agent(ABC):
     def get_send_format(self) -> BaseModel:
         pass
 
+    """
+        Agents are shared between reports, what an agent keeps while working on
+        one report goes in its run state (see context.py)
+    """
+
+    def new_state(self):
+        return None
+
+    def run_state(self):
+        return current_run().state(self, self.new_state)
+
     def _extract_response(self, res: str):
         """
         Extract JSON or Python literal from a string that may contain markdown code blocks or plain text.
@@ -60,43 +74,122 @@ class Agent(ABC):
                         continue
 
         # Find JSON or Python literals in plain string
-        json_candidates = []
-        for start_char, end_char in [("{", "}"), ("[", "]")]:
-            start_idx = 0
-            while True:
-                start_pos = res.find(start_char, start_idx)
-                if start_pos == -1:
-                    break
-                bracket_count = 0
-                end_pos = start_pos
-                for i in range(start_pos, len(res)):
-                    char = res[i]
-                    if char == start_char:
-                        bracket_count += 1
-                    elif char == end_char:
-                        bracket_count -= 1
-                        if bracket_count == 0:
-                            end_pos = i
-                            break
-                if bracket_count == 0:
-                    candidate = res[start_pos : end_pos + 1].strip()
-                    json_candidates.append(candidate)
-                start_idx = start_pos + 1
-
-        valid_candidates = []
-        for candidate in json_candidates:
+        # the largest valid candidate wins, so candidates are tried from the
+        # largest down and the first one that parses is the answer. Smaller
+        # spans inside a candidate are only tried when it fails to parse.
+        # The spans of the quote aware scan come with the plain bracket
+        # matching spans, a quote in prose can't hide what the plain
+        # matching finds.
+        pending = [
+            _candidate(span, res)
+            for span in _bracket_spans(res) + _plain_spans(res, "{}") + _plain_spans(res, "[]")
+        ]
+        heapq.heapify(pending)
+        tried = set()
+        while pending:
+            _, _, start_pos, end_pos, children = heapq.heappop(pending)
+            if (start_pos, end_pos) in tried:
+                # found by both scans, the inner spans may differ
+                for span in children:
+                    heapq.heappush(pending, _candidate(span, res))
+                continue
+            tried.add((start_pos, end_pos))
+            candidate = res[start_pos : end_pos + 1]
             try:
-                parsed = json.loads(candidate)
-                valid_candidates.append((candidate, parsed))
+                return json.loads(candidate)
             except json.JSONDecodeError:
                 try:
-                    parsed = ast.literal_eval(candidate)
-                    valid_candidates.append((candidate, parsed))
+                    return ast.literal_eval(candidate)
                 except Exception:
-                    continue
-
-        if valid_candidates:
-            largest = max(valid_candidates, key=lambda x: len(x[0]))
-            return largest[1]
+                    for span in children:
+                        heapq.heappush(pending, _candidate(span, res))
 
         return None
+
+
+def _candidate(span: tuple, text: str) -> tuple:
+    """
+    Heap entry of a span, longest first, then objects before arrays, then
+    the earliest one
+    """
+    start, end, children = span
+    return (start - end, text[start] != "{", start, end, children)
+
+
+_CLOSING = {"}": "{", "]": "["}
+# a quote only opens a string where a value (or a key) can start
+_VALUE_START = "{[,:"
+# the only characters the scanner has to look at
+_SPECIAL = re.compile(r"[{}\[\]\"'\\\n]")
+
+
+def _bracket_spans(text: str) -> list:
+    """
+    Single pass over the text, return the top level bracket spans as
+    (start, end, children) trees. Brackets inside quoted strings are ignored,
+    a string can't run past the end of the line. An apostrophe only opens a
+    string where a value can start, "[Note: here's ...]" has none.
+    """
+    top = []
+    stack = []  # (opening char, start, children)
+    quote = None
+    escaped = -1  # position of the character escaped by a backslash
+    for match in _SPECIAL.finditer(text):
+        i = match.start()
+        char = text[i]
+        if quote is not None:
+            if i == escaped:
+                continue
+            if char == "\\":
+                escaped = i + 1
+            elif char == quote or char == "\n":
+                quote = None
+            continue
+        if char in "{[":
+            stack.append((char, i, []))
+        elif char in "}]":
+            # unbalanced brackets: close the nearest matching one
+            opening = _CLOSING[char]
+            at = len(stack) - 1
+            while at >= 0 and stack[at][0] != opening:
+                at -= 1
+            if at < 0:
+                continue
+            _, start, children = stack[at]
+            for _, _, unclosed_children in stack[at + 1 :]:
+                children.extend(unclosed_children)
+            del stack[at:]
+            span = (start, i, children)
+            (stack[-1][2] if stack else top).append(span)
+        elif stack and (char == '"' or _value_start(text, i)):
+            quote = char
+    for _, _, children in stack:
+        top.extend(children)
+    return top
+
+
+def _value_start(text: str, i: int) -> bool:
+    i -= 1
+    while i >= 0 and text[i] in " \t\r\n":
+        i -= 1
+    return i >= 0 and text[i] in _VALUE_START
+
+
+def _plain_spans(text: str, pair: str) -> list:
+    """
+    Spans of one kind of bracket matched by counting, quotes ignored, as
+    (start, end, children) trees
+    """
+    opening, closing = pair
+    top = []
+    stack = []  # (start, children)
+    for match in re.finditer(re.escape(opening) + "|" + re.escape(closing), text):
+        i = match.start()
+        if text[i] == opening:
+            stack.append((i, []))
+        elif stack:
+            start, children = stack.pop()
+            (stack[-1][1] if stack else top).append((start, i, children))
+    for _, children in stack:
+        top.extend(children)
+    return top
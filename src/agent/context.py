@@ -0,0 +1,55 @@
+"""
+Per run state of the agents
+
+Agents are shared between report requests (see factory/pool.py), whatever
+an agent collects while it works on one report (search todo list, urls,
+documents ...) lives in the RunContext of that report instead of on the
+agent. The Server opens a RunContext for every workflow, tasks started by
+the workflow see the same context.
+"""
+
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+import uuid
+
+
+class RunContext:
+    def __init__(self, run_id: str = ""):
+        self.run_id = run_id or uuid.uuid4().hex
+        self._states: dict = {}
+
+    def state(self, agent, factory: Callable):
+        """
+        State of agent in this run, created with factory on first use
+        """
+        key = id(agent)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = factory()
+        return state
+
+    def clear(self):
+        self._states.clear()
+
+
+_current: ContextVar[Optional[RunContext]] = ContextVar("run_context", default=None)
+
+
+def start_run(run_id: str = "") -> RunContext:
+    """
+    Open a new run for the current task and the tasks it starts
+    """
+    ctx = RunContext(run_id)
+    _current.set(ctx)
+    return ctx
+
+
+def current_run() -> RunContext:
+    """
+    Run of the current task, agents called outside a workflow get their own
+    """
+    ctx = _current.get()
+    if ctx is None:
+        ctx = start_run()
+    return ctx
@@ -0,0 +1,109 @@
+"""
+Coverage of the query by the collected documents
+
+The planner runs every task of its plan even when the documents found so far
+already answer the query. After each task the planner scores how well the
+documents cover the query: the query is split into sub-questions, each
+sub-question is matched with its closest document summary (MiniLM cosine
+similarity) and the coverage is the score of the worst covered one. Once it
+passes the threshold the remaining search and retrieval tasks are skipped.
+
+Needs sentence-transformers, without it nothing is skipped.
+
+Configured in config.json:
+    "coverage": {"enabled": true, "threshold": 0.6, "min_documents": 3}
+"""
+
+from ..utils import read_config
+from ..utils.embedding import encode
+
+from typing import Optional
+
+import asyncio
+import re
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# a new question starts after ? ; or a line break, or at "and" followed by a question word
+_split = re.compile(
+    r"[?;\n]+|,?\s+and\s+(?=(?:what|how|why|who|when|where|which|is|are|does|do|can)\b)",
+    re.IGNORECASE,
+)
+
+
+def sub_questions(query: str) -> list[str]:
+    parts = [p.strip(" ,.") for p in _split.split(query or "")]
+    parts = [p for p in parts if len(p.split()) >= 3]
+    return parts or [query]
+
+
+class Coverage:
+    """
+    Args:
+        threshold: coverage required to stop searching
+        min_documents: documents with a summary required before checking
+    """
+
+    def __init__(self, threshold: float = 0.6, min_documents: int = 3):
+        self.threshold = threshold
+        self.min_documents = min_documents
+        self._questions = None  # (query, embeddings)
+        self._texts: dict = {}  # document key -> text, every document seen
+        self._documents: dict = {}  # document key -> embedding
+
+    async def score(self, query: str, data) -> Optional[float]:
+        """
+        Coverage of the query by the documents of data and the ones seen
+        before (parallel branches), None when it can't be computed (too few
+        documents, no embeddings)
+        """
+        texts = self._texts
+        for d in data or []:
+            if not hasattr(d, "get"):
+                continue
+            text = d.get("summary") or d.get("brief_summary") or ""
+            if text:
+                key = d.get("url") or text[:200]
+                texts[key] = f"{d.get('title') or ''} {text}"[:2000]
+        if len(texts) < self.min_documents:
+            return None
+
+        try:
+            if self._questions is None or self._questions[0] != query:
+                embeddings = await asyncio.to_thread(encode, sub_questions(query))
+                if embeddings is None:
+                    return None
+                self._questions = (query, embeddings)
+            # only the new documents are embedded
+            new = [k for k in texts if k not in self._documents]
+            if new:
+                embeddings = await asyncio.to_thread(encode, [texts[k] for k in new])
+                if embeddings is None:
+                    return None
+                self._documents.update(zip(new, embeddings))
+        except Exception as e:
+            logger.warning(f"coverage check failed: {e}")
+            return None
+
+        documents = np.stack([self._documents[k] for k in texts])
+        similarity = self._questions[1] @ documents.T  # sub-questions x documents
+        return float(similarity.max(axis=1).min())
+
+    def covered(self, score: Optional[float]) -> bool:
+        return score is not None and score >= self.threshold
+
+
+def get_coverage() -> Optional[Coverage]:
+    """
+    Coverage check of a new plan, None when disabled in config.json
+    """
+    try:
+        conf = dict(read_config().get("coverage", {}))
+    except Exception:
+        conf = {}
+    if not conf.pop("enabled", True):
+        return None
+    return Coverage(**conf)
@@ -0,0 +1,217 @@
+"""
+Fast path of the Planner
+
+Most reports only need "search then write". For those the planning LLM call
+is pure latency, FastPath recognises them locally and hands the Server a
+canned plan, anything else goes to the LLM planner.
+
+A query takes the fast path when
+    - it is short and has no sign of a multi step task (compare, pros and
+      cons, step by step, several questions ...)
+    - with sentence-transformers installed, its MiniLM embedding is closer to
+      examples of simple lookups than to examples of analytical tasks
+and one of the patterns matches the available agents:
+    reporter_only: the reporter is the only agent, every plan is the same
+    local_report: the query is about the user's files -> local retrieval, reporter
+    search_report: search agent, reporter
+
+Configured in config.json:
+    "fast_path": {"enabled": true, "max_words": 16, "margin": 0.05}
+"""
+
+from ..utils import read_config
+from ..utils.embedding import encode
+
+from typing import Optional
+
+import asyncio
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+REPORTER = "reporter"
+SEARCHERS = ("quick-searcher", "searcher", "search")
+LOCAL = "local-retrieval"
+
+_complex = re.compile(
+    r"\b(compare|comparison|versus|vs\.?|pros and cons|step[- ]by[- ]step|analy[sz]e|analysis"
+    r"|evaluate|plan|strategy|timeline|history of|impact of|relationship between|differences?"
+    r"|in depth|comprehensive|and then|as well as)\b|;",
+    re.IGNORECASE,
+)
+_local = re.compile(
+    r"\b(my|our|local|uploaded|attached)\s+(\w+\s+)?(files?|documents?|docs|notes|pdfs?|folders?|papers?)\b",
+    re.IGNORECASE,
+)
+
+# examples the embedding of a query is compared to
+SIMPLE_EXAMPLES = [
+    "latest news about the stock market",
+    "what is quantum computing",
+    "who won the football game yesterday",
+    "weather forecast for tomorrow",
+    "price of bitcoin today",
+    "summary of the new iphone release",
+    "what happened at the election",
+    "recent research on large language models",
+]
+COMPLEX_EXAMPLES = [
+    "compare the economic policies of three countries and recommend one",
+    "write a detailed analysis of the causes and consequences of the war",
+    "plan a marketing strategy with a timeline and budget",
+    "evaluate the pros and cons of each database and benchmark them",
+    "explain step by step how to migrate the system and the risks of each step",
+    "research the history of the company then forecast its revenue",
+]
+
+
+class FastPath:
+    """
+    Args:
+        max_words: longer queries always go to the LLM planner
+        margin: how much closer to the simple examples than to the complex
+            ones a query must be
+    """
+
+    def __init__(self, max_words: int = 16, margin: float = 0.05):
+        self.max_words = max_words
+        self.margin = margin
+
+        self._examples = None  # (simple, complex) embeddings, False when unavailable
+        self._lock = threading.Lock()
+
+        self.hits: dict = {}  # pattern -> count
+        self.misses = 0
+
+    async def plan(self, query: str, agents: dict) -> Optional[list[dict]]:
+        """
+        Canned plan for the query, None when the LLM planner is needed
+        agents: agent name -> description, as given to the planner
+        """
+        pattern = await self.classify(query, agents)
+        with self._lock:
+            if pattern is None:
+                self.misses += 1
+                return None
+            self.hits[pattern] = self.hits.get(pattern, 0) + 1
+        logger.info(f"fast path {pattern} for {query}")
+        return _PATTERNS[pattern](query, agents)
+
+    async def classify(self, query: str, agents: dict) -> Optional[str]:
+        if REPORTER not in agents:
+            return None
+        if set(agents) == {REPORTER}:
+            return "reporter_only"
+
+        words = query.split()
+        if not words or len(words) > self.max_words:
+            return None
+        if _complex.search(query) or query.count("?") > 1:
+            return None
+
+        if _local.search(query):
+            pattern = "local_report" if LOCAL in agents else None
+        elif _searcher(agents) is not None:
+            pattern = "search_report"
+        else:
+            pattern = None
+        if pattern is None:
+            return None
+
+        if not await self._looks_simple(query):
+            return None
+        return pattern
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = sum(self.hits.values())
+            total = hits + self.misses
+            return {
+                "hits": dict(self.hits),
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+            }
+
+    async def _looks_simple(self, query: str) -> bool:
+        """
+        Embedding check, True when the embeddings aren't available
+        """
+        try:
+            examples = await self._get_examples()
+            if not examples:
+                return True
+            embedding = await asyncio.to_thread(encode, [query])
+        except Exception as e:
+            logger.warning(f"fast path embedding failed: {e}")
+            return True
+        if embedding is None:
+            return True
+        simple, complex_ = examples
+        return float((simple @ embedding[0]).max()) - float((complex_ @ embedding[0]).max()) >= self.margin
+
+    async def _get_examples(self):
+        if self._examples is None:
+            embeddings = await asyncio.to_thread(encode, SIMPLE_EXAMPLES + COMPLEX_EXAMPLES)
+            if embeddings is None:
+                self._examples = False
+            else:
+                n = len(SIMPLE_EXAMPLES)
+                self._examples = (embeddings[:n], embeddings[n:])
+        return self._examples
+
+
+def _searcher(agents: dict) -> Optional[str]:
+    for name in SEARCHERS:
+        if name in agents:
+            return name
+    return None
+
+
+def _reporter_only(query: str, agents: dict) -> list[dict]:
+    return [{"id": "1", "agent": REPORTER, "task": query, "depends_on": []}]
+
+
+def _local_report(query: str, agents: dict) -> list[dict]:
+    return [
+        {"id": "1", "agent": LOCAL, "task": query, "depends_on": []},
+        {"id": "2", "agent": REPORTER, "task": query, "depends_on": ["1"]},
+    ]
+
+
+def _search_report(query: str, agents: dict) -> list[dict]:
+    return [
+        {"id": "1", "agent": _searcher(agents), "task": query, "depends_on": []},
+        {"id": "2", "agent": REPORTER, "task": query, "depends_on": ["1"]},
+    ]
+
+
+_PATTERNS = {
+    "reporter_only": _reporter_only,
+    "local_report": _local_report,
+    "search_report": _search_report,
+}
+
+
+_fast_path: Optional[FastPath] = None
+_fast_path_lock = threading.Lock()
+
+
+def get_fast_path() -> Optional[FastPath]:
+    """
+    Process wide fast path, None when disabled in config.json
+    """
+    global _fast_path
+    if _fast_path is not None:
+        return _fast_path
+    try:
+        conf = dict(read_config().get("fast_path", {}))
+    except Exception:
+        conf = {}
+    if not conf.pop("enabled", True):
+        return None
+    with _fast_path_lock:
+        if _fast_path is None:
+            _fast_path = FastPath(**conf)
+    return _fast_path
@@ -1,3 +1,4 @@
 """
 Models are just a folder that contine the object  (how to agent communicate with each others)
 """
+from .model import Data_row, DocumentStore, canonical_url
@@ -1,17 +1,305 @@
-from typing import Optional
+"""
+Models are just a folder that contine the object  (how to agent communicate with each others)
+"""
+from ...utils.url import canonical_url
 
+from typing import Iterable, Optional
+
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 class Data_row:
     """
     Two types of Data_row ,
     a file response
+
+    A document collected by an agent. Rows behave like the dicts agents used
+    to pass around (row["url"], row.get("summary")) but only keep a few slots.
     """
 
-    filepath: Optional[str | None]
-    title: str
-    brief_summary: str
-    keywords: list[str]
-    url: str
+    __slots__ = (
+        "id",
+        "url",
+        "title",
+        "summary",
+        "brief_summary",
+        "keywords",
+        "filepath",
+        "extra",
+    )
+
+    FIELDS = ("url", "title", "summary", "brief_summary", "keywords", "filepath")
+
+    def __init__(
+        self,
+        url: str = "",
+        title: str = "",
+        summary: str = "",
+        brief_summary: str = "",
+        keywords: Optional[list[str]] = None,
+        filepath: Optional[str] = None,
+        extra: Optional[dict] = None,
+        id: str = "",
+    ):
+        self.id = id
+        self.url = url or ""
+        self.title = title or ""
+        self.summary = summary or ""
+        self.brief_summary = brief_summary or ""
+        self.keywords = keywords or []
+        self.filepath = filepath
+        self.extra = extra or None
+
+    @staticmethod
+    def from_dict(d: dict) -> "Data_row":
+        extra = {k: v for k, v in d.items() if k not in Data_row.FIELDS and k != "id"}
+        return Data_row(
+            url=d.get("url", ""),
+            title=d.get("title", ""),
+            summary=d.get("summary", ""),
+            brief_summary=d.get("brief_summary", ""),
+            keywords=d.get("keywords", []),
+            filepath=d.get("filepath"),
+            extra=extra,
+        )
+
+    def key(self) -> str:
+        """
+        Canonical url, or a hash of the content for documents without url
+        """
+        if self.url:
+            return canonical_url(self.url)
+        content = json.dumps(
+            [self.title, self.summary, self.brief_summary, self.filepath, self.extra],
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str,
+        )
+        return "sha1:" + hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def update(self, other: "Data_row"):
+        """
+        Fill the empty fields with the ones of a duplicate
+        """
+        for field in Data_row.FIELDS:
+            if not getattr(self, field) and getattr(other, field):
+                setattr(self, field, getattr(other, field))
+        if other.extra:
+            self.extra = {**other.extra, **(self.extra or {})}
+
+    def to_dict(self) -> dict:
+        d = {
+            "id": self.id,
+            "url": self.url,
+            "title": self.title,
+            "summary": self.summary,
+            "brief_summary": self.brief_summary,
+            "keywords": self.keywords,
+        }
+        if self.filepath is not None:
+            d["filepath"] = self.filepath
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    # dict style access, agents still read rows like the old dicts
+
+    def get(self, key: str, default=None):
+        if key in Data_row.__slots__ and key != "extra":
+            value = getattr(self, key)
+            return default if value is None else value
+        if self.extra:
+            return self.extra.get(key, default)
+        return default
+
+    def __getitem__(self, key: str):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+_MISSING = object()
+
+
+class DocumentStore(list):
+    """
+    Documents of one workflow
+
+    A list of Data_row so agents can keep iterating, appending and passing
+    it along, with a url / content hash index that drops duplicates on insert
+    and an id index for the reporter's source lookups.
+    Dicts are converted to Data_row when they are added.
+    """
+
+    def __init__(self, rows: Iterable = (), id_length: int = 6):
+        super().__init__()
+        self.id_length = id_length
+        self._by_key: dict = {}
+        self._by_id: dict = {}
+        self.extend(rows)
+
+    @staticmethod
+    def from_data(data) -> "DocumentStore":
+        if isinstance(data, DocumentStore):
+            return data
+        if data is None:
+            return DocumentStore()
+        if isinstance(data, dict):
+            return DocumentStore([data])
+        if isinstance(data, (str, bytes)):
+            logger.warning(f"ignoring data of type {type(data).__name__}")
+            return DocumentStore()
+        return DocumentStore(data)
+
+    @staticmethod
+    def merge(branches: Iterable) -> "DocumentStore":
+        store = DocumentStore()
+        for data in branches:
+            if isinstance(data, list):
+                store.extend(data)
+        return store
+
+    def append(self, row):
+        """
+        Add a document, a duplicate only fills the missing fields of the
+        document already stored
+        """
+        row = self._index(row)
+        if row is not None:
+            super().append(row)
+
+    def insert(self, index: int, row):
+        row = self._index(row)
+        if row is not None:
+            super().insert(index, row)
+
+    def extend(self, rows: Iterable):
+        for row in rows:
+            self.append(row)
+
+    def pop(self, index: int = -1) -> Data_row:
+        row = super().pop(index)
+        self._unindex(row)
+        return row
+
+    def remove(self, row):
+        if isinstance(row, dict):
+            row = Data_row.from_dict(row)
+        existing = self._by_key.get(row.key()) if isinstance(row, Data_row) else None
+        if existing is None:
+            raise ValueError("document not in the store")
+        super().remove(existing)
+        self._unindex(existing)
+
+    def clear(self):
+        super().clear()
+        self._by_key.clear()
+        self._by_id.clear()
+
+    # item and slice assignment go through append so the indexes stay right
+
+    def __setitem__(self, index, value):
+        rows = list(self)
+        rows[index] = value
+        self._reset(rows)
+
+    def __delitem__(self, index):
+        rows = list(self)
+        del rows[index]
+        self._reset(rows)
+
+    def __imul__(self, n: int):
+        # the documents are unique, repeating them adds nothing
+        if n <= 0:
+            self.clear()
+        return self
+
+    def __add__(self, other):
+        store = DocumentStore(self, self.id_length)
+        store.extend(other)
+        return store
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def copy(self) -> "DocumentStore":
+        return DocumentStore(self, self.id_length)
+
+    def __contains__(self, row) -> bool:
+        if isinstance(row, dict):
+            row = Data_row.from_dict(row)
+        if isinstance(row, Data_row):
+            return row.key() in self._by_key
+        return False
+
+    def by_url(self, url: str) -> Optional[Data_row]:
+        return self._by_key.get(canonical_url(url))
+
+    def by_id(self, id: str) -> Optional[Data_row]:
+        return self._by_id.get(id)
+
+    def by_ids(self, ids: Iterable[str]) -> list[Data_row]:
+        return [self._by_id[i] for i in ids if i in self._by_id]
+
+    # views
+
+    def summaries(self) -> list[dict]:
+        """
+        Short view for planning, id and summary of the documents with one
+        """
+        return [{"id": r.id, "short_summary": r.summary} for r in self if r.summary]
+
+    def urls(self) -> list[str]:
+        return [r.url for r in self if r.url]
+
+    def to_list(self) -> list[dict]:
+        return [r.to_dict() for r in self]
+
+    def _index(self, row) -> Optional[Data_row]:
+        """
+        Index a new document, None when it is a duplicate or not a document
+        """
+        if isinstance(row, dict):
+            row = Data_row.from_dict(row)
+        if not isinstance(row, Data_row):
+            logger.warning(f"ignoring document of type {type(row).__name__}")
+            return None
+        key = row.key()
+        existing = self._by_key.get(key)
+        if existing is not None:
+            if existing is not row:
+                existing.update(row)
+            return None
+        row.id = self._new_id(key)
+        self._by_key[key] = row
+        self._by_id[row.id] = row
+        return row
+
+    def _unindex(self, row: Data_row):
+        self._by_key.pop(row.key(), None)
+        self._by_id.pop(row.id, None)
+
+    def _reset(self, rows: list):
+        self.clear()
+        self.extend(rows)
+
+    def _new_id(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        length = self.id_length
+        while digest[:length] in self._by_id and length < len(digest):
+            length += 1
+        return digest[:length]
 
 
 class Response(object):
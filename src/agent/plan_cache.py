@@ -0,0 +1,262 @@
+"""
+Plan cache of the Planner
+
+Turning the query and the available agents into a plan costs a full LLM
+round trip before any agent can start. Queries of the same shape get the
+same plan, so plans are cached by
+    - the normalised query (case, punctuation and spacing ignored)
+    - the agents available, names and descriptions
+
+With similarity on (off by default), a query that only differs from a
+cached one by a few words ("latest news about Tesla" / "latest news about
+Nvidia") reuses the cached plan as a template: the query is embedded, the
+closest cached queries are compared word by word and the replaced words are
+substituted in the tasks of the plan. A template is only used when every
+replaced phrase (or the whole cached query) was found in its tasks, else
+the plan would still be about the cached query ("CEO of OpenAI" planned as
+"search Sam Altman biography"). Queries with words added or removed are not
+reused, the plan may not fit them.
+
+Configured in config.json:
+    "plan_cache": {"enabled": true, "ttl": 3600, "max_entries": 512,
+                   "similarity": false, "threshold": 0.7, "max_changed_words": 3}
+"""
+
+from ..utils import read_config
+from ..utils.embedding import encode
+
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Optional
+
+import asyncio
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_words = re.compile(r"\w+(?:[-'.]\w+)*")
+
+
+def query_signature(query: str) -> str:
+    return " ".join(w.lower() for w in _words.findall(query or ""))
+
+
+def agents_signature(agents: dict) -> str:
+    """
+    agents: agent name -> description, as given to the planner
+    """
+    key = json.dumps(sorted(agents.items()), ensure_ascii=False)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """
+    Args:
+        ttl: seconds a plan can be reused
+        max_entries: bounded size, least recently used plan is evicted
+        similarity: reuse the plan of a similar query as a template
+        threshold: cosine similarity required to try a template
+        max_changed_words: words of the query a template may replace
+    """
+
+    def __init__(
+        self,
+        ttl: float = 60 * 60,
+        max_entries: int = 512,
+        similarity: bool = False,
+        threshold: float = 0.7,
+        max_changed_words: int = 3,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.threshold = threshold
+        self.max_changed_words = max_changed_words
+
+        # (agents signature, query signature) -> {"query", "plan", "embedding", "created"}
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.template_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    async def lookup(self, query: str, agents: dict) -> Optional[list[dict]]:
+        """
+        Plan (list of {"id", "task", "agent", "depends_on"}) for the query,
+        None on a miss
+        """
+        agents_key = agents_signature(agents)
+        key = (agents_key, query_signature(query))
+        with self._lock:
+            self._expire(time.time())
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry["plan"])
+            candidates = [
+                (k, e)
+                for k, e in self._entries.items()
+                if k[0] == agents_key and e["embedding"] is not None
+            ]
+
+        if self.similarity and candidates:
+            plan = await self._template(query, candidates)
+            if plan is not None:
+                with self._lock:
+                    self.template_hits += 1
+                return plan
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    async def store(self, query: str, agents: dict, plan: list[dict]):
+        if not plan:
+            return
+        key = (agents_signature(agents), query_signature(query))
+        embedding = await self._embed(key[1]) if self.similarity else None
+        with self._lock:
+            self._entries[key] = {
+                "query": query,
+                "plan": copy.deepcopy(plan),
+                "embedding": embedding,
+                "created": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.template_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "template_hits": self.template_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "hit_rate": (self.hits + self.template_hits) / total if total else 0.0,
+        }
+
+    async def _template(self, query: str, candidates: list) -> Optional[list[dict]]:
+        """
+        Plan of the closest cached query with the replaced words substituted
+        """
+        embedding = await self._embed(query_signature(query))
+        if embedding is None:
+            return None
+        scored = []
+        for key, entry in candidates:
+            score = float(entry["embedding"] @ embedding)
+            if score >= self.threshold:
+                scored.append((score, key, entry))
+        for score, key, entry in sorted(scored, key=lambda x: -x[0]):
+            replacements = self._replacements(entry["query"], query)
+            if replacements is None:
+                continue
+            plan = copy.deepcopy(entry["plan"])
+            substituted = set()
+            for task in plan:
+                task["task"], found = _substitute(
+                    task.get("task", ""), entry["query"], query, replacements
+                )
+                substituted |= found
+            if len(substituted) < len(replacements):
+                # the tasks don't mention what changed, they may not fit the new query
+                logger.info(f"plan of '{entry['query']}' doesn't fit '{query}'")
+                continue
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+            logger.info(f"plan of '{entry['query']}' reused for '{query}' ({score:.2f})")
+            return plan
+        return None
+
+    def _replacements(self, cached: str, query: str) -> Optional[list[tuple]]:
+        """
+        Phrases of the cached query replaced in the new one, None when the
+        queries differ by more than replaced words
+        """
+        old = _words.findall(cached)
+        new = _words.findall(query)
+        matcher = SequenceMatcher(a=[w.lower() for w in old], b=[w.lower() for w in new], autojunk=False)
+        replacements = []
+        changed = 0
+        for op, i1, i2, j1, j2 in matcher.get_opcodes():
+            if op == "equal":
+                continue
+            if op != "replace":
+                return None
+            changed += max(i2 - i1, j2 - j1)
+            replacements.append((old[i1:i2], " ".join(new[j1:j2])))
+        if not replacements or changed > self.max_changed_words:
+            return None
+        return replacements
+
+    def _expire(self, now: float):
+        if self.ttl is None:
+            return
+        expired = [k for k, e in self._entries.items() if now - e["created"] > self.ttl]
+        for k in expired:
+            del self._entries[k]
+        self.expired += len(expired)
+
+    async def _embed(self, text: str):
+        try:
+            embeddings = await asyncio.to_thread(encode, [text])
+        except Exception:
+            return None
+        return None if embeddings is None else embeddings[0]
+
+
+def _substitute(text: str, cached: str, query: str, replacements: list[tuple]) -> tuple:
+    """
+    text with the replacements done, and the indexes of the replacements found
+    """
+    if cached and cached in text:
+        return text.replace(cached, query), set(range(len(replacements)))
+    found = set()
+    for i, (words, new) in enumerate(replacements):
+        pattern = r"\b" + r"\W+".join(re.escape(w) for w in words) + r"\b"
+        text, n = re.subn(pattern, lambda _: new, text, flags=re.IGNORECASE)
+        if n:
+            found.add(i)
+    return text, found
+
+
+_plan_cache: Optional[PlanCache] = None
+_plan_cache_lock = threading.Lock()
+
+
+def get_plan_cache() -> Optional[PlanCache]:
+    """
+    Process wide plan cache, None when disabled in config.json
+    """
+    global _plan_cache
+    if _plan_cache is not None:
+        return _plan_cache
+    try:
+        conf = dict(read_config().get("plan_cache", {}))
+    except Exception:
+        conf = {}
+    if not conf.pop("enabled", True):
+        return None
+    with _plan_cache_lock:
+        if _plan_cache is None:
+            _plan_cache = PlanCache(**conf)
+    return _plan_cache
@@ -1,19 +1,51 @@
 from .agent import Agent
 from ..prompt import planner_agent_prompt
 from ..model import model
+from ..utils import JsonArrayStream
+from ..router.events import emit, PlanCreated, TasksSkipped
+from .plan_cache import get_plan_cache
+from .fast_path import get_fast_path
+from .coverage import get_coverage
 
 import json
+import time
+import asyncio
 
 from collections import deque
+from typing import Optional
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+# the agent writing the report, it is never skipped
+REPORTER = "reporter"
+
 
 class Planner(Agent):
-    def __init__(self, model: model, query: str = "", data=None):
+    def __init__(
+        self,
+        model: model,
+        query: str = "",
+        data=None,
+        stream: bool = True,
+        plan_cache: bool = True,
+        fast_path: bool = True,
+    ):
+        """
+        stream: parse the plan while the model writes it, the first task is
+            dispatched as soon as it is complete instead of waiting for the
+            whole plan
+        plan_cache: reuse the plan of the same query (or a query of the same
+            shape) with the same agents instead of asking the model, see plan_cache.py
+        fast_path: simple queries get a canned plan without asking the model,
+            see fast_path.py
+        """
         self.query = query
+        self.stream = stream
+        self.plan_cache = plan_cache
+        self.fast_path = fast_path
+        self._plan_task = None
         self._model = model
         self._output_model = {}
         self._todo_list = _todo()
@@ -23,6 +55,10 @@ class Planner(Agent):
 
         self.response = ""
         self.db = []
+
+        self._current = None  # task run by an agent, sequential mode
+        self._durations: dict = {}  # agent -> seconds of its finished tasks
+        self._coverage = None
         self.name = "planner"
         self.description = "plan the tasks"
 
@@ -45,37 +81,242 @@ class Planner(Agent):
 
         logger.info("planner running ... ...")
         if not self.initialize:
-            prompt = planner_agent_prompt(
-                list(self._output_model.keys()),
-                list(self._output_model.values()),
-                self.query,
-            )
-            res = self._model.completion(prompt)
-
-            logger.info(f"get response {res}")
-
-            self._response_todo_handler(res)
+            start = time.perf_counter()
+            await self.start_plan()
+            task = await self._todo_list.next_task()
+            logger.info(f"first task after {time.perf_counter() - start:.2f}s")
 
-            self.initialize = True
-
-            task = self._todo_list.pop_task()
+            if task == None:
+                logger.info("empty plan, terminate processs")
+                return {"agent": "TERMINATE", "task": "TERMINATE", "data": data}
             logger.info(f"handling {task.task}")
 
-            obj = {"agent": task.agent, "task": task.task, "data": data}
+            self._current = task.id
+            obj = {"agent": task.agent, "task": task.task, "data": data, "id": task.id}
             return obj
         else:
-            self._response_handler(response)
-            new_task = self._todo_list.pop_task()
+            # the documents are in data, the message of the agent is empty
+            await self._response_handler(data, self._current)
+            new_task = await self._todo_list.next_task()
             if new_task == None:
                 logger.info("Terminate processs")
                 obj = {"agent": "TERMINATE", "task": "TERMINATE", "data": data}
             else:
-                obj = {"agent": new_task.agent, "task": new_task.task, "data": data}
+                self._current = new_task.id
+                obj = {
+                    "agent": new_task.agent,
+                    "task": new_task.task,
+                    "data": data,
+                    "id": new_task.id,
+                }
                 logger.info(f"handling next obj {obj}")
             return obj
 
-    def _response_handler(self, response):
-        pass
+    async def start_plan(self):
+        """
+        Ask the model for the plan and fill the todo list
+        in stream mode the plan keeps being written in the background
+        """
+        if await self._fast_plan() or await self._cached_plan():
+            self.initialize = True
+            return
+
+        prompt = planner_agent_prompt(
+            list(self._output_model.keys()),
+            list(self._output_model.values()),
+            self.query,
+        )
+        if self.stream:
+            self._todo_list.open()
+            self._plan_task = asyncio.create_task(self._stream_plan(prompt))
+        else:
+            res = await self._model.acompletion(prompt)
+
+            logger.info(f"get response {res}")
+
+            self._response_todo_handler(res)
+            emit(PlanCreated(tasks=self.plan_snapshot()))
+            await self._store_plan()
+        self.initialize = True
+
+    async def close(self):
+        """
+        Stop writing the plan, the workflow ended (report written, limit hit,
+        client gone) before the model finished it
+        """
+        task, self._plan_task = self._plan_task, None
+        if task is None or task.done():
+            return
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        logger.info("plan stream cancelled")
+
+    async def _fast_plan(self) -> bool:
+        """
+        Fill the todo list with the canned plan of a simple query, False
+        when the query needs the model
+        """
+        fast_path = get_fast_path() if self.fast_path else None
+        if fast_path is None:
+            return False
+        plan = await fast_path.plan(self.query, self._output_model)
+        if plan is None:
+            return False
+        self._add_plan(plan)
+        return True
+
+    def _add_plan(self, plan: list[dict]):
+        for t in plan:
+            self._todo_list.add_task(t["task"], t["agent"], t["id"], t["depends_on"])
+        emit(PlanCreated(tasks=self.plan_snapshot()))
+
+    async def _cached_plan(self) -> bool:
+        """
+        Fill the todo list from the plan cache, False on a miss
+        """
+        cache = get_plan_cache() if self.plan_cache else None
+        if cache is None:
+            return False
+        plan = await cache.lookup(self.query, self._output_model)
+        if plan is None:
+            return False
+        logger.info(f"plan cache hit for {self.query}")
+        self._add_plan(plan)
+        return True
+
+    async def _store_plan(self):
+        cache = get_plan_cache() if self.plan_cache else None
+        if cache is None or not self._todo_list.tasks:
+            return
+        try:
+            await cache.store(self.query, self._output_model, self.plan_snapshot())
+        except Exception as e:
+            # caching is best effort, the plan is already running
+            logger.warning(f"failed to cache the plan: {e}")
+
+    """
+        Dependency aware scheduling, used by the Server when it runs
+        independent tasks in parallel
+    """
+
+    def ready_tasks(self, done: set, limit: int = None, force: bool = False) -> list:
+        """
+        Pop the tasks whose dependencies are all in done
+        force: the plan can't make progress (cycle or missing dependency),
+            pop the first task anyway
+        """
+        todo = self._todo_list
+        if todo.closed and todo.error is not None and todo.added == 0:
+            raise todo.error
+        ready = todo.pop_ready(done, limit)
+        if not ready and force and todo.len():
+            task = todo.pop_task()
+            logger.warning(f"dependencies of {task.id} can't be satisfied, running it anyway")
+            ready = [task]
+        return ready
+
+    def plan_version(self) -> int:
+        return self._todo_list.version
+
+    def plan_done(self) -> bool:
+        """
+        True once the whole plan is written
+        """
+        return self._todo_list.closed
+
+    async def wait_plan(self, version: int):
+        """
+        Wait until the plan changed since version
+        """
+        await self._todo_list.wait_changed(version)
+
+    def plan_snapshot(self) -> list[dict]:
+        """
+        Every task of the plan, used for checkpoints
+        """
+        return [
+            {"id": t.id, "task": t.task, "agent": t.agent, "depends_on": t.depends_on}
+            for t in self._todo_list.tasks
+        ]
+
+    def restore_plan(self, tasks: list[dict], done: list[str]):
+        """
+        Restore a plan from a checkpoint, completed tasks are not run again
+        """
+        self._todo_list = _todo()
+        done = set(done)
+        for t in tasks:
+            self._todo_list.add_task(t["task"], t["agent"], t["id"], t["depends_on"])
+        self._todo_list.todo_list = deque(
+            t for t in self._todo_list.todo_list if t.id not in done
+        )
+        self.initialize = True
+
+    def resolve_dependencies(self, ids: list) -> list:
+        """
+        Ids of the tasks whose data a task depending on ids receives, a
+        skipped task passes on the data of its own dependencies
+        """
+        return self._todo_list.resolve(ids)
+
+    async def task_done(self, response, id: str = None):
+        """
+        The task id finished with response, used by the Server in parallel mode
+        """
+        data = response.get("data") if isinstance(response, dict) else None
+        await self._response_handler(data, id)
+
+    async def _response_handler(self, data, id: str = None):
+        """
+        Record how long the task took and stop searching once the documents
+        collected cover the query (see coverage.py)
+        """
+        task = self._todo_list.get(id)
+        if task is not None and task.started is not None:
+            self._durations.setdefault(task.agent, []).append(
+                time.perf_counter() - task.started
+            )
+        if data is not None:
+            await self._check_coverage(data)
+
+    async def _check_coverage(self, data):
+        skippable = [t for t in self._todo_list.todo_list if t.agent != REPORTER]
+        if not skippable:
+            return
+        if self._coverage is None:
+            self._coverage = get_coverage() or False
+        if not self._coverage:
+            return
+        score = await self._coverage.score(self.query, data)
+        if score is None:
+            return
+        if not self._coverage.covered(score):
+            logger.info(f"coverage {score:.2f}, keep searching")
+            return
+
+        self._todo_list.skip([t.id for t in skippable])
+        saved = self._estimate_seconds(skippable)
+        logger.info(
+            f"coverage {score:.2f} >= {self._coverage.threshold}, skipping "
+            f"{[f'{t.id} {t.agent}: {t.task}' for t in skippable]}, "
+            + (f"about {saved:.1f}s saved" if saved is not None else "time saved unknown")
+        )
+        emit(TasksSkipped(ids=[t.id for t in skippable], coverage=score, seconds_saved=saved))
+
+    def _estimate_seconds(self, tasks: list) -> Optional[float]:
+        """
+        Time the tasks would have taken, from the tasks of the same agents
+        that already ran. None without any task to compare with
+        """
+        every = [d for durations in self._durations.values() for d in durations]
+        if not every:
+            return None
+        overall = sum(every) / len(every)
+        total = 0.0
+        for task in tasks:
+            durations = self._durations.get(task.agent)
+            total += sum(durations) / len(durations) if durations else overall
+        return total
 
     def add_model(self, model, description):
         """
@@ -95,7 +336,41 @@ class Planner(Agent):
         for response in obj:
             task = response["task"]
             agent = response["agent"]
-            self._todo_list.add_task(task, agent)
+            self._todo_list.add_task(
+                task, agent, response.get("id"), response.get("depends_on")
+            )
+
+    async def _stream_plan(self, prompt: str):
+        """
+        Fill the todo list while the plan is streamed
+        each task is added as soon as its closing brace arrives
+        """
+        parser = JsonArrayStream()
+        chunks = []
+        try:
+            async for chunk in self._model.acompletion_stream(prompt):
+                chunks.append(chunk)
+                for response in parser.feed(chunk):
+                    if not isinstance(response, dict) or "task" not in response:
+                        continue
+                    logger.info(f"handling task {response}")
+                    self._todo_list.add_task(
+                        response["task"],
+                        response.get("agent"),
+                        response.get("id"),
+                        response.get("depends_on"),
+                    )
+            res = "".join(chunks)
+            logger.info(f"get response {res}")
+            if parser.count == 0:
+                # not an array of tasks, fall back to the full extraction
+                self._response_todo_handler(res)
+            self._todo_list.close()
+            emit(PlanCreated(tasks=self.plan_snapshot()))
+            await self._store_plan()
+        except Exception as e:
+            logger.error(f"planner stream failed: {e}")
+            self._todo_list.close(e)
 
 
 """
@@ -107,20 +382,136 @@ class Planner(Agent):
 class _todo:
     def __init__(self):
         self.todo_list = deque()
+        # a streamed plan is still being written until the list is closed
+        self.closed = True
+        self.error = None
+        self._changed = asyncio.Event()
+        # bumped on every change so waiters can't miss one
+        self.version = 0
+
+        self.added = 0
+        self.tasks = []  # every task added, including the popped ones
+        self._ids = set()
+        self._by_id: dict = {}
+        self._last_id = None
+        self.skipped = set()  # ids of the tasks dropped, see resolve
+
+    def add_task(self, task: str, Agent: Agent, id=None, depends_on=None):
+        """
+        id: task id used by depends_on, defaults to the position in the plan
+        depends_on: ids of the tasks whose data this task needs, defaults to
+            the previous task so a plan without dependencies stays sequential
+        """
+        self.added += 1
+        id = str(self.added) if id in (None, "") else str(id)
+        if id in self._ids:
+            id = f"{id}_{self.added}"
+        if depends_on is None:
+            depends_on = [self._last_id] if self._last_id is not None else []
+        elif not isinstance(depends_on, list):
+            depends_on = [depends_on]
+        self._ids.add(id)
+        self._last_id = id
 
-    def add_task(self, task: str, Agent: Agent):
-        self.todo_list.append(_task(task, Agent))
+        new_task = _task(task, Agent, id, [str(d) for d in depends_on])
+        self._by_id[id] = new_task
+        self.tasks.append(new_task)
+        self.todo_list.append(new_task)
+        self._changed_now()
 
     def pop_task(self):
         if self.len() == 0:
             return None
-        return self.todo_list.popleft()
+        task = self.todo_list.popleft()
+        task.started = time.perf_counter()
+        return task
+
+    def get(self, id):
+        return self._by_id.get(id)
+
+    def skip(self, ids: list):
+        """
+        Drop tasks that don't need to run, the tasks depending on them wait
+        for the dependencies of the skipped tasks instead (see resolve)
+        """
+        ids = set(ids)
+        self.todo_list = deque(t for t in self.todo_list if t.id not in ids)
+        self.skipped |= ids
+        self._changed_now()
+
+    async def next_task(self):
+        """
+        Pop a task, wait for the planner stream if it hasn't written one yet
+        """
+        while self.len() == 0 and not self.closed:
+            self._changed.clear()
+            await self._changed.wait()
+        if self.len() == 0 and self.error is not None:
+            raise self.error
+        return self.pop_task()
+
+    def pop_ready(self, done: set, limit: int = None) -> list:
+        """
+        Pop the tasks whose dependencies are done, in plan order
+        a dependency on an unknown id is ignored once the plan is complete
+        """
+        ready = []
+        for task in self.todo_list:
+            if limit is not None and len(ready) >= limit:
+                break
+            if all(
+                d in done or (self.closed and d not in self._ids)
+                for d in self.resolve(task.depends_on)
+            ):
+                ready.append(task)
+        now = time.perf_counter()
+        for task in ready:
+            self.todo_list.remove(task)
+            task.started = now
+        return ready
+
+    def resolve(self, ids: list, seen: set = None) -> list:
+        """
+        Replace the skipped tasks of ids by their own dependencies, recursively
+        """
+        seen = set() if seen is None else seen
+        resolved = []
+        for id in ids:
+            if id in seen:
+                continue
+            seen.add(id)
+            if id in self.skipped:
+                resolved += self.resolve(self._by_id[id].depends_on, seen)
+            else:
+                resolved.append(id)
+        return resolved
+
+    async def wait_changed(self, version: int):
+        while self.version == version:
+            self._changed.clear()
+            await self._changed.wait()
+
+    def open(self):
+        self.closed = False
+        self.error = None
+
+    def close(self, error: Exception = None):
+        self.closed = True
+        self.error = error
+        self._changed_now()
+
+    def _changed_now(self):
+        self.version += 1
+        self._changed.set()
 
     def len(self):
         return len(self.todo_list)
 
 
 class _task:
-    def __init__(self, task: str, agent: Agent):
+    def __init__(self, task: str, agent: Agent, id: str = "", depends_on=None):
         self.task = task
         self.agent = agent
+        self.id = id
+        self.depends_on = depends_on or []
+        self.started = None  # perf_counter when it was handed to an agent
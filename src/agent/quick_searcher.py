@@ -31,7 +31,7 @@ class Quick_searcher(Agent):
 
         maybe selecte relevant web ?
         """
-        res = self.searcher.search_result(query)
+        res = await self.searcher.asearch(query)
         for ele in res:
             result = {
                 "title": ele["title"],
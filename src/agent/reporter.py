@@ -2,9 +2,9 @@ from .agent import Agent
 from ..prompt.reporter import report_prompt, report_plan, report_task
 
 from ..model import Model
+from .model import DocumentStore
+from ..router.events import emit, SectionWritten
 
-import string
-import secrets
 import json
 
 import time
@@ -14,28 +14,39 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+class _report_state:
+    def __init__(self):
+        self.source = DocumentStore()
+
+
 class Reporter(Agent):
     def __init__(self, model: Model):
         self.model: Model = model
-        self.todo = []
-        self.db = None
 
         self.description = "generateing report"
 
-        self.source = {}
         self.name = "reporter"
 
-        self.length = 4  # the length of uuid
+        self.max_concurrency = 5  # sections written at the same time
 
     def set_name(self, name):
         self.name = name
 
+    def new_state(self):
+        return _report_state()
+
+    @property
+    def source(self) -> DocumentStore:
+        """
+        documents of the report being written
+        """
+        return self.run_state().source
+
     async def run(self, query: str, data=None):
         """
         based on query and data to write a response
         Maybe we plan what to write and write a report style ?
         """
-        self.db = self.data_handler(data=data)
         short_summary = self.data_handler(data)
 
         logger.info(f"short summary {short_summary}")
@@ -50,7 +61,7 @@ class Reporter(Agent):
 
         logger.info(f"handling tasks {tasks}")
 
-        r = self._task_handler(tasks)
+        r = await self._task_handler(tasks)
 
         logger.info(f"response {r}")
 
@@ -61,37 +72,19 @@ class Reporter(Agent):
             print("error handling data")
             return
 
-        short_summaries = []
-        alphabet = string.ascii_letters + string.digits
-
         # Store processed items with IDs for future referencing
-        processed_data = []
-
-        for d in data:
-            rand_id = "".join(secrets.choice(alphabet) for _ in range(self.length))
-
-            col = {
-                "id": rand_id,
-                "url": d.get("url", ""),
-                "title": d.get("title", ""),
-                "summary": d.get("summary", ""),
-                "brief_summary": d.get("brief_summary", ""),
-                "keywords": d.get("keywords", []),
-            }
-            processed_data.append(col)
-
-            if col["summary"] != "":
-                short_summaries.append({"id": rand_id, "short_summary": col["summary"]})
-        self.source = processed_data
-        return short_summaries
+        # documents keep the id given by the store, duplicates are dropped
+        self.run_state().source = DocumentStore.from_data(data)
+        return self.source.summaries()
 
     # Suppose you got a short summary id and want to get the long summary
-    def get_source(self, summary_ids: list[int]) -> list[object]:
-        sources = []
-        for item in self.source:
-            if item["id"] in summary_ids:
-                sources.append(item)
-        return sources
+    def get_source(self, summary_ids: list[str]) -> list[object]:
+        if isinstance(summary_ids, list):
+            rows = self.source.by_ids(summary_ids)
+        else:
+            # the plan may list the ids in one string
+            rows = [row for row in self.source if row.id in str(summary_ids)]
+        return [row.to_dict() for row in rows]
 
     def get_recv_format(self):
         pass
@@ -102,12 +95,12 @@ class Reporter(Agent):
     async def _planner(self, query, db=None):
         print("planning what to write")
         prompt = report_plan(query, db)
-        res = self.model.completion(prompt)
+        res = await self.model.acompletion(prompt)
         return res
 
-    def _task_handler(self, tasks):
-        i = 0
+    async def _task_handler(self, tasks):
         final_report = ""
+        prompts = []
         for task in tasks:
             t = task.get("task", "")
             data = task.get("data", "")
@@ -118,8 +111,24 @@ class Reporter(Agent):
 
             logger.info(f"reading sources ... {source}")
 
-            prompt = report_task(tasks, t, source)
-            res = self.model.completion(prompt)
+            prompts.append(report_task(tasks, t, source))
+
+        def written(i, res):
+            if isinstance(res, Exception):
+                return
+            section = self._extract_response(res)
+            if isinstance(section, dict) and section.get("content"):
+                emit(SectionWritten(index=i, content=section["content"]))
+
+        # sections are independent, write them concurrently
+        responses = await self.model.completion_many(
+            prompts, max_concurrency=self.max_concurrency, on_result=written
+        )
+
+        for res in responses:
+            if isinstance(res, Exception):
+                logger.error(f"failed to write section: {res}")
+                continue
             logger.info(f"geting response {res}")
             res = self._extract_response(res)
 
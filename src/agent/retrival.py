@@ -57,14 +57,22 @@ class RAG_agent(Agent):
 
         result = self.db.query(task , 2)
         logger.info(f"get the result {result}")
-        for i, docs in enumerate(result["documents"]):
+        prompts = []
+        # one query -> result["documents"][0] holds the top k documents
+        for docs, metadata in zip(result["documents"][0], result["metadatas"][0]):
 
             """
                 TODO: refactor use localRAG class 
             """
-            file_path = result["metadatas"][0][i]['file']  # fix: index correctly
-            prompt = retrieval_prompt(docs, file_path)
-            res = self.model.completion(prompt)
+            file_path = metadata['file']
+            prompts.append(retrieval_prompt(docs, file_path))
+
+        # every document is summarised independently
+        responses = await self.model.completion_many(prompts, max_concurrency=4)
+        for res in responses:
+            if isinstance(res, Exception):
+                logger.error(f"failed to summarise document: {res}")
+                continue
             logger.info(f"response from llm: {res}")
             res = self._extract_response(res)
             logger.info(f"getting response {res}")
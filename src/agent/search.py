@@ -5,14 +5,21 @@ from ..prompt.searcher import search_plan
 
 from ..browser.crawl_ai import Crawl
 
+from .model import DocumentStore
+
 from collections import deque
 import json
 
-import time 
-
 import logging 
 logger = logging.getLogger(__name__)
 
+class _search_state:
+    def __init__(self):
+        self.todo = deque()
+        self.url_list = []
+        self.db = DocumentStore()
+
+
 class Search_agent(Agent):
     def __init__(self, model:Model, k: int = 10):
         """
@@ -30,15 +37,29 @@ class Search_agent(Agent):
             "https://scholar.google.com",
         ]
 
-        self.todo = deque()
         self.step = 10
-        self.url_list = []
-        self.db = [] 
         self.name = "searcher"
     
     def set_name(self , name):
         self.name = name
 
+    def new_state(self):
+        return _search_state()
+
+    # todo list, urls to read and pages read belong to the current report
+
+    @property
+    def todo(self) -> deque:
+        return self.run_state().todo
+
+    @property
+    def url_list(self) -> list:
+        return self.run_state().url_list
+
+    @property
+    def db(self) -> DocumentStore:
+        return self.run_state().db
+
     async def run(self, task, data) -> str:
         """
         Search function need to user the brower methods to search relevant contents
@@ -60,14 +81,12 @@ class Search_agent(Agent):
         """
         logger.info("SEARCHER: RUNNING ")
         logger.info(f"{self.todo} testing..")
-        steps =self._plan(task)
+        steps = await self._plan(task)
         tools = {} 
         url_list = []
         cur_task = 0
 
-        cur_db = [] 
-        for d in data:
-            cur_db.append(d["summary_list"])
+        cur_db = DocumentStore.from_data(data).summaries()
         query = task[:]
 
         while cur_task < len(self.todo):
@@ -83,12 +102,13 @@ class Search_agent(Agent):
                 case "page_content":
                     #logger.info(self.url_list)
                     await self._page_content(query)
-                    self.url_list = [] 
+                    self.url_list.clear()
                 case _:
                     logger.info("TOOL NOT FOUND")
             cur_task +=1 
 
-        return {"agent": "planner" , "data":self.db , "task":""}
+        # keep what the other agents found, pages already known are dropped
+        return {"agent": "planner" , "data":DocumentStore.merge([data, self.db]) , "task":""}
 
     def get_send_format(self):
         pass
@@ -96,7 +116,7 @@ class Search_agent(Agent):
     def get_recv_format(self):
         pass
 
-    def _plan(self , task:str , k:int=6):
+    async def _plan(self , task:str , k:int=6):
         """
         Searcher planner
         """
@@ -104,9 +124,8 @@ class Search_agent(Agent):
         logger.info(f"task {task}")
         logger.info(prompt)
 
-        response = self.model.completion(prompt)
+        response = await self.model.acompletion(prompt)
         logger.info(f"searcher response: {response}")
-        time.sleep(3) ## foo foo solution
         todo_list = (self._extract_response(response))
         
         logger.info(todo_list)
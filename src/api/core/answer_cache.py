@@ -0,0 +1,181 @@
+"""
+Semantic answer cache for /stream_completion and /quick
+
+Trending questions are asked again and again with slightly different wording.
+Before running a search and an LLM call we embed the query and look for a
+recent answer to a near identical query. Embeddings barely see numbers and
+names ("who won the 2022 world cup" / "2018"), the numbers and capitalised
+words of both queries must be the same for a hit.
+
+Shared by all users, opt in with config.json:
+    "answer_cache": {"enabled": true, "threshold": 0.92, "ttl": 600, "max_entries": 512}
+"""
+
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from ..core.config import read_config
+from ...utils.embedding import encode
+
+_whitespace = re.compile(r"\s+")
+_token = re.compile(r"\w+(?:[-'.]\w+)*")
+_sentence = re.compile(r"[.?!]\s+")
+# capitalised only because they start a sentence
+_sentence_start = {
+    "what", "who", "whom", "whose", "when", "where", "why", "how", "which", "is", "are",
+    "was", "were", "do", "does", "did", "can", "could", "should", "would", "will", "the",
+    "a", "an", "i", "tell", "show", "give", "list", "explain", "find", "search", "please",
+    "latest", "best", "top", "compare", "summarize", "summarise", "describe", "define",
+}
+
+
+def normalize_query(query: str) -> str:
+    query = query.strip()
+    if query.lower().startswith("search:"):
+        query = query[len("search:"):]
+    return _whitespace.sub(" ", query).strip().lower()
+
+
+def query_anchors(query: str) -> frozenset:
+    """
+    Numbers and capitalised words (names, places ...) of the query
+    """
+    query = query.strip()
+    if query.lower().startswith("search:"):
+        query = query[len("search:"):]
+    anchors = set()
+    for sentence in _sentence.split(query):
+        for i, token in enumerate(_token.findall(sentence)):
+            if any(c.isdigit() for c in token):
+                anchors.add(token)
+            elif token[0].isupper() and not (i == 0 and token.lower() in _sentence_start):
+                anchors.add(token)
+    return frozenset(anchors)
+
+
+class SemanticAnswerCache:
+    """
+    Args:
+        threshold: cosine similarity required for a hit
+        ttl: freshness of an answer in seconds
+        max_entries: bounded size, least recently used entry is evicted
+    """
+
+    def __init__(self, threshold: float = 0.92, ttl: float = 600, max_entries: int = 512):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # (namespace, normalized query) -> {"embedding", "anchors", "answer", "created"}
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = asyncio.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def lookup(self, query: str, namespace: str = "") -> tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Return (answer, embedding). answer is None on a miss, the embedding
+        can be passed to store so the query is only embedded once
+        """
+        key = (namespace, normalize_query(query))
+        anchors = query_anchors(query)
+        now = time.time()
+
+        async with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry["anchors"] == anchors:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["answer"], entry["embedding"]
+
+        embedding = await self._embed(key[1])
+        if embedding is None:
+            self.misses += 1
+            return None, None
+
+        async with self._lock:
+            best_key, best_score = None, -1.0
+            candidates = [
+                (k, e) for k, e in self._entries.items()
+                if k[0] == namespace and e["embedding"] is not None and e["anchors"] == anchors
+            ]
+            if candidates:
+                matrix = np.stack([e["embedding"] for _, e in candidates])
+                scores = matrix @ embedding
+                i = int(np.argmax(scores))
+                best_key, best_score = candidates[i][0], float(scores[i])
+
+            if best_key is not None and best_score >= self.threshold:
+                self._entries.move_to_end(best_key)
+                self.hits += 1
+                return self._entries[best_key]["answer"], embedding
+
+            self.misses += 1
+            return None, embedding
+
+    async def store(self, query: str, answer: str, namespace: str = "", embedding: Optional[np.ndarray] = None):
+        if not answer:
+            return
+        key = (namespace, normalize_query(query))
+        if embedding is None:
+            embedding = await self._embed(key[1])
+
+        async with self._lock:
+            self._entries[key] = {
+                "embedding": embedding,
+                "anchors": query_anchors(query),
+                "answer": answer,
+                "created": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _expire(self, now: float):
+        expired = [k for k, e in self._entries.items() if now - e["created"] > self.ttl]
+        for k in expired:
+            del self._entries[k]
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            embeddings = await asyncio.to_thread(encode, [text])
+        except Exception:
+            return None
+        return None if embeddings is None else embeddings[0]
+
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """Process wide answer cache, None when disabled in config.json"""
+    global _answer_cache
+    if _answer_cache is None:
+        conf = read_config().get("answer_cache", {})
+        if not conf.get("enabled", False):
+            return None
+        _answer_cache = SemanticAnswerCache(
+            threshold=conf.get("threshold", 0.92),
+            ttl=conf.get("ttl", 600),
+            max_entries=conf.get("max_entries", 512),
+        )
+    return _answer_cache
@@ -17,7 +17,7 @@ async def get_or_create_model():
             _config_cache = await asyncio.to_thread(read_config)
         
         # Create cache key
-        cache_key = f"{_config_cache['provider']}_{_config_cache['model']}"
+        cache_key = f"{_config_cache['provider']}_{_config_cache['model']}_{_config_cache.get('providers')}"
         
         # Return cached model if exists
         if cache_key in _model_cache:
@@ -25,20 +25,21 @@ async def get_or_create_model():
         
         # Create new model and cache it
         from ...factory import Factory
-        model = await asyncio.to_thread(Factory.get_model, _config_cache["provider"], _config_cache["model"])
+        model = await asyncio.to_thread(Factory.get_config_model, _config_cache)
         _model_cache[cache_key] = model
         
         return model
 
 async def get_user_model():
-    """Create a dedicated model instance for user session"""
-    model = await get_or_create_model()
+    """
+    Get the model for a user session. Models are stateless and shared, the
+    conversation is passed on every call so there is no need for a fresh
+    instance. Config is read again since the user may switch provider.
+    """
     try:
-        # Create a fresh model instance
         config = await asyncio.to_thread(read_config)
         from ...factory import Factory
-        user_model = await asyncio.to_thread(Factory.get_model, config["provider"], config["model"])
-        return user_model
+        return await asyncio.to_thread(Factory.get_config_model, config)
     except:
         # Fallback: use the cached model
-        return model
+        return await get_or_create_model()
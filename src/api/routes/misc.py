@@ -1,12 +1,17 @@
 from fastapi import APIRouter, Form, File, UploadFile, HTTPException
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
+from contextlib import asynccontextmanager
 import json
 import logging
 from ..models.schemas import Message
 from ..core.config import read_config
+from ..core.answer_cache import get_answer_cache
+from ..core.model_cache import get_user_model
 
-from ...factory import Factory
-from ...generate_report import generate_report
+from ...factory import Factory, get_agent_pool
+from ...generate_report import generate_report, generate_report_stream
+from ...router.events import WorkflowError
 from ...model import Model
 from ...agent import Planner , Agent
 
@@ -70,13 +75,93 @@ async def report(
         logging.error("invalid JSON in messages field")
         return {"error": "Invalid JSON in messages field"}
 
+@router.post("/report_stream/{query}")
+async def report_stream(
+    query: str,
+    messages: str = Form(...),
+    files: Optional[List[UploadFile]] = File(None),
+):
+    """Generate report, progress events are sent as server sent events"""
+    try:
+        json.loads(messages)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON in messages field")
+
+    async def events():
+        error_sent = False
+        try:
+            async with build_workflow() as (planner, agents):
+                async for event in generate_report_stream(query, planner, agents):
+                    error_sent = isinstance(event, WorkflowError)
+                    yield event.sse()
+        except Exception as e:
+            logging.error(f"report stream failed: {e}")
+            if not error_sent:
+                yield WorkflowError(message=str(e)).sse()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/news/{category}")
-def get_news(category: str):
+async def get_news(category: str):
     """Get news - SAME ENDPOINT"""
     from ...browser.duckduckgo import DuckSearch
-    res = DuckSearch().today_new(category)
+    res = await DuckSearch().anews(category)
     return {"news": res}
 
+@router.get("/cache_stats")
+async def get_cache_stats():
+    """Hit / miss counters of the caches"""
+    from ...model import get_completion_cache, limiter_stats, MultiModel
+    from ...browser.extract import get_extractor
+    from ...browser.content_cache import get_content_cache
+    from ...browser.search_cache import get_search_cache
+    from ...browser.fetch_guard import get_fetch_guard
+    from ...agent.plan_cache import get_plan_cache
+    from ...agent.fast_path import get_fast_path
+    answer_cache = get_answer_cache()
+    llm_cache = get_completion_cache()
+    model = await get_user_model()
+    plan_cache = get_plan_cache()
+    fast_path = get_fast_path()
+    content_cache = get_content_cache()
+    search_cache = get_search_cache()
+    fetch_guard = get_fetch_guard()
+    return {
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "llm_cache": llm_cache.stats() if llm_cache else None,
+        "routing": model.latency_stats() if isinstance(model, MultiModel) else None,
+        "rate_limits": limiter_stats(),
+        "agent_pool": get_agent_pool().stats(),
+        "extraction": get_extractor().stats(),
+        "plan_cache": plan_cache.stats() if plan_cache else None,
+        "fast_path": fast_path.stats() if fast_path else None,
+        "content_cache": content_cache.stats() if content_cache else None,
+        "search_cache": search_cache.stats() if search_cache else None,
+        "fetch_guard": fetch_guard.stats() if fetch_guard else None,
+    }
+
+@router.get("/traces")
+async def list_traces():
+    """Recent report traces, newest first"""
+    from ...utils import get_trace_store
+    return {"traces": get_trace_store().list()}
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str, format: str = "chrome"):
+    """A report trace as Chrome trace events (chrome://tracing, perfetto) or JSONL"""
+    from fastapi.responses import PlainTextResponse
+    from ...utils import get_trace_store
+    trace = get_trace_store().get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="unknown trace")
+    if format == "jsonl":
+        return PlainTextResponse(trace.to_jsonl(), media_type="application/x-ndjson")
+    return trace.to_chrome()
+
 @router.get("/messags_record")
 async def get_messages_record():
     """Get messages record - SAME ENDPOINT"""
@@ -90,10 +175,18 @@ async def quick_response_logic(
     api: Optional[str] = None,
 ):
     """Quick response logic - original function"""
+    answer_cache = get_answer_cache() if len(messages) <= 1 else None
+    query_embedding = None
+    if answer_cache is not None:
+        cached, query_embedding = await answer_cache.lookup(query, "quick")
+        if cached is not None:
+            logger.info("answer cache hit")
+            return cached
+    
     config = read_config()
     
-    quick_model: Model = Factory.get_model(config["provider"], config["model"])
-    quick_model.messages = messages[::-1]
+    quick_model: Model = Factory.get_config_model(config)
+    history = messages[::-1]
     
     if files != None:
         pass  # TODO use mark it down to convert to text and append into the data arr
@@ -101,30 +194,52 @@ async def quick_response_logic(
     from ...browser.duckduckgo import DuckSearch
     from ...prompt.quick_search import quick_search_prompt
     
-    search_result = await DuckSearch().search_result(query)
+    search_result = await DuckSearch().asearch(query)
     prompt = quick_search_prompt(query, search_result)
-    res = quick_model.completion(prompt)
+    res = await quick_model.acompletion(prompt, history=history)
+    if answer_cache is not None:
+        await answer_cache.store(query, res, "quick", query_embedding)
     return res
 
-async def main(query, api: str = None):
-    """Main function - original logic"""
+@router.on_event("startup")
+async def warm_agent_pool():
+    """Build the configured agents before the first report request"""
+    try:
+        config = read_config()
+        m = Factory.get_config_model(config)
+        size = config.get("agent_pool", {}).get("warm", 1)
+        await get_agent_pool().warm(config["agents"], m, size)
+    except Exception as e:
+        logging.warning(f"failed to warm the agent pool: {e}")
+
+@router.on_event("shutdown")
+async def close_search_session():
+    """Close the connections kept alive for the searches"""
+    from ...browser.duckduckgo import close_session
+    await close_session()
+
+@asynccontextmanager
+async def build_workflow():
+    """Planner and agents configured in config.json, the agents are borrowed
+    from the pool and given back when the report is done"""
     config = read_config()
     logging.info("finish reading config ...")
     
     
-    m = Factory.get_model(config["provider"], config["model"])
+    m = Factory.get_config_model(config)
     planner = Planner(m)
-    logging.info("creating agents ... ")
-    agents = []
+    logging.info("borrowing agents ... ")
     
-    for agent in config["agents"]:
-        m = Factory.get_model(config["provider"], config["model"])
-        agents.append(Factory.get_agent(agent, m))
-    
-    logging.info(f"finish creating {agents}")
-    logging.info("generating report ... ")
-    
-    r = await generate_report(query, planner, agents)
+    async with get_agent_pool().borrow(config["agents"], m) as agents:
+        logging.info(f"finish borrowing {agents}")
+        yield planner, agents
+
+async def main(query, api: str = None):
+    """Main function - original logic"""
+    async with build_workflow() as (planner, agents):
+        logging.info("generating report ... ")
+        
+        r = await generate_report(query, planner, agents)
     
     logging.info("finish generating report")
     return r
\ No newline at end of file
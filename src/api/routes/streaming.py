@@ -6,6 +6,7 @@ import asyncio
 import logging
 from ..models.schemas import Message
 from ..core.model_cache import get_user_model
+from ..core.answer_cache import get_answer_cache
 from ..core.config import read_config
 from ...prompt.quick_search import quick_search_prompt
 
@@ -28,6 +29,18 @@ async def stream_data(
         
         needs_search = "search:" in query
         
+        # Serve a recent answer to a near identical query right away
+        # only for fresh conversations, otherwise the answer depends on history
+        answer_cache = get_answer_cache() if len(validated_messages) <= 1 else None
+        namespace = "search" if needs_search else "chat"
+        query_embedding = None
+        if answer_cache is not None:
+            cached, query_embedding = await answer_cache.lookup(query, namespace)
+            if cached is not None:
+                logger.info(f"[{session_id}] answer cache hit")
+                yield cached
+                return
+        
         # Get user model
         model_task = asyncio.create_task(get_user_model())
         
@@ -36,7 +49,7 @@ async def stream_data(
             async def search_pipeline():
                 from ...browser.duckduckgo import DuckSearch
                 search_instance = DuckSearch()
-                return await asyncio.to_thread(search_instance.search_result, query)
+                return await search_instance.asearch(query)
             
             search_task = asyncio.create_task(search_pipeline())
             model, search_result = await asyncio.gather(model_task, search_task)
@@ -48,28 +61,31 @@ async def stream_data(
         
         # Configure model
         user_messages = [] if len(validated_messages) == 1 else validated_messages[:-1].copy()
-        model.messages = user_messages
         
         logger.info(f"[{session_id}] Finished creating model")
         logger.info(f"[{session_id}] Finished Prompt preparation, starting completion stream")
         
         # Stream completion
-        completion_stream = model.completion_stream(prompt)
+        completion_stream = model.acompletion_stream(prompt, history=user_messages)
         chunk_count = 0
         seen_content = set()
+        answer = []
         
-        for chunk in completion_stream:
+        async for chunk in completion_stream:
             if chunk and chunk.strip():
                 chunk_hash = hash(chunk.strip())
                 if chunk_hash not in seen_content:
                     seen_content.add(chunk_hash)
                     chunk_count += 1
+                    answer.append(chunk)
                     yield chunk
                     await asyncio.sleep(0)
         
         if chunk_count == 0:
             logger.warning(f"[{session_id}] No chunks received from model")
             yield "No response generated"
+        elif answer_cache is not None:
+            await answer_cache.store(query, "".join(answer), namespace, query_embedding)
         
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON in messages field")
@@ -103,16 +119,16 @@ async def stream_academic_data(
         validated_messages = [Message(**msg) for msg in messages_list]
         
         model = await get_user_model()
-        model.messages = validated_messages[:-1] if len(validated_messages) != 1 else []
+        history = validated_messages[:-1] if len(validated_messages) != 1 else []
         
         # Search arXiv
         from ...browser.duckduckgo import DuckSearch
         from ...prompt.quick_search import quick_search_prompt
         
-        search_result = await DuckSearch().search_result("site:arxiv.org" + query)
+        search_result = await DuckSearch().asearch("site:arxiv.org" + query)
         prompt = quick_search_prompt(query, search_result)
         
-        for chunk in model.completion_stream(prompt):
+        async for chunk in model.acompletion_stream(prompt, history=history):
             yield chunk
             await asyncio.sleep(0)
             
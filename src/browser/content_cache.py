@@ -0,0 +1,236 @@
+"""
+Content cache of fetched pages
+
+The same popular pages come back in the results of many searches. Their
+extracted text is cached process wide by canonical url (utils/url.py, the
+same key as the documents of a workflow), in memory first then on disk so
+it survives restarts.
+
+A page is fresh for the ttl of its content class:
+    news: news sites and dated articles, they change during the day
+    reference: encyclopedias, docs, papers, they rarely change
+    default: anything else
+Once stale, a page with an ETag or Last-Modified is revalidated with a
+conditional GET, a 304 refreshes the entry without downloading the page
+again. Stale entries are kept on disk for keep seconds for that, the disk
+tier is bounded by bytes, least recently used pages are evicted.
+
+Configured in config.json:
+    "content_cache": {
+        "enabled": true,
+        "path": "./tmp/content_cache.db",
+        "ttl": {"news": 1800, "reference": 604800, "default": 86400},
+        "keep": 604800,
+        "max_entries": 1024,
+        "max_bytes": 67108864
+    }
+"""
+
+from ..utils import read_config, LRUCache, DiskCache, canonical_url
+
+from typing import Optional
+from urllib.parse import urlsplit
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+TTL = {"news": 30 * 60, "reference": 7 * 24 * 60 * 60, "default": 24 * 60 * 60}
+
+_news = re.compile(
+    r"(^|\.)(news|reuters|apnews|bloomberg|cnn|bbc|nytimes|theguardian|washingtonpost|wsj|"
+    r"cnbc|foxnews|aljazeera|techcrunch|theverge)\.|/(news|live|breaking)/|/20\d\d/\d\d?/",
+    re.IGNORECASE,
+)
+_reference = re.compile(
+    r"(^|\.)(wikipedia\.org|wikimedia\.org|arxiv\.org|britannica\.com|docs\.python\.org|"
+    r"developer\.mozilla\.org|readthedocs\.io|stackoverflow\.com|github\.com)/|^docs\.|\.pdf$",
+    re.IGNORECASE,
+)
+
+
+def content_class(url: str) -> str:
+    parts = urlsplit(url)
+    target = f"{parts.hostname or ''}/{parts.path.lstrip('/')}"
+    if _reference.search(target):
+        return "reference"
+    if _news.search(target):
+        return "news"
+    return "default"
+
+
+class ContentCache:
+    """
+    Two tier cache of page texts with HTTP revalidation
+    Args:
+        path: sqlite path of the disk tier, None to keep memory only
+        ttl: content class -> seconds a page is fresh
+        keep: seconds a stale page is kept to be revalidated
+        max_entries: size of the in memory LRU tier
+        max_bytes: size of the disk tier
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = "./tmp/content_cache.db",
+        ttl: Optional[dict] = None,
+        keep: float = 7 * 24 * 60 * 60,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.ttl = {**TTL, **(ttl or {})}
+        self.keep = keep
+        self.memory = LRUCache(max_entries=max_entries, ttl=keep)
+        self.disk = DiskCache(path, max_bytes=max_bytes, ttl=keep) if path else None
+        self._lock = threading.Lock()
+
+        self.fresh = 0
+        self.stale = 0
+        self.misses = 0
+        self.revalidated = 0  # 304, the cached text was still good
+        self.refreshed = 0  # stale entry replaced by a new download
+
+    async def lookup(self, url: str) -> Optional[dict]:
+        """
+        Entry of the url: {"url", "text", "etag", "last_modified", "fetched",
+        "fresh_until"}, None when the page was never cached. Check fresh_entry()
+        before using it, a stale entry only gives the validators
+        """
+        key = _key(url)
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            raw = await asyncio.to_thread(self.disk.get, key)
+            if raw is not None:
+                entry = json.loads(raw)
+                self.memory.set(key, entry)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            elif self.fresh_entry(entry):
+                self.fresh += 1
+            else:
+                self.stale += 1
+        return entry
+
+    @staticmethod
+    def fresh_entry(entry: dict) -> bool:
+        return entry["fresh_until"] > time.time()
+
+    @staticmethod
+    def conditional_headers(entry: Optional[dict]) -> dict:
+        """
+        Headers of a conditional GET revalidating the entry
+        """
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    async def store(self, url: str, text: str, headers=None, stale: bool = False):
+        """
+        Cache the text of a page downloaded again or for the first time
+        headers: response headers, for the validators and Cache-Control
+        """
+        headers = headers or {}
+        if "no-store" in (headers.get("Cache-Control") or "").lower():
+            return
+        now = time.time()
+        entry = {
+            "url": url,
+            "text": text,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched": now,
+            "fresh_until": now + self.ttl[content_class(url)],
+        }
+        if stale:
+            with self._lock:
+                self.refreshed += 1
+        await self._save(entry)
+
+    async def refresh(self, entry: dict, headers=None) -> dict:
+        """
+        The server answered 304, the entry is fresh again
+        """
+        headers = headers or {}
+        entry = dict(entry)
+        entry["fresh_until"] = time.time() + self.ttl[content_class(entry["url"])]
+        entry["etag"] = headers.get("ETag") or entry.get("etag")
+        entry["last_modified"] = headers.get("Last-Modified") or entry.get("last_modified")
+        with self._lock:
+            self.revalidated += 1
+        await self._save(entry)
+        return entry
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.fresh + self.stale + self.misses
+            counters = {
+                "fresh": self.fresh,
+                "stale": self.stale,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "refreshed": self.refreshed,
+                # a revalidated page is a hit, no download
+                "hit_rate": (self.fresh + self.revalidated) / total if total else 0.0,
+            }
+        return {
+            **counters,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+    async def _save(self, entry: dict):
+        key = _key(entry["url"])
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            raw = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+            await asyncio.to_thread(self.disk.set, key, raw)
+
+
+def _key(url: str) -> str:
+    return hashlib.sha256(canonical_url(url).encode("utf-8")).hexdigest()
+
+
+_cache: Optional[ContentCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_content_cache() -> Optional[ContentCache]:
+    """
+    Return the process wide content cache, None when disabled in config.json
+    """
+    global _cache
+    if _cache is not None:
+        return _cache
+    try:
+        conf = dict(read_config().get("content_cache", {}))
+    except Exception:
+        conf = {}
+    if not conf.pop("enabled", True):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = ContentCache(**conf)
+            except Exception as e:
+                # no writable disk, keep the pages in memory
+                logger.warning(f"content cache on disk unavailable, memory only: {e}")
+                conf["path"] = None
+                _cache = ContentCache(**conf)
+    return _cache
@@ -16,6 +16,19 @@ import os
 
 from ..model import Model
 from ..RAG.summary import Summary
+from ..utils.tracing import span
+
+
+def _result_attributes(results) -> dict:
+    """
+    Bytes fetched and pages crawled of crawl4ai results, for the trace
+    """
+    results = [r for r in results or [] if r is not None]
+    return {
+        "pages": len(results),
+        "failed": sum(1 for r in results if not getattr(r, "success", True)),
+        "bytes": sum(len(getattr(r, "html", None) or "") for r in results),
+    }
 
 
 class Crawl:
@@ -57,6 +70,18 @@ class Crawl:
     async def close_crawler(self):
         await self.crawler.close()
 
+    async def _arun(self, url):
+        with span("crawl", url=url) as s:
+            result = await self.crawler.arun(url=url, config=self.run_conf)
+            s.set(**_result_attributes([result]))
+            return result
+
+    async def _arun_many(self, urls: list):
+        with span("crawl.many", urls=len(urls)) as s:
+            result = await self.crawler.arun_many(urls=urls, config=self.run_conf)
+            s.set(**_result_attributes(result))
+            return result
+
     # problem: still so slow --> for example searching takes 124.12s for arxiv website
     # TODO: concurrent process other state first ?
     async def get_url_llm(self, url, query):
@@ -96,7 +121,7 @@ class Crawl:
         self.crawler = AsyncWebCrawler(config=self.broswer_conf)
         await self.start_crawler()
 
-        result = await self.crawler.arun(url=url, config=self.run_conf)
+        result = await self._arun(url)
         await self.close_crawler()
         self.url_list = json.loads(result.extracted_content)
 
@@ -112,7 +137,7 @@ class Crawl:
         md = MarkItDown()
         result = md.convert(p)
         s = Summary(self.model)
-        r = s.summary(result.markdown)
+        r = await s.summary(result.markdown)
         del s
         return r
 
@@ -176,10 +201,7 @@ class Crawl:
         self.crawler = AsyncWebCrawler(config=self.broswer_conf)
         await self.start_crawler()
 
-        result = await self.crawler.arun_many(
-            urls=url,
-            config=self.run_conf,
-        )
+        result = await self._arun_many(url)
         await self.close_crawler()
 
         for ele in result:
@@ -230,7 +252,7 @@ class Crawl:
         self.crawler = AsyncWebCrawler(config=self.browser_conf)
         await self.start_crawler()
 
-        result = await self.crawler.arun(url=url, config=self.run_conf)
+        result = await self._arun(url)
         await self.close_crawler()
 
         # Parse the JSON extracted content into TableData model
@@ -249,7 +271,7 @@ class Crawl:
         self.crawler = AsyncWebCrawler(config=self.broswer_conf)
         await self.start_crawler()
 
-        result = await self.crawler.arun(url=url, config=self.run_conf)
+        result = await self._arun(url)
 
         if result.screenshot:
             from base64 import b64decode
@@ -1,52 +1,136 @@
 import asyncio
 import aiohttp
-from html import unescape
 from langchain_community.tools import DuckDuckGoSearchResults
 import logging
 from typing import List, Dict, Optional
 import time
+import threading
+import weakref
 from functools import lru_cache
 import re
-from urllib.parse import urlparse
-from selectolax.parser import HTMLParser
+from urllib.parse import urlparse, parse_qs, urljoin
 import os
 
+from selectolax.parser import HTMLParser
+
+from ..utils.tracing import span
+from .extract import get_extractor
+from .content_cache import get_content_cache
+from .search_cache import get_search_cache
+from .fetch_guard import get_fetch_guard
+
 logger = logging.getLogger(__name__)
 
+SEARCH_URL = "https://html.duckduckgo.com/html/"
+
+# Ultra-aggressive timeouts for 1.5s total requirement
+_timeout = aiohttp.ClientTimeout(
+    total=0.4,      # Max 400ms per request
+    connect=0.1,    # 100ms to connect
+    sock_read=0.3   # 300ms to read
+)
+# the search itself gets the whole budget
+_search_timeout = aiohttp.ClientTimeout(total=1.5, connect=0.5)
+
+# Optimized connector settings
+_connector_config = {
+    'limit': 50,
+    'limit_per_host': 20,
+    'ttl_dns_cache': 300,
+    'use_dns_cache': True,
+    'keepalive_timeout': 30,
+    'enable_cleanup_closed': True,
+}
+
+_headers = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36",
+    "Accept": "text/html,*/*;q=0.8",
+}
+
+# a session is bound to its event loop, one per loop (the server has one)
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+_sessions_lock = threading.Lock()
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Long lived session of the running event loop, connections and DNS
+    lookups are reused by every search
+    """
+    loop = asyncio.get_running_loop()
+    with _sessions_lock:
+        session = _sessions.get(loop)
+        if session is None or session.closed:
+            session = _sessions[loop] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(**_connector_config),
+                timeout=_timeout,
+                headers=_headers,
+            )
+        return session
+
+
+async def close_session():
+    """
+    Close the session of the running event loop
+    """
+    with _sessions_lock:
+        session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def parse_results(html: str, k: int) -> List[Dict]:
+    """
+    Results of the html page of DuckDuckGo, same keys as the langchain tool
+    """
+    results = []
+    tree = HTMLParser(html)
+    for node in tree.css("div.result"):
+        if "result--ad" in (node.attributes.get("class") or ""):
+            continue
+        title = node.css_first("a.result__a")
+        if title is None:
+            continue
+        link = _result_link(title.attributes.get("href") or "")
+        if not link:
+            continue
+        snippet = node.css_first(".result__snippet")
+        results.append({
+            "title": title.text(strip=False).strip(),
+            "link": link,
+            "snippet": snippet.text(strip=False).strip() if snippet is not None else "",
+        })
+        if len(results) >= k:
+            break
+    return results
+
+
+def _result_link(href: str) -> str:
+    # links go through the redirect of DuckDuckGo: //duckduckgo.com/l/?uddg=<url>
+    href = urljoin("https://duckduckgo.com", href)
+    parsed = urlparse(href)
+    if parsed.netloc.endswith("duckduckgo.com"):
+        if parsed.path != "/l/":
+            return ""  # ads and internal links
+        return parse_qs(parsed.query).get("uddg", [""])[0]
+    return href
+
+
 class DuckSearch:
     def __init__(self):
-        self.search_engine = DuckDuckGoSearchResults(
-            backend="text", output_format="list"
-        )
-        self.news_engine = DuckDuckGoSearchResults(
-            backend="news", output_format="list", num_results=8
-        )
-        
-        # Ultra-aggressive timeouts for 1.5s total requirement
-        self._timeout = aiohttp.ClientTimeout(
-            total=0.4,      # Max 400ms per request
-            connect=0.1,    # 100ms to connect
-            sock_read=0.3   # 300ms to read
-        )
-        
-        # Optimized connector settings
-        self._connector_config = {
-            'limit': 50,
-            'limit_per_host': 20,
-            'ttl_dns_cache': 300,
-            'use_dns_cache': True,
-            'keepalive_timeout': 30,
-            'enable_cleanup_closed': True,
-        }
-        
-        # Simple caches
-        self._failed_urls = set()
-        self._content_cache = {}
-        
-        # Regex patterns
-        self._text_cleanup = re.compile(r'\s+')
-        self._html_tags = re.compile(r'<[^>]+>')
+        # pages, search results and failed fetches are kept process wide, see
+        # content_cache.py, search_cache.py and fetch_guard.py
+        self._news_engine = None
         
+    @property
+    def news_engine(self):
+        """The langchain tool is only needed for the news."""
+        if self._news_engine is None:
+            self._news_engine = DuckDuckGoSearchResults(
+                backend="news", output_format="list", num_results=8
+            )
+        return self._news_engine
+
     @lru_cache(maxsize=1000)
     def _is_valid_url(self, url: str) -> bool:
         """Fast URL validation."""
@@ -58,137 +142,162 @@ class DuckSearch:
 
     async def _extract_content_fast(self, session: aiohttp.ClientSession, url: str) -> str:
         """Ultra-fast content extraction - fail fast, succeed faster."""
-        if not url or url in self._failed_urls or not self._is_valid_url(url):
-            return ""
+        with span("fetch", url=url) as s:
+            if not url or not self._is_valid_url(url):
+                s.set(skipped=True)
+                return ""
         
-        if url in self._content_cache:
-            return self._content_cache[url]
+            cache = get_content_cache()
+            entry = await cache.lookup(url) if cache is not None else None
+            if entry is not None and cache.fresh_entry(entry):
+                s.set(cache_hit=True)
+                return entry["text"]
+            s.set(cache_hit=False, stale=entry is not None)
         
-        try:
-            async with session.get(url, allow_redirects=True, max_redirects=2) as response:
-                if response.status != 200:
-                    self._failed_urls.add(url)
-                    return ""
-                
-                # Read only first 20KB - enough for most articles
-                content_bytes = await response.content.read(20480)
-                content_str = content_bytes.decode('utf-8', errors='ignore')
-                
-                # Fast text extraction using selectolax
+            # failed recently or its domain is down
+            guard = get_fetch_guard()
+            skipped = guard.allow(url) if guard is not None else None
+            if skipped is not None:
+                s.set(skipped=skipped)
+                return entry["text"] if entry is not None else ""
+        
+            # only the request counts as a failure of the page or its domain,
+            # a local fault (extraction, cache) doesn't
+            try:
+                # a stale page is revalidated, 304 when it didn't change
+                headers = cache.conditional_headers(entry) if cache is not None else {}
+                async with session.get(url, headers=headers, allow_redirects=True, max_redirects=2) as response:
+                    status = response.status
+                    response_headers = response.headers
+                    # Read only first 20KB - enough for most articles
+                    content_bytes = await response.content.read(20480) if status == 200 else b""
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+                s.set(error=error)
+                if guard is not None:
+                    guard.failure(url, error, error=True)
+                if entry is not None:
+                    # the stale text is better than nothing
+                    logger.debug(f"Revalidation failed for {url}, using the cached page: {e}")
+                    return entry["text"]
+                logger.debug(f"Content extraction failed for {url}: {e}")
+                return ""
+        
+            s.set(status=status)
+            if status == 304 and entry is not None:
+                if guard is not None:
+                    guard.success(url)
                 try:
-                    tree = HTMLParser(content_str)
-                    paragraphs = tree.css('p')[:15]  # Only first 15 paragraphs
-                    
-                    texts = []
-                    for node in paragraphs:
-                        text = node.text(strip=True)
-                        if text and len(text) > 20:
-                            texts.append(text)
-                            # Stop early if we have enough content
-                            if len(' '.join(texts)) > 200:
-                                break
-                except:
-                    # Fallback: simple regex
-                    matches = re.findall(r'<p[^>]*>(.*?)</p>', content_str, re.IGNORECASE | re.DOTALL)[:10]
-                    texts = []
-                    for match in matches:
-                        text = self._html_tags.sub('', match).strip()
-                        if text and len(text) > 20:
-                            texts.append(text)
-                            if len(' '.join(texts)) > 200:
-                                break
-                
-                if not texts:
-                    self._failed_urls.add(url)
-                    return ""
-                
-                final_text = self._text_cleanup.sub(' ', unescape(' '.join(texts))).strip()[:300]
-                
-                # Simple cache management
-                if len(self._content_cache) > 100:
-                    # Remove oldest 20 entries
-                    old_keys = list(self._content_cache.keys())[:20]
-                    for key in old_keys:
-                        del self._content_cache[key]
-                
-                self._content_cache[url] = final_text
-                return final_text
-                
-        except Exception as e:
-            self._failed_urls.add(url)
-            logger.debug(f"Content extraction failed for {url}: {e}")
-            return ""
+                    entry = await cache.refresh(entry, response_headers)
+                except Exception as e:
+                    logger.warning(f"content cache failed for {url}: {e}")
+                return entry["text"]
+            if status != 200:
+                if guard is not None:
+                    guard.failure(
+                        url, f"status {status}",
+                        domain_failure=status in (403, 429) or status >= 500,
+                    )
+                return ""
+        
+            s.set(bytes=len(content_bytes))
+            try:
+                # parsing is CPU bound, large pages are parsed in the process pool
+                final_text = await get_extractor().extract(content_bytes)
+            except Exception as e:
+                s.set(error=str(e) or type(e).__name__)
+                logger.warning(f"Content extraction failed for {url}: {e}")
+                return entry["text"] if entry is not None else ""
+            if guard is not None:
+                if final_text:
+                    guard.success(url)
+                else:
+                    guard.failure(url, "no text")
+            if not final_text:
+                return ""
+        
+            if cache is not None:
+                try:
+                    await cache.store(url, final_text, response_headers, stale=entry is not None)
+                except Exception as e:
+                    logger.warning(f"content cache failed for {url}: {e}")
+            return final_text
 
     async def _process_results_fast(self, results: List[Dict], k: int) -> List[Dict]:
         """Process search results with content extraction - ultra fast or fail."""
         if not results:
             return []
         
-        connector = aiohttp.TCPConnector(**self._connector_config)
+        session = get_session()
+        
+        # Limit concurrent requests for speed
+        semaphore = asyncio.Semaphore(min(k * 2, 20))
+        
+        async def process_single(result):
+            async with semaphore:
+                url = result.get("link", "")
+                content = await self._extract_content_fast(session, url)
+                result["full_content"] = content
+                return result
+        
+        # Process only the URLs we need
+        tasks = [process_single(result) for result in results[:k]]
         
+        # Race against time - 1.2s max for content extraction
         try:
-            async with aiohttp.ClientSession(
-                connector=connector,
-                timeout=self._timeout,
-                headers={
-                    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36",
-                    "Accept": "text/html,*/*;q=0.8",
-                },
-            ) as session:
-                
-                # Limit concurrent requests for speed
-                semaphore = asyncio.Semaphore(min(k * 2, 20))
-                
-                async def process_single(result):
-                    async with semaphore:
-                        url = result.get("link", "")
-                        content = await self._extract_content_fast(session, url)
-                        result["full_content"] = content
-                        return result
-                
-                # Process only the URLs we need
-                tasks = [process_single(result) for result in results[:k]]
-                
-                # Race against time - 1.2s max for content extraction
-                try:
-                    completed_results = await asyncio.wait_for(
-                        asyncio.gather(*tasks, return_exceptions=True),
-                        timeout=1.2
-                    )
-                    
-                    final_results = []
-                    for i, result_or_exc in enumerate(completed_results):
-                        if isinstance(result_or_exc, Exception):
-                            # On any error, set empty content but keep the result
-                            results[i]["full_content"] = ""
-                            final_results.append(results[i])
-                        else:
-                            final_results.append(result_or_exc)
-                    
-                    return final_results
-                    
-                except asyncio.TimeoutError:
-                    logger.debug("Content extraction timed out - returning results without content")
-                    # If we timeout, return results with empty content
-                    for result in results[:k]:
-                        result["full_content"] = ""
-                    return results[:k]
-                    
-        except Exception as e:
-            logger.error(f"Session creation failed: {e}")
-            # Return empty list on session creation failure
-            return []
-        finally:
-            await connector.close()
+            completed_results = await asyncio.wait_for(
+                asyncio.gather(*tasks, return_exceptions=True),
+                timeout=1.2
+            )
+            
+            final_results = []
+            for i, result_or_exc in enumerate(completed_results):
+                if isinstance(result_or_exc, Exception):
+                    # On any error, set empty content but keep the result
+                    results[i]["full_content"] = ""
+                    final_results.append(results[i])
+                else:
+                    final_results.append(result_or_exc)
+            
+            return final_results
+            
+        except asyncio.TimeoutError:
+            logger.debug("Content extraction timed out - returning results without content")
+            # If we timeout, return results with empty content
+            for result in results[:k]:
+                result["full_content"] = ""
+            return results[:k]
 
-    def search_result(self, query: str, k: int = 6, backend: str = "text", deep_search: bool = True) -> List[Dict]:
+    async def _query(self, query: str, k: int) -> List[Dict]:
+        """Results of DuckDuckGo's html page, no content."""
+        with span("search", engine="duckduckgo", query=query) as s:
+            async with get_session().post(
+                SEARCH_URL, data={"q": query, "b": ""}, timeout=_search_timeout
+            ) as response:
+                s.set(status=response.status)
+                # 202 is the bot check page
+                if response.status != 200:
+                    raise RuntimeError(f"DuckDuckGo answered {response.status}")
+                html = await response.text()
+            results = parse_results(html, k)
+            s.set(results=len(results))
+            return results
+
+    async def _results(self, query: str, k: int) -> List[Dict]:
+        """Result list of the query, from the search cache when it has it."""
+        cache = get_search_cache()
+        if cache is None:
+            return await self._query(query, k)
+        return await cache.get(query, "text", k, lambda: self._query(query, k))
+
+    async def asearch(self, query: str, k: int = 6, backend: str = "text", deep_search: bool = True) -> List[Dict]:
         """Super efficient search - 1.5s max total time or return empty list."""
         start_time = time.time()
         logger.info(f"Starting efficient search for: '{query}'")
         
         try:
             # Get initial results - should be fast
-            results = self.search_engine.invoke(query, max_results=k)
+            results = await self._results(query, k)
             
             if not results:
                 logger.info(f"No results found for: '{query}'")
@@ -209,26 +318,17 @@ class DuckSearch:
             
             # Deep search with remaining time budget
             try:
-                # Run async content extraction
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    final_results = loop.run_until_complete(
-                        self._process_results_fast(results, k)
-                    )
-                    
-                    total_time = time.time() - start_time
-                    logger.info(f"Search completed in {total_time:.3f}s")
-                    
-                    # Final time check - if we exceeded 1.5s, we failed
-                    if total_time > 1.5:
-                        logger.warning(f"Search exceeded 1.5s limit ({total_time:.3f}s) - returning empty")
-                        return []
-                    
-                    return final_results if final_results else []
-                    
-                finally:
-                    loop.close()
+                final_results = await self._process_results_fast(results, k)
+                
+                total_time = time.time() - start_time
+                logger.info(f"Search completed in {total_time:.3f}s")
+                
+                # Final time check - if we exceeded 1.5s, we failed
+                if total_time > 1.5:
+                    logger.warning(f"Search exceeded 1.5s limit ({total_time:.3f}s) - returning empty")
+                    return []
+                
+                return final_results if final_results else []
                     
             except Exception as e:
                 logger.error(f"Deep search failed: {e}")
@@ -238,7 +338,17 @@ class DuckSearch:
             logger.error(f"Search failed for '{query}': {e}")
             return []  # Return empty on any search failure
 
-    def today_new(self, category: str) -> List[Dict]:
+    def search_result(self, query: str, k: int = 6, backend: str = "text", deep_search: bool = True) -> List[Dict]:
+        """Sync version of asearch, for callers without an event loop."""
+        async def run():
+            try:
+                return await self.asearch(query, k, backend, deep_search)
+            finally:
+                await close_session()
+
+        return asyncio.run(run())
+
+    async def anews(self, category: str) -> List[Dict]:
         """Fast news retrieval."""
         category_queries = {
             "technology": "latest tech AI news",
@@ -250,14 +360,21 @@ class DuckSearch:
         }
         
         query = category_queries.get(category, "latest news")
+        search = lambda: asyncio.to_thread(self.news_engine.invoke, query)
+        cache = get_search_cache()
         try:
-            return self.news_engine.invoke(query)
+            if cache is None:
+                return await search()
+            return await cache.get(query, "news", 8, search)
         except Exception as e:
             logger.error(f"News search failed for '{category}': {e}")
             return []
 
+    def today_new(self, category: str) -> List[Dict]:
+        """Sync version of anews, for callers without an event loop."""
+        return asyncio.run(self.anews(category))
+
     def clear_cache(self):
-        """Clear caches."""
-        self._content_cache.clear()
-        self._failed_urls.clear()
+        """Clear caches of this instance, the content and search caches and the
+        failed fetches are process wide."""
         self._is_valid_url.cache_clear()
\ No newline at end of file
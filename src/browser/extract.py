@@ -0,0 +1,222 @@
+"""
+Text extraction of fetched pages
+
+Parsing html is CPU bound, done on the event loop it delays every other
+coroutine of the server. HtmlExtractor runs the extraction of large pages
+in a process pool, the pages waiting at the same time are sent to a worker
+in one batch so the IPC cost is paid once per batch. Small pages are cheaper
+to parse than to send to another process, they are extracted inline.
+test/benchmark_html_extraction.py shows where the crossover is.
+
+Configured in config.json:
+    "extraction": {"processes": 2, "inline_bytes": 8192, "batch_size": 8, "batch_wait": 0.005}
+        processes: workers of the pool, 0 to always extract inline
+        inline_bytes: pages smaller than this are extracted inline
+        batch_size: pages sent to a worker at once
+        batch_wait: seconds a page waits for others to fill its batch
+"""
+
+from ..utils import read_config
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from html import unescape
+from typing import Optional
+
+import asyncio
+import multiprocessing
+import re
+import threading
+import logging
+
+from selectolax.parser import HTMLParser
+
+logger = logging.getLogger(__name__)
+
+_text_cleanup = re.compile(r"\s+")
+_html_tags = re.compile(r"<[^>]+>")
+_paragraphs = re.compile(r"<p[^>]*>(.*?)</p>", re.IGNORECASE | re.DOTALL)
+
+
+def extract_text(
+    content: bytes, max_paragraphs: int = 15, min_length: int = 20, max_chars: int = 300
+) -> str:
+    """
+    Clean text of the first paragraphs of a page, "" when there is none
+    Runs in the worker processes, it must stay a module level function
+    """
+    content_str = content.decode("utf-8", errors="ignore")
+    texts = []
+    try:
+        # Fast text extraction using selectolax
+        tree = HTMLParser(content_str)
+        for node in tree.css("p")[:max_paragraphs]:
+            text = node.text(strip=True)
+            if text and len(text) > min_length:
+                texts.append(text)
+                # Stop early if we have enough content
+                if len(" ".join(texts)) > max_chars - 100:
+                    break
+    except Exception:
+        # Fallback: simple regex
+        texts = []
+        for match in _paragraphs.findall(content_str)[:10]:
+            text = _html_tags.sub("", match).strip()
+            if text and len(text) > min_length:
+                texts.append(text)
+                if len(" ".join(texts)) > max_chars - 100:
+                    break
+
+    if not texts:
+        return ""
+    return _text_cleanup.sub(" ", unescape(" ".join(texts))).strip()[:max_chars]
+
+
+def extract_batch(contents: list[bytes]) -> list[str]:
+    return [extract_text(content) for content in contents]
+
+
+class _Batch:
+    def __init__(self):
+        self.contents: list[bytes] = []
+        self.futures: list[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class HtmlExtractor:
+    def __init__(
+        self,
+        processes: int = 2,
+        inline_bytes: int = 8 * 1024,
+        batch_size: int = 8,
+        batch_wait: float = 0.005,
+    ):
+        self.processes = processes
+        self.inline_bytes = inline_bytes
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._batches: dict = {}  # event loop -> batch being filled
+        self._lock = threading.Lock()
+
+        self.inline = 0
+        self.offloaded = 0
+        self.batches = 0
+
+    async def extract(self, content: bytes) -> str:
+        """
+        Clean text of a page, large pages are extracted in the process pool
+        """
+        if self.processes <= 0 or len(content) < self.inline_bytes:
+            self.inline += 1
+            return extract_text(content)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            self.offloaded += 1
+            batch = self._batches.get(loop)
+            if batch is None:
+                batch = self._batches[loop] = _Batch()
+                batch.timer = loop.call_later(self.batch_wait, self._flush, loop)
+            batch.contents.append(content)
+            batch.futures.append(future)
+            full = len(batch.contents) >= self.batch_size
+        if full:
+            self._flush(loop)
+        return await future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop):
+        with self._lock:
+            batch = self._batches.pop(loop, None)
+            if batch is None:
+                return
+            self.batches += 1
+        batch.timer.cancel()
+        try:
+            done = loop.run_in_executor(self._get_pool(), extract_batch, batch.contents)
+        except Exception as e:
+            # the pool is broken or shut down, don't leave the callers waiting
+            logger.warning(f"process pool unavailable, extracting inline: {e}")
+            self.shutdown()
+            done = loop.create_future()
+            done.set_result(extract_batch(batch.contents))
+        done.add_done_callback(lambda f: self._done(batch, f))
+
+    def _done(self, batch: _Batch, done: asyncio.Future):
+        if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+            # a worker died or could not start, the next batch gets a new pool
+            logger.warning(f"process pool broken, extracting inline: {done.exception()}")
+            self.shutdown()
+            for content, future in zip(batch.contents, batch.futures):
+                if not future.done():
+                    future.set_result(extract_text(content))
+            return
+        _resolve(batch.futures, done)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=_mp_context())
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "inline": self.inline,
+            "offloaded": self.offloaded,
+            "batches": self.batches,
+            "processes": self.processes,
+            "inline_bytes": self.inline_bytes,
+        }
+
+
+def _mp_context():
+    """
+    Forking the server (threads, torch) can deadlock a worker, workers are
+    started by a forkserver, or spawned where there is none
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _resolve(futures: list, done: asyncio.Future):
+    if done.cancelled():
+        for future in futures:
+            future.cancel()
+        return
+    error = done.exception()
+    for i, future in enumerate(futures):
+        if future.done():
+            continue
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(done.result()[i])
+
+
+_extractor: Optional[HtmlExtractor] = None
+_extractor_lock = threading.Lock()
+
+
+def get_extractor() -> HtmlExtractor:
+    """
+    Return the process wide extractor
+    """
+    global _extractor
+    if _extractor is not None:
+        return _extractor
+    try:
+        conf = read_config().get("extraction", {})
+    except Exception:
+        conf = {}
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = HtmlExtractor(**conf)
+    return _extractor
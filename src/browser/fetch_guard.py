@@ -0,0 +1,194 @@
+"""
+Failed fetches of pages
+
+Pages that failed are not fetched again for a while, a timeout is often
+transient so it is forgotten sooner than a 404 or an empty page. The list is
+bounded, least recently failed urls are dropped first.
+
+A domain failing again and again (timeouts, refused connections, 403, 429,
+5xx) costs every search its timeout. After failures in a row its circuit
+opens: the domain isn't fetched anymore until the cooldown is over, then a
+single probe is let through. A success closes the circuit, a failure opens it
+again for twice the cooldown (up to max_cooldown). A domain that hasn't
+failed for quiet seconds is forgotten, its failures don't add up over weeks.
+The circuits are bounded like the urls, least recently failed first.
+
+Configured in config.json:
+    "fetch_guard": {"enabled": true, "ttl": 3600, "error_ttl": 300, "max_entries": 4096,
+                    "failures": 3, "cooldown": 30, "max_cooldown": 600, "quiet": 600}
+"""
+
+from ..utils import read_config, LRUCache, canonical_url
+
+from typing import Optional
+from urllib.parse import urlsplit
+
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def domain(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class _Circuit:
+    def __init__(self):
+        self.failures = 0  # in a row
+        self.open_until = 0.0  # closed when 0
+        self.cooldown = 0.0
+        self.probing = 0.0  # when the probe was let through, 0 without probe
+
+
+class FetchGuard:
+    """
+    Negative cache of urls and circuit breaker of domains
+    Args:
+        ttl: seconds a page that answered an error status or nothing is skipped
+        error_ttl: seconds a page that timed out or refused the connection is skipped
+        max_entries: urls remembered, and domains
+        failures: failures in a row opening the circuit of a domain
+        cooldown: seconds the circuit stays open the first time
+        max_cooldown: bound of the cooldown doubling on failed probes
+        quiet: seconds without failure after which a domain is forgotten
+    """
+
+    def __init__(
+        self,
+        ttl: float = 60 * 60,
+        error_ttl: float = 5 * 60,
+        max_entries: int = 4096,
+        failures: int = 3,
+        cooldown: float = 30,
+        max_cooldown: float = 10 * 60,
+        quiet: float = 10 * 60,
+    ):
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.failures = failures
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.quiet = quiet
+
+        self.failed = LRUCache(max_entries=max_entries, ttl=ttl)  # canonical url -> reason
+        # domain -> _Circuit, expires quiet seconds after the last failure
+        self._circuits = LRUCache(max_entries=max_entries, ttl=quiet)
+        self._lock = threading.Lock()
+
+        self.skipped_urls = 0
+        self.skipped_domains = 0
+        self.opened = 0
+        self.probes = 0
+
+    def allow(self, url: str) -> Optional[str]:
+        """
+        None when the url can be fetched, else why it is skipped
+        """
+        reason = self.failed.get(canonical_url(url))
+        if reason is not None:
+            with self._lock:
+                self.skipped_urls += 1
+            return f"failed recently: {reason}"
+
+        now = time.time()
+        with self._lock:
+            circuit = self._circuits.get(domain(url))
+            if circuit is None or not circuit.open_until:
+                return None
+            if now < circuit.open_until or (circuit.probing and now - circuit.probing < circuit.cooldown):
+                self.skipped_domains += 1
+                return "domain circuit open"
+            # cooldown over, one request probes the domain
+            circuit.probing = now
+            self.probes += 1
+            return None
+
+    def success(self, url: str):
+        with self._lock:
+            circuit = self._circuits.get(domain(url))
+            if circuit is not None:
+                self._circuits.delete(domain(url))
+        if circuit is not None and circuit.open_until:
+            logger.info(f"circuit of {domain(url)} closed")
+
+    def failure(self, url: str, reason: str, error: bool = False, domain_failure: bool = False):
+        """
+        The fetch of url failed
+        error: timeout or connection error, the url is retried sooner
+        domain_failure: counts for the circuit of the domain (errors, 403, 429, 5xx)
+        """
+        self.failed.set(canonical_url(url), reason, ttl=self.error_ttl if error else self.ttl)
+        if not (error or domain_failure):
+            # the domain answered, only this page is broken
+            self.success(url)
+            return
+        name = domain(url)
+        now = time.time()
+        with self._lock:
+            circuit = self._circuits.get(name)
+            if circuit is None:
+                circuit = _Circuit()
+            circuit.failures += 1
+            opened = True
+            if circuit.probing:
+                # the probe failed, back off
+                circuit.cooldown = min(circuit.cooldown * 2, self.max_cooldown)
+            elif circuit.failures >= self.failures and not circuit.open_until:
+                circuit.cooldown = self.cooldown
+                self.opened += 1
+            else:
+                opened = False
+            if opened:
+                circuit.open_until = now + circuit.cooldown
+                circuit.probing = 0.0
+            # an open circuit is kept until its cooldown is over, then forgotten like the others
+            ttl = max(circuit.open_until - now, 0.0) + self.quiet
+            self._circuits.set(name, circuit, ttl=ttl)
+        if not opened:
+            return
+        logger.info(f"circuit of {name} open for {circuit.cooldown:.0f}s after {reason}")
+
+    def clear(self):
+        self.failed.clear()
+        with self._lock:
+            self._circuits.clear()
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            open_domains = sorted(d for d, c in self._circuits.items() if c.open_until > now)
+            return {
+                "failed_urls": len(self.failed),
+                "domains": len(self._circuits),
+                "skipped_urls": self.skipped_urls,
+                "skipped_domains": self.skipped_domains,
+                "circuits_opened": self.opened,
+                "probes": self.probes,
+                "open_domains": open_domains,
+            }
+
+
+_guard: Optional[FetchGuard] = None
+_guard_lock = threading.Lock()
+
+
+def get_fetch_guard() -> Optional[FetchGuard]:
+    """
+    Return the process wide fetch guard, None when disabled in config.json
+    """
+    global _guard
+    if _guard is not None:
+        return _guard
+    try:
+        conf = dict(read_config().get("fetch_guard", {}))
+    except Exception:
+        conf = {}
+    if not conf.pop("enabled", True):
+        return None
+    with _guard_lock:
+        if _guard is None:
+            _guard = FetchGuard(**conf)
+    return _guard
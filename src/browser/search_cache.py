@@ -0,0 +1,171 @@
+"""
+Search result cache
+
+The search hop is about half of the latency of a quick answer and the same
+queries are sent again and again. Result lists (title, link, snippet, the
+page content is cached by content_cache.py) are cached by
+    - the normalised query: case, spacing and the "search:" prefix of the
+      streaming route ignored
+    - the backend, news results get a shorter ttl than text results
+    - the number of results asked
+Stale while revalidate: for stale seconds after its ttl a result list is
+still served right away while a background search refreshes it. Concurrent
+searches of the same key share one request.
+
+Configured in config.json:
+    "search_cache": {"enabled": true, "ttl": {"text": 3600, "news": 600},
+                     "stale": 600, "max_entries": 1024}
+"""
+
+from ..utils import read_config, LRUCache
+
+from typing import Awaitable, Callable, Optional
+
+import asyncio
+import copy
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+TTL = {"text": 60 * 60, "news": 10 * 60}
+
+_prefix = re.compile(r"\bsearch:\s*", re.IGNORECASE)
+
+
+def search_key(query: str, backend: str, k: int) -> str:
+    query = " ".join(_prefix.sub(" ", query or "").lower().split())
+    return f"{backend}\0{k}\0{query}"
+
+
+class SearchCache:
+    """
+    Args:
+        ttl: backend -> seconds a result list is fresh
+        stale: seconds a result list is served while it is refreshed
+        max_entries: bounded size, least recently used list is evicted
+    """
+
+    def __init__(self, ttl: Optional[dict] = None, stale: float = 10 * 60, max_entries: int = 1024):
+        self.ttl = {**TTL, **(ttl or {})}
+        self.stale = stale
+        # key -> (results, fresh until)
+        self._entries = LRUCache(max_entries=max_entries)
+        # (event loop, key) -> task of the search running
+        self._running: dict = {}
+        self._lock = threading.Lock()
+
+        self.fresh = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.revalidations = 0
+        self.errors = 0
+
+    async def get(
+        self, query: str, backend: str, k: int, search: Callable[[], Awaitable[list]]
+    ) -> list:
+        """
+        Results of the query, search() is called on a miss and to refresh a
+        stale list. Errors of search() are raised on a miss only
+        """
+        key = search_key(query, backend, k)
+        item = self._entries.get(key)
+        if item is not None:
+            results, fresh_until = item
+            now = time.time()
+            if now < fresh_until:
+                self._count("fresh")
+                return copy.deepcopy(results)
+            self._count("stale_hits")
+            self._revalidate(key, backend, search)
+            return copy.deepcopy(results)
+
+        self._count("misses")
+        return copy.deepcopy(await self._search(key, backend, search))
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.fresh + self.stale_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "fresh": self.fresh,
+                "stale": self.stale_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "revalidations": self.revalidations,
+                "errors": self.errors,
+                "hit_rate": (self.fresh + self.stale_hits) / total if total else 0.0,
+            }
+
+    def _search(self, key: str, backend: str, search) -> asyncio.Future:
+        """
+        Task searching key, shared with the callers asking at the same time
+        """
+        running_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            task = self._running.get(running_key)
+            if task is not None:
+                self.coalesced += 1
+                return asyncio.shield(task)
+            task = asyncio.create_task(self._run(key, backend, search))
+            self._running[running_key] = task
+        task.add_done_callback(lambda _: self._running.pop(running_key, None))
+        return asyncio.shield(task)
+
+    async def _run(self, key: str, backend: str, search) -> list:
+        try:
+            results = await search()
+        except Exception:
+            self._count("errors")
+            raise
+        if results:
+            # an empty list is most likely a failed search, don't keep it
+            ttl = self.ttl.get(backend, self.ttl["text"])
+            self._entries.set(key, (copy.deepcopy(results), time.time() + ttl), ttl=ttl + self.stale)
+        return results
+
+    def _revalidate(self, key: str, backend: str, search):
+        with self._lock:
+            if (asyncio.get_running_loop(), key) in self._running:
+                return
+            self.revalidations += 1
+        refresh = self._search(key, backend, search)
+        refresh.add_done_callback(_log_error)
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+def _log_error(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning(f"search revalidation failed: {future.exception()}")
+
+
+_cache: Optional[SearchCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """
+    Return the process wide search cache, None when disabled in config.json
+    """
+    global _cache
+    if _cache is not None:
+        return _cache
+    try:
+        conf = dict(read_config().get("search_cache", {}))
+    except Exception:
+        conf = {}
+    if not conf.pop("enabled", True):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache(**conf)
+    return _cache
@@ -1 +1,2 @@
 from .factory import Factory
+from .pool import AgentPool, get_agent_pool
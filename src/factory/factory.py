@@ -5,6 +5,14 @@ Factory
 from ..agent import Planner, Search_agent, Reporter, RAG_agent, Quick_searcher
 
 from ..model import Gemini, Ollama, Deepseek, Model, Gork, OpenAI
+from ..model import get_completion_cache, get_history_window, get_limiter, MultiModel
+
+import threading
+
+# models are stateless so one instance per provider and model is shared
+# by every agent and every request
+_models: dict = {}
+_models_lock = threading.Lock()
 
 
 class Factory:
@@ -19,6 +27,55 @@ class Factory:
             return RAG_agent(model)
 
     def get_model(provider: str, model: str) -> Model:
+        key = (provider, model)
+        m = _models.get(key)
+        if m is not None:
+            return m
+        with _models_lock:
+            if key not in _models:
+                m = Factory._create_model(provider, model)
+                if m is None:
+                    return None
+                m.cache = get_completion_cache()
+                m.history = get_history_window(model)
+                m.limiter = get_limiter(provider)
+                _models[key] = m
+            return _models[key]
+
+    def get_config_model(config: dict) -> Model:
+        """
+        Model described by config.json. When "providers" lists more than one
+        provider the calls are routed with fallback or hedging (see multi.py)
+        """
+        providers = config.get("providers") or []
+        if len(providers) <= 1:
+            if providers:
+                return Factory.get_model(providers[0]["provider"], providers[0]["model"])
+            return Factory.get_model(config["provider"], config["model"])
+
+        mode = config.get("routing", "fallback")
+        options = config.get("routing_options", {})
+        key = (
+            "multi",
+            tuple((p["provider"], p["model"]) for p in providers),
+            mode,
+            tuple(sorted(options.items())),
+        )
+        m = _models.get(key)
+        if m is not None:
+            return m
+
+        models = [Factory.get_model(p["provider"], p["model"]) for p in providers]
+        models = [m for m in models if m is not None]
+        with _models_lock:
+            if key not in _models:
+                m = MultiModel(models, mode=mode, **options)
+                m.cache = get_completion_cache()
+                m.history = get_history_window(models[0].get_model())
+                _models[key] = m
+            return _models[key]
+
+    def _create_model(provider: str, model: str) -> Model:
         if provider == "deepseek":
             return Deepseek(model)
         if provider == "google" or provider == "gemini":
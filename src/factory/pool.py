@@ -0,0 +1,125 @@
+"""
+Pool of warm agents
+
+Building an agent is not free, RAG_agent opens the Chroma client, the
+search agents start a crawler... A report request borrows its agents from
+the pool and gives them back when the report is written, so the next request
+reuses them. An agent is only lent to one request at a time, what it keeps
+while working on a report lives in the run context (agent/context.py).
+
+The planner is not pooled, it holds the plan of one request and is cheap to
+build.
+
+Configured in config.json:
+    "agent_pool": {"warm": 1, "max_idle": 4}
+        warm: agents of every configured kind built at startup
+        max_idle: agents of one kind kept between requests
+"""
+
+from .factory import Factory
+from ..utils import read_config
+
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import asyncio
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AgentPool:
+    def __init__(self, max_idle: int = 4):
+        self.max_idle = max_idle
+        self._idle: dict = {}  # (agent name, model) -> idle agents
+        self._lock = threading.Lock()
+
+        self.reused = 0
+        self.created = 0
+
+    async def acquire(self, name: str, model):
+        """
+        Borrow an agent, a new one is built (off the event loop) when none is idle
+        """
+        with self._lock:
+            idle = self._idle.get((name, model))
+            if idle:
+                self.reused += 1
+                return idle.pop()
+        agent = await asyncio.to_thread(Factory.get_agent, name, model)
+        if agent is not None:
+            with self._lock:
+                self.created += 1
+        return agent
+
+    def release(self, name: str, model, agent):
+        """
+        Give an agent back, it's dropped when enough of its kind are idle
+        """
+        if agent is None:
+            return
+        with self._lock:
+            idle = self._idle.setdefault((name, model), [])
+            if len(idle) < self.max_idle:
+                idle.append(agent)
+
+    @asynccontextmanager
+    async def borrow(self, names: list[str], model):
+        """
+        Borrow one agent of every name for the duration of a request
+        """
+        borrowed = []
+        try:
+            for name in names:
+                agent = await self.acquire(name, model)
+                if agent is None:
+                    logger.warning(f"unknown agent {name}")
+                    continue
+                borrowed.append((name, agent))
+            yield [agent for _, agent in borrowed]
+        finally:
+            for name, agent in borrowed:
+                self.release(name, model, agent)
+
+    async def warm(self, names: list[str], model, size: int = 1):
+        """
+        Build size agents of every name ahead of the first request
+        """
+        for name in names:
+            with self._lock:
+                missing = size - len(self._idle.get((name, model), []))
+            for _ in range(missing):
+                agent = await asyncio.to_thread(Factory.get_agent, name, model)
+                if agent is None:
+                    logger.warning(f"unknown agent {name}")
+                    break
+                with self._lock:
+                    self.created += 1
+                self.release(name, model, agent)
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = {name: len(agents) for (name, _), agents in self._idle.items()}
+        return {"idle": idle, "reused": self.reused, "created": self.created}
+
+
+_pool: Optional[AgentPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_agent_pool() -> AgentPool:
+    """
+    Return the process wide agent pool
+    """
+    global _pool
+    if _pool is not None:
+        return _pool
+    try:
+        conf = read_config().get("agent_pool", {})
+    except Exception:
+        conf = {}
+    with _pool_lock:
+        if _pool is None:
+            _pool = AgentPool(max_idle=conf.get("max_idle", 4))
+    return _pool
@@ -1,16 +1,59 @@
 from .agent import Planner, Agent
-from .router import Server, Router
+from .router import Server, Router, Budget, get_checkpoint_store
+from .utils import read_config
 
+import uuid
 import logging 
 
 logger = logging.getLogger(__name__)
 
-async def generate_report(query, planner: Planner, agents: list[Agent]):
+async def generate_report(
+    query, planner: Planner, agents: list[Agent], fan_out: int = None, run_id: str = None
+):
     """
     TODO : refactor 
+    fan_out: number of independent tasks run in parallel, "fan_out" in config.json
+    run_id: checkpoint of the run, a new one by default. Only a run given
+        its run_id (see resume_report) resumes an unfinished checkpoint, its
+        completed steps are skipped.
     """
+    server = _build_server(query, planner, agents, fan_out, run_id)
+
+    report = await server.start(query=query)
+    report = report["data"]
+
+    return report
+
+
+async def generate_report_stream(
+    query, planner: Planner, agents: list[Agent], fan_out: int = None, run_id: str = None
+):
+    """
+    Same as generate_report but yield the progress events (see router/events.py)
+    the report is the result of the last event
+    """
+    server = _build_server(query, planner, agents, fan_out, run_id)
+    async for event in server.stream(query=query):
+        yield event
+
+
+def _build_server(query, planner: Planner, agents: list[Agent], fan_out, run_id) -> Server:
     planner.query = query
-    server = Server()
+    try:
+        config = read_config()
+    except Exception:
+        config = {}
+    if fan_out is None:
+        fan_out = config.get("fan_out", 3)
+    store = get_checkpoint_store()
+    # every request gets its own checkpoint, concurrent runs of the same
+    # query don't share (and delete) one
+    resume = run_id is not None
+    if run_id is None:
+        run_id = uuid.uuid4().hex
+    logger.info(f"run {run_id}")
+    budget = Budget.from_config(config.get("limits", {}))
+    server = Server(fan_out=fan_out, checkpoint=store, run_id=run_id, budget=budget)
 
     planner_router = Router(server, planner)
     server.add_router(planner.name, planner_router)
@@ -25,7 +68,20 @@ async def generate_report(query, planner: Planner, agents: list[Agent]):
 
     server.set_initial_router(planner.name, query)
 
-    report = await server.start(query=query)
-    report = report["data"]
+    state = store.load(run_id) if store is not None and resume else None
+    if state is not None and state.get("plan_done"):
+        logger.info(f"resuming {run_id}, {len(state['done'])} steps already done")
+        planner.restore_plan(state["plan"], state["done"])
+        server.restore(state)
+    return server
 
-    return report
\ No newline at end of file
+
+async def resume_report(run_id: str, planner: Planner, agents: list[Agent], fan_out: int = None):
+    """
+    Resume an interrupted run from its checkpoint
+    """
+    store = get_checkpoint_store()
+    state = store.load(run_id) if store is not None else None
+    if state is None:
+        raise KeyError(f"no checkpoint for {run_id}")
+    return await generate_report(state["query"], planner, agents, fan_out, run_id)
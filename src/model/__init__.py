@@ -4,3 +4,8 @@ from .gemini import Gemini
 from .ollama import Ollama
 from .openai import OpenAI
 from .gork import Gork
+from .cache import CompletionCache, get_completion_cache
+from .history import HistoryWindow, get_history_window
+from .multi import MultiModel
+from .limiter import AdaptiveLimiter, get_limiter, limiter_stats
+from .usage import UsageTracker, UsageLimitExceeded, track_usage, reset_usage, current_usage
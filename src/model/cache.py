@@ -0,0 +1,123 @@
+"""
+Exact match completion cache
+
+Planner and search plan prompts for repeated queries are often byte
+identical, so the response is cached by provider, model, the message list and
+the sampling parameters. Memory is checked first, then disk.
+
+Opt in with config.json:
+    "llm_cache": {
+        "enabled": true,
+        "path": "./tmp/llm_cache.db",
+        "ttl": 86400,
+        "max_entries": 1024,
+        "max_bytes": 268435456
+    }
+"""
+
+from ..utils import read_config, LRUCache, DiskCache
+
+from typing import Iterator, Optional
+
+import hashlib
+import json
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionCache:
+    """
+    Two tier cache for LLM completions
+    Args:
+        path: sqlite path of the disk tier, None to keep memory only
+        ttl: time to live of an entry in seconds
+        max_entries: size of the in memory LRU tier
+        max_bytes: size of the disk tier
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = "./tmp/llm_cache.db",
+        ttl: float = 24 * 60 * 60,
+        max_entries: int = 1024,
+        max_bytes: int = 256 * 1024 * 1024,
+        chunk_size: int = 64,
+    ):
+        self.memory = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.disk = DiskCache(path, max_bytes=max_bytes, ttl=ttl) if path else None
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def key(provider: str, model: str, messages: list[dict], params: dict) -> str:
+        messages_hash = hashlib.sha256(
+            json.dumps(messages, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        params = json.dumps(params, sort_keys=True)
+        return hashlib.sha256(
+            f"{provider}\0{model}\0{messages_hash}\0{params}".encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.disk is None:
+            return None
+        raw = self.disk.get(key)
+        if raw is None:
+            return None
+        value = raw.decode("utf-8")
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: str):
+        if not value:
+            # never cache an empty answer
+            return
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value.encode("utf-8"))
+
+    def replay(self, value: str) -> Iterator[str]:
+        """
+        Replay a cached response as stream chunks
+        """
+        for i in range(0, len(value), self.chunk_size):
+            yield value[i : i + self.chunk_size]
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+_cache: Optional[CompletionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_completion_cache() -> Optional[CompletionCache]:
+    """
+    Return the process wide completion cache or None if it is not enabled
+    """
+    global _cache
+    if _cache is not None:
+        return _cache
+    try:
+        conf = read_config().get("llm_cache", {})
+    except Exception:
+        conf = {}
+    if not conf.get("enabled", False):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = CompletionCache(
+                path=conf.get("path", "./tmp/llm_cache.db"),
+                ttl=conf.get("ttl", 24 * 60 * 60),
+                max_entries=conf.get("max_entries", 1024),
+                max_bytes=conf.get("max_bytes", 256 * 1024 * 1024),
+            )
+            logger.info("llm completion cache enabled")
+    return _cache
@@ -0,0 +1,53 @@
+"""
+Shared provider clients
+
+Models don't hold any conversation state, so a single pooled client per
+provider and base_url can serve every agent and every request. This saves the
+client construction and TLS handshakes on the request path.
+"""
+
+from openai import OpenAI, AsyncOpenAI
+
+import threading
+
+_clients: dict = {}
+_lock = threading.Lock()
+
+
+def shared_client(kind: str, factory, *key):
+    """
+    Return the client registered under (kind, *key), creating it with
+    factory() on first use
+    """
+    k = (kind, *key)
+    client = _clients.get(k)
+    if client is not None:
+        return client
+    with _lock:
+        if k not in _clients:
+            _clients[k] = factory()
+        return _clients[k]
+
+
+def openai_client(api_key: str, base_url: str = "") -> OpenAI:
+    if base_url == "":
+        return shared_client("openai", lambda: OpenAI(api_key=api_key), api_key)
+    return shared_client(
+        "openai",
+        lambda: OpenAI(api_key=api_key, base_url=base_url),
+        api_key,
+        base_url,
+    )
+
+
+def async_openai_client(api_key: str, base_url: str = "") -> AsyncOpenAI:
+    if base_url == "":
+        return shared_client(
+            "async-openai", lambda: AsyncOpenAI(api_key=api_key), api_key
+        )
+    return shared_client(
+        "async-openai",
+        lambda: AsyncOpenAI(api_key=api_key, base_url=base_url),
+        api_key,
+        base_url,
+    )
@@ -1,6 +1,5 @@
 from google import genai
 from google.genai import types
-from openai import OpenAI
 
 from crawl4ai import LLMConfig
 
@@ -8,6 +7,7 @@ import os
 from dotenv import load_dotenv
 
 from .model import Model
+from .client import shared_client, openai_client
 
 
 """
@@ -20,36 +20,67 @@ class Gemini(Model):
         load_dotenv(override=True)
         self.api_key = os.getenv("GEMINI_API")
         self.model = model
-        self.client = genai.Client(api_key=self.api_key)
-        self.messages = self.client.chats.create(model=model)
-
-    def clear_message(self):
-        self.messages = self.client.chats.create(model=self.model)
+        self.client = shared_client(
+            "gemini", lambda: genai.Client(api_key=self.api_key), self.api_key
+        )
 
     def set_api(self, api):
         self.api = api
 
-    def completion(self, query: str):
-        res = self.message.send_message(query)
+    def _completion(self, messages):
+        contents, config = self._to_contents(messages)
+        res = self.client.models.generate_content(
+            model=self.model, contents=contents, config=config
+        )
         return res.text
 
-    def reset(self):
-        """
-        Reset chat message
-        """
-        self.message = self.client.chats.create(model=Model)
+    def _completion_stream(self, messages):
+        contents, config = self._to_contents(messages)
+        for chunk in self.client.models.generate_content_stream(
+            model=self.model, contents=contents, config=config
+        ):
+            if chunk.text:
+                yield chunk.text
 
-    def add_system_instruction(self, instruction: str):
-        self.message.send_message(
-            config=types.GenerateContentConfig(system_instruction=instruction)
+    async def _acompletion(self, messages):
+        contents, config = self._to_contents(messages)
+        res = await self.client.aio.models.generate_content(
+            model=self.model, contents=contents, config=config
         )
+        return res.text
+
+    async def _acompletion_stream(self, messages):
+        contents, config = self._to_contents(messages)
+        async for chunk in await self.client.aio.models.generate_content_stream(
+            model=self.model, contents=contents, config=config
+        ):
+            if chunk.text:
+                yield chunk.text
+
+    def _to_contents(self, messages):
+        """
+        Convert openai style messages to gemini contents
+        system messages are passed as system instruction
+        """
+        system = []
+        contents = []
+        for m in messages:
+            if m["role"] == "system":
+                system.append(m["content"])
+                continue
+            role = "model" if m["role"] == "assistant" else "user"
+            contents.append(
+                types.Content(role=role, parts=[types.Part(text=m["content"])])
+            )
+        config = None
+        if system:
+            config = types.GenerateContentConfig(system_instruction="\n".join(system))
+        return contents, config
 
     def get_client(self):
-        client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+        return openai_client(
+            self.api_key, "https://generativelanguage.googleapis.com/v1beta/openai/"
         )
-        return client
 
     def get_llm_config(self) -> LLMConfig:
         return LLMConfig(provider="gemini/" + self.model, api_token=self.api_key)
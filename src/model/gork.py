@@ -1,6 +1,6 @@
 from .model import Model
+from .client import openai_client, async_openai_client
 
-from openai import OpenAI
 from dotenv import load_dotenv
 
 from crawl4ai import LLMConfig
@@ -13,19 +13,15 @@ class Gork(Model):
         load_dotenv(override=True)
         self.api_key = os.getenv("XAI_API_KEY")
         self.model = model
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://api.x.ai/v1",
-        )
-        self.messages = []
+        self.client = openai_client(self.api_key, "https://api.x.ai/v1")
+        self.aclient = async_openai_client(self.api_key, "https://api.x.ai/v1")
 
     def set_api(self, api_key: str):
         self.api_key = api_key
 
-    def completion(self, query):
-        self._add_message(query)
+    def _completion(self, messages):
         response = self.client.chat.completions.create(
-            model=self.model, messages=self.messages, stream=False
+            model=self.model, messages=messages, stream=False
         )
         return response.choices[0].message.content
 
@@ -41,18 +37,26 @@ class Gork(Model):
     def get_model(self):
         return self.model
 
-    def clear_message(self):
-        self.messages = []
-
-    def _add_message(self, message, role="user"):
-        self.messages.append({"role": "user", "content": message})
-
-    def completion_stream(self, message):
-        self._add_message(message=message, role="user")
+    def _completion_stream(self, messages):
         stream = self.client.chat.completions.create(
-            model=self.model, messages=self.messages, stream=True
+            model=self.model, messages=messages, stream=True
         )
         for event in stream:
             text_chunk = getattr(event.choices[0].delta, "content", None)
             if text_chunk:
                 yield text_chunk
+
+    async def _acompletion(self, messages):
+        response = await self.aclient.chat.completions.create(
+            model=self.model, messages=messages, stream=False
+        )
+        return response.choices[0].message.content
+
+    async def _acompletion_stream(self, messages):
+        stream = await self.aclient.chat.completions.create(
+            model=self.model, messages=messages, stream=True
+        )
+        async for event in stream:
+            text_chunk = getattr(event.choices[0].delta, "content", None)
+            if text_chunk:
+                yield text_chunk
@@ -0,0 +1,164 @@
+"""
+Token aware conversation history window
+
+Every provider receives the conversation on each call. Long sessions would
+grow prompt tokens, latency and memory without limit, so the history is
+trimmed to a token budget before it is sent. System messages and the current
+instruction (the last message) are always kept, older turns are dropped
+first and can be collapsed into one short note.
+
+Budgets are configured per model in config.json:
+    "history_tokens": {"default": 6000, "gpt-4o-mini": 12000}
+"""
+
+from ..utils import read_config
+
+from typing import Optional
+
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_loaded = False
+
+# every message costs a few tokens for role and separators
+MESSAGE_OVERHEAD = 4
+
+PINNED_ROLES = ("system", "developer")
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:  # tiktoken is optional or the encoding can't be downloaded
+            _encoding = None
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # rough estimation, around 4 characters per token for english
+    return len(text) // 4 + 1
+
+
+def message_tokens(message: dict) -> int:
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD
+
+
+class HistoryWindow:
+    """
+    Args:
+        max_tokens: token budget of the whole message list
+        collapse: replace dropped turns with one short system note
+        collapse_chars: characters kept per dropped turn in the note
+    """
+
+    def __init__(
+        self, max_tokens: int = 6000, collapse: bool = True, collapse_chars: int = 80
+    ):
+        self.max_tokens = max_tokens
+        self.collapse = collapse
+        self.collapse_chars = collapse_chars
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.trimmed_calls = 0
+        self.tokens_saved = 0
+
+    def fit(self, messages: list[dict]) -> tuple[list[dict], int]:
+        """
+        Return the messages that fit in the budget and the number of tokens
+        saved compared with sending everything
+        """
+        if not messages:
+            return messages, 0
+
+        costs = [message_tokens(m) for m in messages]
+        total = sum(costs)
+        if total <= self.max_tokens:
+            self._record(0)
+            return messages, 0
+
+        last = len(messages) - 1
+        pinned = {i for i, m in enumerate(messages) if m["role"] in PINNED_ROLES}
+        pinned.add(last)
+
+        budget = self.max_tokens - sum(costs[i] for i in pinned)
+        keep = set(pinned)
+        # walk backwards so the most recent turns survive
+        for i in range(last - 1, -1, -1):
+            if i in pinned:
+                continue
+            if costs[i] > budget:
+                break
+            keep.add(i)
+            budget -= costs[i]
+
+        dropped = [i for i in range(len(messages)) if i not in keep]
+        result = [messages[i] for i in sorted(keep)]
+
+        if self.collapse and dropped:
+            note = self._collapse([messages[i] for i in dropped])
+            if message_tokens(note) <= budget:
+                # place the note right after the pinned system messages
+                at = 0
+                while at < len(result) and result[at]["role"] in PINNED_ROLES:
+                    at += 1
+                result.insert(at, note)
+
+        saved = total - sum(message_tokens(m) for m in result)
+        self._record(saved)
+        logger.info(
+            f"history window dropped {len(dropped)} messages, saved {saved} tokens"
+        )
+        return result, saved
+
+    def stats(self) -> dict:
+        return {
+            "max_tokens": self.max_tokens,
+            "calls": self.calls,
+            "trimmed_calls": self.trimmed_calls,
+            "tokens_saved": self.tokens_saved,
+        }
+
+    def _collapse(self, dropped: list[dict]) -> dict:
+        lines = []
+        for m in dropped:
+            content = " ".join((m.get("content") or "").split())
+            if len(content) > self.collapse_chars:
+                content = content[: self.collapse_chars] + "..."
+            lines.append(f"{m['role']}: {content}")
+        return {
+            "role": "system",
+            "content": "Earlier conversation (condensed):\n" + "\n".join(lines),
+        }
+
+    def _record(self, saved: int):
+        with self._lock:
+            self.calls += 1
+            if saved > 0:
+                self.trimmed_calls += 1
+                self.tokens_saved += saved
+
+
+def get_history_window(model: str) -> HistoryWindow:
+    """
+    Build the history window of a model from config.json
+    """
+    try:
+        conf = read_config().get("history_tokens", {})
+    except Exception:
+        conf = {}
+    max_tokens: Optional[int] = conf.get(model, conf.get("default", 6000))
+    return HistoryWindow(max_tokens=max_tokens)
@@ -0,0 +1,252 @@
+"""
+Adaptive per provider rate limiter
+
+Every call to a provider goes through the limiter of that provider. It
+is an AIMD concurrency window:
+    - there is no limit until the provider first throttles a call
+    - a 429 or an empty response halves the window (multiplicative decrease,
+      from the calls running at the time) and pauses the provider for an
+      exponential backoff, or for Retry-After when the provider sends it
+    - every successful call grows the window by 1 / window (additive increase)
+A stream holds its slot until its first chunk, the provider accepted the
+request then and a long answer doesn't keep other users waiting.
+
+A static rate (token bucket of requests per second with a burst) and a
+ceiling of the window are opt-in, for providers with known quotas.
+
+The state is guarded by a threading lock so the same limiter serves the sync
+and the async paths.
+
+Limits are configured in config.json, "default" applies to every provider:
+    "rate_limits": {
+        "default": {"max_concurrency": 32},
+        "openai": {"rate": 2, "burst": 4}
+    }
+"""
+
+from ..utils import read_config
+
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+import asyncio
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# how long a waiter sleeps before checking a busy concurrency window again
+POLL_INTERVAL = 0.05
+
+
+class EmptyResponseError(RuntimeError):
+    """
+    The provider answered without any content, usually a silent throttle
+    """
+
+
+def is_throttle(e: Exception) -> bool:
+    """
+    True if the exception is a rate limit error of any supported provider
+    """
+    if isinstance(e, EmptyResponseError):
+        return True
+    for attr in ("status_code", "code", "status"):
+        if getattr(e, attr, None) == 429:
+            return True
+    name = type(e).__name__.lower()
+    return "ratelimit" in name or "resourceexhausted" in name
+
+
+def retry_after(e: Exception) -> Optional[float]:
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    Args:
+        name: provider name, used in logs
+        rate: requests per second refilled in the bucket, None for no bucket
+        burst: size of the bucket
+        max_concurrency: upper bound of the concurrency window, None to
+            only limit after a throttle
+        min_concurrency: lower bound of the concurrency window
+        max_retries: retries of a throttled call before the error is raised
+        base_backoff / max_backoff: bounds of the exponential backoff in seconds
+    """
+
+    def __init__(
+        self,
+        name: str = "",
+        rate: Optional[float] = None,
+        burst: int = 10,
+        max_concurrency: Optional[int] = None,
+        min_concurrency: int = 1,
+        max_retries: int = 3,
+        base_backoff: float = 0.5,
+        max_backoff: float = 30,
+    ):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        # start in the middle, the window finds its level quickly. Without a
+        # ceiling there is no window until the provider throttles
+        self._window = (
+            float(max(min_concurrency, max_concurrency // 2))
+            if max_concurrency is not None
+            else None
+        )
+        self._active = 0
+        self._paused_until = 0.0
+        self._failures = 0
+
+        self.calls = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+    def _try_acquire(self) -> float:
+        """
+        Take a slot and a token, return 0, or the time to wait before trying again
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._window is not None and self._active >= int(self._window):
+                return POLL_INTERVAL
+            if self.rate is not None:
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._refilled_at) * self.rate
+                )
+                self._refilled_at = now
+                if self._tokens < 1:
+                    return (1 - self._tokens) / self.rate
+                self._tokens -= 1
+            self._active += 1
+            self.calls += 1
+            return 0
+
+    def release(self):
+        """
+        Give back a slot taken by acquire()
+        """
+        with self._lock:
+            self._active -= 1
+
+    def on_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._window is None:
+                return
+            self._window = self._window + 1 / self._window
+            if self.max_concurrency is not None:
+                self._window = min(self.max_concurrency, self._window)
+
+    def on_throttle(self, e: Optional[Exception] = None) -> float:
+        """
+        Shrink the window and pause the provider, return the pause in seconds
+        """
+        with self._lock:
+            self.throttled += 1
+            self._failures += 1
+            window = self._window if self._window is not None else max(self._active, 1)
+            self._window = max(self.min_concurrency, window / 2)
+            delay = retry_after(e) if e is not None else None
+            if delay is None:
+                delay = min(
+                    self.max_backoff, self.base_backoff * 2 ** (self._failures - 1)
+                )
+                delay *= 0.5 + random.random() / 2  # jitter
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        logger.warning(
+            f"{self.name} throttled, window {self._window:.1f}, pause {delay:.2f}s"
+        )
+        return delay
+
+    def acquire(self):
+        """
+        Wait for a slot, give it back with release()
+        """
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                return
+            self.waited += wait
+            time.sleep(wait)
+
+    async def aacquire(self):
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                return
+            self.waited += wait
+            await asyncio.sleep(wait)
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "window": round(self._window, 2) if self._window is not None else None,
+            "active": self._active,
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "waited": round(self.waited, 2),
+        }
+
+
+_limiters: dict = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str) -> AdaptiveLimiter:
+    """
+    Return the process wide limiter of a provider
+    """
+    limiter = _limiters.get(provider)
+    if limiter is not None:
+        return limiter
+    try:
+        conf = read_config().get("rate_limits", {})
+    except Exception:
+        conf = {}
+    options = {**conf.get("default", {}), **conf.get(provider, {})}
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = AdaptiveLimiter(name=provider, **options)
+        return _limiters[provider]
+
+
+def limiter_stats() -> dict:
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
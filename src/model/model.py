@@ -1,16 +1,33 @@
 from abc import ABC, abstractmethod
+from typing import AsyncIterator, Iterator, Optional
+
+import asyncio
 
 from crawl4ai import LLMConfig
 
+from .limiter import EmptyResponseError, is_throttle
+from .usage import current_usage
+from .history import count_tokens, message_tokens
+from ..utils.tracing import span
+
 
 class Model(ABC):
     """
     This is an abstraction class for models
     Model can be any LLM or VLM
 
-    TODO: should we have one api that support
+    A model holds no conversation state. Callers pass the previous messages
+    on every call so a single instance can be shared by every agent and
+    every request.
     """
 
+    # optional CompletionCache (see cache.py), attached by the Factory
+    cache = None
+    # optional HistoryWindow (see history.py), attached by the Factory
+    history = None
+    # optional AdaptiveLimiter (see limiter.py) shared by the provider, attached by the Factory
+    limiter = None
+
     @abstractmethod
     def __init__(self):
         pass
@@ -19,34 +36,322 @@ class Model(ABC):
         Completion is 
         Args:
             query: query can be a prompt or RAG sentence
+            history: previous messages of the conversation, e.g [{"role": "user", "content": "hi"}]
         Output:
             return a string response
     """
 
+    def completion(self, query: str, history: Optional[list] = None) -> str:
+        with span("llm.completion", **self._span_attributes()) as s:
+            messages = self._build_messages(query, history)
+            key = self._cache_key(messages, stream=False)
+            if key is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    _trace_call(s, messages, cached, cache_hit=True)
+                    return cached
+
+            usage = current_usage()
+            if usage is not None:
+                usage.check()
+            res = self._call(messages)
+            _trace_call(s, messages, res, cache_hit=False)
+            if usage is not None:
+                usage.record(messages, res)
+            if key is not None:
+                self.cache.set(key, res)
+            return res
+
+    def completion_stream(
+        self, message: str, history: Optional[list] = None
+    ) -> Iterator[str]:
+        # the span stays open across yields, it can't be the parent of the caller's spans
+        with span("llm.completion_stream", attach=False, **self._span_attributes()) as s:
+            messages = self._build_messages(message, history)
+            key = self._cache_key(messages, stream=True)
+            if key is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    _trace_call(s, messages, cached, cache_hit=True)
+                    yield from self.cache.replay(cached)
+                    return
+
+            usage = current_usage()
+            if usage is not None:
+                usage.check()
+            chunks = []
+            for chunk in self._call_stream(messages):
+                chunks.append(chunk)
+                yield chunk
+            _trace_call(s, messages, "".join(chunks), cache_hit=False)
+            if usage is not None:
+                usage.record(messages, "".join(chunks))
+            if key is not None:
+                self.cache.set(key, "".join(chunks))
+
+    """
+        Async version of completion and completion_stream
+        Agents and routes run inside the event loop so they should always
+        use these methods, the sync version blocks every other request
+    """
+
+    async def acompletion(self, query: str, history: Optional[list] = None) -> str:
+        with span("llm.completion", **self._span_attributes()) as s:
+            messages = self._build_messages(query, history)
+            key = self._cache_key(messages, stream=False)
+            if key is not None:
+                cached = await asyncio.to_thread(self.cache.get, key)
+                if cached is not None:
+                    _trace_call(s, messages, cached, cache_hit=True)
+                    return cached
+
+            usage = current_usage()
+            if usage is not None:
+                usage.check()
+            res = await self._acall(messages)
+            _trace_call(s, messages, res, cache_hit=False)
+            if usage is not None:
+                usage.record(messages, res)
+            if key is not None:
+                await asyncio.to_thread(self.cache.set, key, res)
+            return res
+
+    async def acompletion_stream(
+        self, message: str, history: Optional[list] = None
+    ) -> AsyncIterator[str]:
+        with span("llm.completion_stream", attach=False, **self._span_attributes()) as s:
+            messages = self._build_messages(message, history)
+            key = self._cache_key(messages, stream=True)
+            if key is not None:
+                cached = await asyncio.to_thread(self.cache.get, key)
+                if cached is not None:
+                    _trace_call(s, messages, cached, cache_hit=True)
+                    for chunk in self.cache.replay(cached):
+                        yield chunk
+                    return
+
+            usage = current_usage()
+            if usage is not None:
+                usage.check()
+            chunks = []
+            async for chunk in self._acall_stream(messages):
+                chunks.append(chunk)
+                yield chunk
+            _trace_call(s, messages, "".join(chunks), cache_hit=False)
+            if usage is not None:
+                usage.record(messages, "".join(chunks))
+            if key is not None:
+                await asyncio.to_thread(self.cache.set, key, "".join(chunks))
+
+    async def completion_many(
+        self, prompts: list[str], max_concurrency: int = 4, on_result=None
+    ) -> list:
+        """
+        Run independent prompts concurrently, at most max_concurrency at once
+        Results keep the input order. A failed prompt doesn't affect the
+        others, its exception is returned in place of the response.
+        on_result(index, response or exception) is called as soon as each
+        prompt finishes
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run(i, prompt):
+            async with semaphore:
+                try:
+                    res = await self.acompletion(prompt)
+                except Exception as e:
+                    res = e
+            if on_result is not None:
+                on_result(i, res)
+            if isinstance(res, Exception):
+                raise res
+            return res
+
+        return await asyncio.gather(
+            *(run(i, prompt) for i, prompt in enumerate(prompts)), return_exceptions=True
+        )
+
+    """
+        Provider calls through the limiter
+        A throttled call (429 or empty response) is retried once the limiter
+        lets it through again. A stream is only retried before its first chunk,
+        it gives its slot back once the first chunk arrived.
+    """
+
+    def _call(self, messages: list[dict]) -> str:
+        if self.limiter is None:
+            return self._completion(messages)
+        retries = self.limiter.max_retries
+        for attempt in range(retries + 1):
+            with self.limiter.slot():
+                try:
+                    res = self._completion(messages)
+                    if not res:
+                        raise EmptyResponseError(f"empty response from {self.get_model()}")
+                except Exception as e:
+                    if not is_throttle(e) or attempt == retries:
+                        raise
+                    self.limiter.on_throttle(e)
+                    continue
+            self.limiter.on_success()
+            return res
+
+    def _call_stream(self, messages: list[dict]) -> Iterator[str]:
+        if self.limiter is None:
+            yield from self._completion_stream(messages)
+            return
+        retries = self.limiter.max_retries
+        for attempt in range(retries + 1):
+            started = False
+            self.limiter.acquire()
+            try:
+                for chunk in self._completion_stream(messages):
+                    if not started:
+                        started = True
+                        # accepted, the rest of the stream doesn't hold a slot
+                        self.limiter.release()
+                    yield chunk
+            except Exception as e:
+                if started or not is_throttle(e) or attempt == retries:
+                    raise
+                self.limiter.on_throttle(e)
+                continue
+            finally:
+                if not started:
+                    self.limiter.release()
+            if not started and attempt < retries:
+                self.limiter.on_throttle(EmptyResponseError())
+                continue
+            self.limiter.on_success()
+            return
+
+    async def _acall(self, messages: list[dict]) -> str:
+        if self.limiter is None:
+            return await self._acompletion(messages)
+        retries = self.limiter.max_retries
+        for attempt in range(retries + 1):
+            async with self.limiter.aslot():
+                try:
+                    res = await self._acompletion(messages)
+                    if not res:
+                        raise EmptyResponseError(f"empty response from {self.get_model()}")
+                except Exception as e:
+                    if not is_throttle(e) or attempt == retries:
+                        raise
+                    self.limiter.on_throttle(e)
+                    continue
+            self.limiter.on_success()
+            return res
+
+    async def _acall_stream(self, messages: list[dict]) -> AsyncIterator[str]:
+        if self.limiter is None:
+            async for chunk in self._acompletion_stream(messages):
+                yield chunk
+            return
+        retries = self.limiter.max_retries
+        for attempt in range(retries + 1):
+            started = False
+            await self.limiter.aacquire()
+            try:
+                async for chunk in self._acompletion_stream(messages):
+                    if not started:
+                        started = True
+                        # accepted, the rest of the stream doesn't hold a slot
+                        self.limiter.release()
+                    yield chunk
+            except Exception as e:
+                if started or not is_throttle(e) or attempt == retries:
+                    raise
+                self.limiter.on_throttle(e)
+                continue
+            finally:
+                if not started:
+                    self.limiter.release()
+            if not started and attempt < retries:
+                self.limiter.on_throttle(EmptyResponseError())
+                continue
+            self.limiter.on_success()
+            return
+
+    """
+        Provider hooks, messages is the full list of messages to send
+    """
+
     @abstractmethod
-    def completion(self, query: str) -> str:
+    def _completion(self, messages: list[dict]) -> str:
         pass
 
     @abstractmethod
-    def get_client(self):
+    def _completion_stream(self, messages: list[dict]) -> Iterator[str]:
         pass
 
     @abstractmethod
-    def get_model(self):
+    async def _acompletion(self, messages: list[dict]) -> str:
         pass
 
     @abstractmethod
-    def get_llm_config(self) -> LLMConfig:
+    def _acompletion_stream(self, messages: list[dict]) -> AsyncIterator[str]:
         pass
 
     @abstractmethod
-    def set_api(self, api: str) -> None:
+    def get_client(self):
         pass
 
     @abstractmethod
-    def clear_message(self):
+    def get_model(self):
         pass
 
     @abstractmethod
-    def completion_stream(self, message):
+    def get_llm_config(self) -> LLMConfig:
         pass
+
+    @abstractmethod
+    def set_api(self, api: str) -> None:
+        pass
+
+    def sampling_params(self, stream: bool) -> dict:
+        """
+        Sampling parameters sent to the provider, part of the cache key
+        """
+        return {}
+
+    def _span_attributes(self) -> dict:
+        return {"provider": type(self).__name__.lower(), "model": self.get_model()}
+
+    def _cache_key(self, messages: list[dict], stream: bool) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return self.cache.key(
+            type(self).__name__.lower(),
+            self.get_model(),
+            messages,
+            self.sampling_params(stream),
+        )
+
+    def _build_messages(self, query: str, history: Optional[list] = None):
+        messages = [self._to_message(m) for m in history or []]
+        messages.append({"role": "user", "content": query})
+        if self.history is not None:
+            messages, _ = self.history.fit(messages)
+        return messages
+
+    @staticmethod
+    def _to_message(message) -> dict:
+        if isinstance(message, dict):
+            return {"role": message["role"], "content": message["content"]}
+        # pydantic Message from the api layer
+        return {"role": message.role, "content": message.content}
+
+
+def _trace_call(s, messages: list[dict], response: str, cache_hit: bool):
+    """
+    Record the size of a call on its span, tokens are only counted when traced
+    """
+    if not s.recording:
+        return
+    s.set(
+        cache_hit=cache_hit,
+        messages=len(messages),
+        tokens_in=sum(message_tokens(m) for m in messages),
+        tokens_out=count_tokens(response or ""),
+    )
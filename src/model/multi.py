@@ -0,0 +1,278 @@
+"""
+Hedged and fallback requests across providers
+
+config.json can name an ordered list of providers instead of a single
+provider / model:
+    "providers": [
+        {"provider": "openai", "model": "meta-llama/llama-3.3-70b-instruct"},
+        {"provider": "deepseek", "model": "deepseek-chat"}
+    ],
+    "routing": "hedged",
+    "routing_options": {"timeout": 60, "min_delay": 0.3, "max_delay": 5}
+
+fallback: the next provider is tried when the previous one fails or times out
+hedged: the next provider is also queried when the previous one hasn't
+    produced a first token within its p95 latency, whichever answers first wins
+
+Sync calls can't be hedged without threads so they always use fallback.
+Every member goes through the limiter of its own provider.
+"""
+
+from .model import Model
+
+from collections import deque
+from typing import Callable, Optional
+
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+FALLBACK = "fallback"
+HEDGED = "hedged"
+
+
+class MultiModel(Model):
+    """
+    Args:
+        models: ordered list of models, the first one is the primary
+        mode: "fallback" or "hedged"
+        timeout: seconds to wait for a response (or a first token when streaming)
+        min_delay / max_delay: bounds of the hedging delay
+        initial_delay: hedging delay used until enough latency samples exist
+    """
+
+    def __init__(
+        self,
+        models: list[Model],
+        mode: str = FALLBACK,
+        timeout: float = 60,
+        min_delay: float = 0.3,
+        max_delay: float = 5,
+        initial_delay: float = 2,
+    ):
+        if not models:
+            raise ValueError("MultiModel needs at least one model")
+        if mode not in (FALLBACK, HEDGED):
+            raise ValueError(f"unknown routing mode {mode}")
+        self.models = models
+        self.mode = mode
+        self.timeout = timeout
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+
+        # (model index, stream) -> recent latencies of the first token
+        self._latency: dict = {}
+
+    def set_api(self, api):
+        return
+
+    def get_client(self):
+        return self.models[0].get_client()
+
+    def get_model(self):
+        return self.models[0].get_model()
+
+    def get_llm_config(self):
+        return self.models[0].get_llm_config()
+
+    def _completion(self, messages):
+        return self._fallback_sync(lambda m: m._call(messages))
+
+    def _completion_stream(self, messages):
+        last_error = None
+        for i, m in enumerate(self.models):
+            started = False
+            try:
+                for chunk in m._call_stream(messages):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise
+                last_error = e
+                logger.warning(f"{self._name(i)} failed, trying next provider: {e}")
+        raise last_error
+
+    async def _acompletion(self, messages):
+        call = lambda m: m._acall(messages)
+        if self.mode == HEDGED:
+            return await self._hedged(call)
+        return await self._fallback(call)
+
+    async def _acompletion_stream(self, messages):
+        gen, first, _ = await self._first_chunk(messages)
+        yield first
+        try:
+            async for chunk in gen:
+                yield chunk
+        finally:
+            await gen.aclose()
+
+    def latency_stats(self) -> list[dict]:
+        stats = []
+        for i, m in enumerate(self.models):
+            stats.append(
+                {
+                    "model": self._name(i),
+                    "p95": self._p95(i, False),
+                    "p95_first_token": self._p95(i, True),
+                }
+            )
+        return stats
+
+    def _fallback_sync(self, call: Callable):
+        last_error = None
+        for i, m in enumerate(self.models):
+            try:
+                return call(m)
+            except Exception as e:
+                last_error = e
+                logger.warning(f"{self._name(i)} failed, trying next provider: {e}")
+        raise last_error
+
+    async def _fallback(self, call: Callable):
+        last_error = None
+        for i, m in enumerate(self.models):
+            start = time.perf_counter()
+            try:
+                res = await asyncio.wait_for(call(m), timeout=self.timeout)
+                self._record(i, False, time.perf_counter() - start)
+                return res
+            except Exception as e:
+                last_error = e
+                logger.warning(f"{self._name(i)} failed, trying next provider: {e!r}")
+        raise last_error
+
+    async def _hedged(self, call: Callable):
+        """
+        Start the primary, launch the next model when the current one is
+        slower than its p95 or failed. First successful response wins.
+        """
+        pending: dict = {}
+        last_error = None
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            i = next_index
+            next_index += 1
+            pending[asyncio.create_task(self._timed(i, call))] = i
+
+        launch()
+        try:
+            while pending:
+                delay = None
+                if next_index < len(self.models):
+                    delay = self._hedge_delay(next_index - 1, False)
+                done, _ = await asyncio.wait(
+                    pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logger.info(f"hedging: {self._name(next_index)} after {delay:.2f}s")
+                    launch()
+                    continue
+                for task in done:
+                    i = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"{self._name(i)} failed: {last_error!r}")
+                if not pending and next_index < len(self.models):
+                    launch()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _timed(self, i: int, call: Callable):
+        start = time.perf_counter()
+        res = await asyncio.wait_for(call(self.models[i]), timeout=self.timeout)
+        self._record(i, False, time.perf_counter() - start)
+        return res
+
+    async def _first_chunk(self, messages):
+        """
+        Return (stream, first chunk, model index) of the stream that produced
+        a first token first. Other streams are closed.
+        """
+        pending: dict = {}
+        gens: dict = {}
+        last_error = None
+        next_index = 0
+
+        async def first(i):
+            start = time.perf_counter()
+            chunk = await asyncio.wait_for(anext(gens[i]), timeout=self.timeout)
+            self._record(i, True, time.perf_counter() - start)
+            return chunk
+
+        def launch():
+            nonlocal next_index
+            i = next_index
+            next_index += 1
+            gens[i] = self.models[i]._acall_stream(messages)
+            pending[asyncio.create_task(first(i))] = i
+
+        launch()
+        winner = None
+        try:
+            while pending:
+                delay = None
+                if self.mode == HEDGED and next_index < len(self.models):
+                    delay = self._hedge_delay(next_index - 1, True)
+                done, _ = await asyncio.wait(
+                    pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logger.info(f"hedging: {self._name(next_index)} after {delay:.2f}s")
+                    launch()
+                    continue
+                for task in done:
+                    i = pending.pop(task)
+                    if task.exception() is None:
+                        winner = i
+                        return gens[i], task.result(), i
+                    last_error = task.exception()
+                    logger.warning(f"{self._name(i)} failed: {last_error!r}")
+                if not pending and next_index < len(self.models):
+                    launch()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+            # wait for the cancellation before closing the generators
+            await asyncio.gather(*pending, return_exceptions=True)
+            for i, gen in gens.items():
+                if i != winner:
+                    await _close(gen)
+
+    def _record(self, i: int, stream: bool, latency: float):
+        self._latency.setdefault((i, stream), deque(maxlen=100)).append(latency)
+
+    def _p95(self, i: int, stream: bool) -> Optional[float]:
+        samples = self._latency.get((i, stream))
+        if not samples or len(samples) < 5:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def _hedge_delay(self, i: int, stream: bool) -> float:
+        p95 = self._p95(i, stream)
+        if p95 is None:
+            return self.initial_delay
+        return min(self.max_delay, max(self.min_delay, p95))
+
+    def _name(self, i: int) -> str:
+        m = self.models[i]
+        return f"{type(m).__name__.lower()}/{m.get_model()}"
+
+
+async def _close(gen):
+    try:
+        await gen.aclose()
+    except Exception:
+        pass
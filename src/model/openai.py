@@ -1,7 +1,7 @@
 from .model import Model
+from .client import openai_client, async_openai_client
 from ..utils import read_config
 
-from openai import OpenAI as openai
 from dotenv import load_dotenv
 
 from crawl4ai import LLMConfig
@@ -19,41 +19,31 @@ class OpenAI(Model):
         self.api_key = os.getenv("OPENAI_API_KEY")
 
         config = read_config()
-        if config.get("base_url", "") == "":
-            self.client = openai(
-                api_key=self.api_key,
-            )
-        else:
-            self.client = openai(
-                api_key=self.api_key, base_url=config.get("base_url", "")
-            )
+        self.base_url = config.get("base_url", "")
+        self.client = openai_client(self.api_key, self.base_url)
+        self.aclient = async_openai_client(self.api_key, self.base_url)
 
         self.model = model
-        self.messages = []
 
     def set_api(self, api_key: str):
         self.api_key = api_key
 
-    def completion(self, query):
-        self._add_message(query)
+    def _completion(self, messages):
         response = self.client.chat.completions.create(
-            model=self.model, messages=self.messages, stream=False
+            model=self.model, messages=messages, stream=False
         )
-        while not response.choices:
-            response = self.client.chat.completions.create(
-                model=self.model, messages=self.messages, stream=False
-            )
+        if not response.choices:
+            # silent throttle, the limiter backs off and retries
+            return ""
         return response.choices[0].message.content
 
-    def completion_stream(self, message):
-        self._add_message(message=message, role="user")
-
+    def _completion_stream(self, messages):
         try:
             stream = self.client.chat.completions.create(
                 model=self.model,
-                messages=self.messages,
+                messages=messages,
                 stream=True,
-                temperature=0.7,
+                **self.sampling_params(stream=True),
                 extra_body={
                     "provider": {
                         "order": ["cerebras","groq"], 
@@ -91,6 +81,61 @@ class OpenAI(Model):
             logger.error(f"Stream error: {e}")
             raise
 
+    async def _acompletion(self, messages):
+        response = await self.aclient.chat.completions.create(
+            model=self.model, messages=messages, stream=False
+        )
+        if not response.choices:
+            return ""
+        return response.choices[0].message.content
+
+    async def _acompletion_stream(self, messages):
+        try:
+            stream = await self.aclient.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                stream=True,
+                **self.sampling_params(stream=True),
+                extra_body={
+                    "provider": {
+                        "order": ["cerebras","groq"], 
+                        "allow_fallbacks": True
+                    }
+                }
+            )
+
+            buffer = []
+            buffer_size = 3  # smaller buffer for faster yield
+
+            async for event in stream:
+                if not event.choices:
+                    continue
+
+                choice = event.choices[0]
+
+                if hasattr(choice, "finish_reason") and choice.finish_reason:
+                    if buffer:
+                        yield "".join(buffer)
+                    break
+
+                content = getattr(choice.delta, "content", None)
+                if content:
+                    buffer.append(content)
+
+                    if len(buffer) >= buffer_size:
+                        yield "".join(buffer)
+                        buffer = []
+
+            if buffer:
+                yield "".join(buffer)
+
+        except Exception as e:
+            logger.error(f"Stream error: {e}")
+            raise
+
+    def sampling_params(self, stream: bool) -> dict:
+        return {"temperature": 0.7} if stream else {}
+
     def add_system_instructuion(self, instruction: str):
         pass
 
@@ -102,12 +147,3 @@ class OpenAI(Model):
 
     def get_model(self):
         return self.model
-
-    def clear_message(self):
-        self.messages = []
-
-    def _add_message(self, message, role="user"):
-        max_history = 20
-        self.messages.append({"role": role, "content": message})
-        if len(self.messages) > max_history:
-            self.messages = self.messages[-max_history:]
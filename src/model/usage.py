@@ -0,0 +1,82 @@
+"""
+LLM usage accounting
+
+A UsageTracker set with track_usage() counts every model call made by the
+current task and the tasks it starts, the workflow Server uses it to put a
+budget on the number of calls and tokens of a report. Cache hits are free.
+Tokens are estimated with the tokenizer of history.py, prompt and response.
+"""
+
+from .history import count_tokens, message_tokens
+
+from contextvars import ContextVar
+from typing import Optional
+
+import threading
+
+
+class UsageLimitExceeded(RuntimeError):
+    pass
+
+
+class UsageTracker:
+    """
+    Args:
+        max_calls: maximum number of LLM calls, None for no limit
+        max_tokens: maximum number of prompt + response tokens, None for no limit
+    """
+
+    def __init__(self, max_calls: Optional[int] = None, max_tokens: Optional[int] = None):
+        self.max_calls = max_calls
+        self.max_tokens = max_tokens
+        self.calls = 0
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def exceeded(self) -> Optional[str]:
+        """
+        Reason the budget is exhausted, None if it isn't
+        """
+        if self.max_calls is not None and self.calls >= self.max_calls:
+            return f"LLM call budget of {self.max_calls} calls exhausted"
+        if self.max_tokens is not None and self.tokens >= self.max_tokens:
+            return f"token budget of {self.max_tokens} tokens exhausted"
+        return None
+
+    def check(self):
+        reason = self.exceeded()
+        if reason is not None:
+            raise UsageLimitExceeded(reason)
+
+    def record(self, messages: list[dict], response: str):
+        tokens = sum(message_tokens(m) for m in messages) + count_tokens(response or "")
+        with self._lock:
+            self.calls += 1
+            self.tokens += tokens
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "tokens": self.tokens,
+            "max_calls": self.max_calls,
+            "max_tokens": self.max_tokens,
+        }
+
+
+_usage: ContextVar[Optional[UsageTracker]] = ContextVar("llm_usage", default=None)
+
+
+def track_usage(tracker: Optional[UsageTracker]):
+    """
+    Account the model calls of the current context to tracker, None stops
+    the accounting. Return a token for reset_usage.
+    """
+    return _usage.set(tracker)
+
+
+def reset_usage(token):
+    _usage.reset(token)
+
+
+def current_usage() -> Optional[UsageTracker]:
+    return _usage.get()
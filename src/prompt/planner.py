@@ -16,13 +16,18 @@ def planner_agent_prompt(
     - Use search agents only if updated info would help
     - Call reporter agent only once for final report
     - Each subtask must be specific
+    - Give every subtask an id, depends_on lists the ids of the subtasks whose results it needs
+    - Subtasks that don't need each other's results must not depend on each other, they run in parallel
+    - The reporter depends on every other subtask
 
     REQUIRED FORMAT (exact JSON):
     ```json
     [
         {{
+            "id": "<short id, e.g. 1>",
             "task": "<specific subtask>",
-            "agent": "<assigned agent>"
+            "agent": "<assigned agent>",
+            "depends_on": ["<ids of required subtasks>"]
         }}
     ]
     ```
@@ -7,3 +7,6 @@ for deatil of router please check router.py
 
 from .router import Router
 from .server import Server
+from . import events
+from .budget import Budget
+from .checkpoint import CheckpointStore, get_checkpoint_store
@@ -0,0 +1,102 @@
+"""
+Limits of a workflow, enforced by the Server
+
+    agent_timeout: seconds an agent may run for one task
+    agent_timeouts: per agent override, e.g. {"search": 600}
+    workflow_timeout: seconds for the whole report
+    max_hops: maximum number of agent / planner hops
+    max_llm_calls, max_tokens: LLM budget of the whole report
+
+When the workflow deadline, the hop limit or the LLM budget is hit the
+workflow degrades to the reporter with the data collected so far. An agent
+that times out is skipped.
+
+Configured in config.json:
+    "limits": {"agent_timeout": 300, "workflow_timeout": 1200, "max_hops": 50}
+"""
+
+from ..model.usage import UsageTracker
+
+from typing import Optional
+
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# keys of the "limits" section of config.json
+_KEYS = (
+    "agent_timeout",
+    "agent_timeouts",
+    "workflow_timeout",
+    "max_hops",
+    "max_llm_calls",
+    "max_tokens",
+)
+
+
+class Budget:
+    def __init__(
+        self,
+        agent_timeout: Optional[float] = 300,
+        agent_timeouts: Optional[dict] = None,
+        workflow_timeout: Optional[float] = 1200,
+        max_hops: Optional[int] = 50,
+        max_llm_calls: Optional[int] = 200,
+        max_tokens: Optional[int] = 1_000_000,
+    ):
+        self.agent_timeout = agent_timeout
+        self.agent_timeouts = agent_timeouts or {}
+        self.workflow_timeout = workflow_timeout
+        self.max_hops = max_hops
+        self.usage = UsageTracker(max_calls=max_llm_calls, max_tokens=max_tokens)
+
+        self.hops = 0
+        self.deadline: Optional[float] = None
+
+    @staticmethod
+    def from_config(conf: dict) -> "Budget":
+        unknown = set(conf) - set(_KEYS)
+        if unknown:
+            logger.warning(f"unknown limits in config.json: {sorted(unknown)}")
+        return Budget(**{k: v for k, v in conf.items() if k in _KEYS})
+
+    def start(self):
+        if self.workflow_timeout is not None:
+            self.deadline = time.monotonic() + self.workflow_timeout
+
+    def remaining(self) -> Optional[float]:
+        """
+        Seconds left before the workflow deadline, None without deadline
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def timeout_for(self, agent: str, deadline: bool = True) -> Optional[float]:
+        """
+        Timeout of one task of agent, bounded by the workflow deadline
+        """
+        timeout = self.agent_timeouts.get(agent, self.agent_timeout)
+        remaining = self.remaining() if deadline else None
+        if timeout is None:
+            return remaining
+        if remaining is None:
+            return timeout
+        return min(timeout, remaining)
+
+    def hop(self):
+        self.hops += 1
+
+    def exceeded(self) -> Optional[str]:
+        """
+        Reason the workflow has to stop, None if it can go on
+        """
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return f"workflow deadline of {self.workflow_timeout}s reached"
+        if self.max_hops is not None and self.hops >= self.max_hops:
+            return f"maximum of {self.max_hops} hops reached"
+        return self.usage.exceeded()
+
+    def stats(self) -> dict:
+        return {"hops": self.hops, "remaining": self.remaining(), **self.usage.stats()}
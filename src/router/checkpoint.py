@@ -0,0 +1,82 @@
+"""
+Checkpoints of report workflows
+
+After every hop the Server saves the plan, the completed steps and the data
+collected so far under the run id, a new one for every request. A run
+interrupted by a restart or a failing agent can be resumed by passing its
+run id to resume_report (or generate_report), completed steps are skipped.
+
+Configured in config.json:
+    "checkpoint": {"enabled": true, "path": "./tmp/checkpoints.db", "ttl": 86400}
+"""
+
+from ..utils import read_config, DiskCache
+
+from typing import Optional
+
+import json
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(obj):
+    # documents (Data_row) are saved as the dicts they were built from
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    return str(obj)
+
+
+class CheckpointStore:
+    """
+    Args:
+        path: sqlite file of the checkpoints
+        ttl: seconds a checkpoint can be resumed
+    """
+
+    def __init__(self, path: str = "./tmp/checkpoints.db", ttl: float = 24 * 60 * 60):
+        self.disk = DiskCache(path, max_bytes=1024 * 1024 * 1024, ttl=ttl)
+
+    def save(self, run_id: str, state: dict):
+        self.disk.set(run_id, json.dumps(state, ensure_ascii=False, default=_encode).encode("utf-8"))
+
+    def load(self, run_id: str) -> Optional[dict]:
+        raw = self.disk.get(run_id)
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            logger.warning(f"corrupted checkpoint {run_id}")
+            self.disk.delete(run_id)
+            return None
+
+    def delete(self, run_id: str):
+        self.disk.delete(run_id)
+
+
+_store: Optional[CheckpointStore] = None
+_store_lock = threading.Lock()
+
+
+def get_checkpoint_store() -> Optional[CheckpointStore]:
+    """
+    Return the process wide checkpoint store or None if it is disabled
+    """
+    global _store
+    if _store is not None:
+        return _store
+    try:
+        conf = read_config().get("checkpoint", {})
+    except Exception:
+        conf = {}
+    if not conf.get("enabled", True):
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = CheckpointStore(
+                path=conf.get("path", "./tmp/checkpoints.db"),
+                ttl=conf.get("ttl", 24 * 60 * 60),
+            )
+    return _store
@@ -0,0 +1,105 @@
+"""
+Progress events of a workflow
+
+Server.stream yields these events while the report is being written.
+Agents can publish their own events with emit(), they are forwarded to the
+stream of the workflow running them and ignored outside a stream.
+"""
+
+from contextvars import ContextVar
+from typing import Any, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+import asyncio
+import time
+
+
+class Event(BaseModel):
+    type: str
+    time: float = Field(default_factory=time.time)
+
+    def sse(self) -> str:
+        """
+        Server sent event encoding
+        """
+        return f"event: {self.type}\ndata: {self.model_dump_json()}\n\n"
+
+
+class PlanCreated(Event):
+    type: Literal["plan_created"] = "plan_created"
+    tasks: list[dict]
+
+
+class AgentStarted(Event):
+    type: Literal["agent_started"] = "agent_started"
+    agent: str
+    task: str
+    id: Optional[str] = None
+
+
+class AgentFinished(Event):
+    type: Literal["agent_finished"] = "agent_finished"
+    agent: str
+    task: str
+    id: Optional[str] = None
+    seconds: float
+
+
+class AgentFailed(Event):
+    type: Literal["agent_failed"] = "agent_failed"
+    agent: str
+    task: str
+    id: Optional[str] = None
+    reason: str
+
+
+class BudgetExceeded(Event):
+    type: Literal["budget_exceeded"] = "budget_exceeded"
+    reason: str
+
+
+class TasksSkipped(Event):
+    type: Literal["tasks_skipped"] = "tasks_skipped"
+    ids: list[str]
+    coverage: float
+    seconds_saved: Optional[float] = None
+
+
+class SourcesFound(Event):
+    type: Literal["sources_found"] = "sources_found"
+    agent: str
+    sources: list[dict]  # [{"title": ..., "url": ...}]
+
+
+class SectionWritten(Event):
+    type: Literal["section_written"] = "section_written"
+    index: int
+    content: str
+
+
+class WorkflowDone(Event):
+    type: Literal["done"] = "done"
+    seconds: float
+    result: Any = None
+
+
+class WorkflowError(Event):
+    type: Literal["error"] = "error"
+    message: str
+
+
+_sink: ContextVar[Optional[asyncio.Queue]] = ContextVar("event_sink", default=None)
+
+
+def emit(event: Event):
+    """
+    Publish an event to the workflow stream of the current task, if any
+    """
+    queue = _sink.get()
+    if queue is not None:
+        queue.put_nowait(event)
+
+
+def set_sink(queue: Optional[asyncio.Queue]):
+    return _sink.set(queue)
@@ -8,6 +8,7 @@ Agent<-->Router<--> Server <--> Router <--> Agent
 
 from .server import Server
 from ..agent.agent import Agent
+from ..utils.tracing import span
 
 from pydantic import BaseModel
 
@@ -38,7 +39,10 @@ class Router(object):
         An agent receive the message from other agent
         use the run function and send it back to server
         """
-        res = await self.agent.run(message, data)
+        with span("agent", agent=self.agent.name, task=str(message)[:200]) as s:
+            res = await self.agent.run(message, data)
+            if isinstance(res, dict):
+                s.set(next_agent=res.get("agent"), documents=len(res.get("data") or []))
         return self.send_response(res)
 
     def set_send_format(self, s: BaseModel):
@@ -1,10 +1,32 @@
 from __future__ import annotations
 
 
+from .events import (
+    emit,
+    set_sink,
+    AgentStarted,
+    AgentFinished,
+    AgentFailed,
+    BudgetExceeded,
+    SourcesFound,
+    WorkflowDone,
+    WorkflowError,
+)
+from .budget import Budget
+from ..model.usage import UsageLimitExceeded, track_usage, reset_usage
+from ..agent.model import DocumentStore
+from ..agent.context import start_run
+from ..utils.tracing import start_trace, finish_trace
+
+import asyncio
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# the agent writing the final report, the workflow degrades to it when a limit is hit
+REPORTER = "reporter"
+
 
 class Server:
     """
@@ -27,12 +49,31 @@ class Server:
             state 3: enough content --> action return summary
     """
 
-    def __init__(self):
+    def __init__(
+        self, fan_out: int = 1, checkpoint=None, run_id: str = "", budget: Budget = None
+    ):
+        """
+        fan_out: maximum number of tasks running at the same time, with more
+            than one the plan is run as a dependency graph (see start_parallel)
+        checkpoint: CheckpointStore (see checkpoint.py), the state is saved
+            under run_id after every hop
+        budget: timeouts, hop and LLM limits of the workflow (see budget.py)
+        """
         self.routers: dict = {}
         self.router_list: list = []
         self.initial_router: str = ""
         self.next_router = None
-        self.data = []
+        self.data = DocumentStore()
+        self.fan_out = fan_out
+        self._agent_locks: dict = {}
+
+        self.checkpoint = checkpoint
+        self.run_id = run_id
+        self.query = ""
+        self._done: set = set()  # ids of the completed tasks
+        self._outputs: dict = {}  # task id -> data, parallel runs only
+        self._seen_sources: set = set()
+        self.budget = budget if budget is not None else Budget()
 
     def recv_message(self):
         pass
@@ -41,16 +82,346 @@ class Server:
         """
         start the workflow
         """
-        self.next_router = self.routers[self.initial_router]
+        async for event in self.stream(query):
+            if isinstance(event, WorkflowDone):
+                return event.result
+
+    async def stream(self, query: str):
+        """
+        start the workflow and yield its progress events (see events.py)
+        the last event is WorkflowDone with the final message as result, or
+        WorkflowError right before the error is raised
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        start = time.perf_counter()
+
+        async def run():
+            set_sink(queue)
+            # every hop, LLM call and fetch of the workflow is traced (see utils/tracing.py)
+            # the trace has its own id, runs of the same run_id don't overwrite it
+            trace = start_trace(
+                "report", run_id=self.run_id, query=query, fan_out=self.fan_out
+            )
+            try:
+                result = self._result(await self._run(query))
+                if trace is not None:
+                    trace.root.set(**self.budget.stats())
+                await finish_trace(trace)
+                queue.put_nowait(
+                    WorkflowDone(seconds=time.perf_counter() - start, result=result)
+                )
+            except BaseException as e:
+                await finish_trace(trace, e)
+                if isinstance(e, Exception):
+                    queue.put_nowait(WorkflowError(message=str(e)))
+                raise
+
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event = await queue.get()
+                yield event
+                if isinstance(event, (WorkflowDone, WorkflowError)):
+                    break
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+
+    async def _run(self, query: str):
+        self.query = query
+        # agents are shared between reports, their state of this one
+        start_run(self.run_id)
+        self.budget.start()
+        # account every LLM call of the workflow to its budget
+        track_usage(self.budget.usage)
+        planner = self.routers[self.initial_router].agent
+        try:
+            if self.fan_out > 1 and hasattr(planner, "ready_tasks"):
+                return await self.start_parallel(query)
+            return await self.start_sequential(query)
+        finally:
+            # the rest of a streamed plan would only spend tokens
+            if hasattr(planner, "close"):
+                await planner.close()
+
+    async def start_sequential(self, query: str):
+        """
+        Run the plan one task after the other, every agent goes back to the planner
+        """
+        planner_router = self.routers[self.initial_router]
+        self.next_router = planner_router
+        current = None  # id of the task being run by an agent
         logger.info("server start ... ")
 
         while True:
-            query = await self.next_router.recv_response(query, self.data)
+            reason = self.budget.exceeded()
+            if reason is not None:
+                return await self._degrade(reason, self.data)
+            self.budget.hop()
+
+            try:
+                if self.next_router is not planner_router:
+                    msg = await self._call_agent(self.next_router, query, self.data, current)
+                    if current is not None:
+                        self._done.add(current)
+                else:
+                    msg = await asyncio.wait_for(
+                        self.next_router.recv_response(query, self.data),
+                        timeout=self.budget.timeout_for(self.initial_router),
+                    )
+            except asyncio.TimeoutError:
+                return await self._degrade("planner timed out", self.data)
+            except UsageLimitExceeded as e:
+                return await self._degrade(str(e), self.data)
+
+            query = msg
             logger.info(f"handling new task {self.next_router} , {query}")
             if self.check_response(query):
+                await self._clear_checkpoint()
                 return query
 
+            current = query.get("id")
             self.next_router, query, self.data = self.query_handler(query)
+            await self._save_checkpoint()
+
+    async def start_parallel(self, query: str):
+        """
+        Run the plan as a dependency graph
+        every task whose dependencies are done is started, up to fan_out at
+        once, and receives the merged data of the tasks it depends on. The
+        workflow ends when an agent terminates (the reporter) or the plan is
+        exhausted.
+        """
+        planner = self.routers[self.initial_router].agent
+        logger.info(f"server start ... fan out {self.fan_out}")
+        if not planner.initialize:
+            await planner.start_plan()
+
+        outputs = self._outputs
+        done = self._done
+        running: dict = {}  # asyncio task -> planner task
+        waiter = None
+        reason = None  # set when a limit stops the workflow
+        try:
+            while reason is None:
+                reason = self.budget.exceeded()
+                if reason is not None:
+                    break
+
+                version = planner.plan_version()
+                ready = planner.ready_tasks(done, self.fan_out - len(running))
+                if not ready and not running and planner.plan_done():
+                    ready = planner.ready_tasks(done, 1, force=True)
+                    if not ready:
+                        break
+
+                for task in ready:
+                    # a skipped dependency passes on the data of its own dependencies
+                    branches = [
+                        outputs[d]
+                        for d in planner.resolve_dependencies(task.depends_on)
+                        if d in outputs
+                    ]
+                    data = self.merge_data(branches) if branches else self.data.copy()
+                    logger.info(f"handling task {task.id} {task.agent}: {task.task}")
+                    self.budget.hop()
+                    running[asyncio.create_task(self._run_task(task, data))] = task
+
+                if waiter is not None:
+                    waiter.cancel()
+                    waiter = None
+                wait_on = set(running)
+                if not planner.plan_done():
+                    waiter = asyncio.create_task(planner.wait_plan(version))
+                    wait_on.add(waiter)
+                if not wait_on:
+                    continue
+
+                finished, _ = await asyncio.wait(
+                    wait_on,
+                    timeout=self.budget.remaining(),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for t in finished:
+                    if t is waiter:
+                        waiter = None
+                        continue
+                    task = running.pop(t)
+                    try:
+                        msg = t.result()
+                    except UsageLimitExceeded as e:
+                        # keep the outputs of the other tasks finished in
+                        # this wait, the loop stops after them
+                        reason = str(e)
+                        continue
+                    done.add(task.id)
+                    logger.info(f"task {task.id} finished")
+                    if self.check_response(msg):
+                        await self._clear_checkpoint()
+                        return msg
+                    await planner.task_done(msg, task.id)
+                    outputs[task.id] = msg["data"]
+                    await self._save_checkpoint()
+        finally:
+            for t in running:
+                t.cancel()
+            if waiter is not None:
+                waiter.cancel()
+            # collect the cancelled tasks so their errors aren't reported as lost
+            await asyncio.gather(*running, return_exceptions=True)
+
+        self.data = self.merge_data([self.data] + list(outputs.values()))
+        if reason is not None:
+            return await self._degrade(reason, self.data)
+
+        logger.info("plan finished")
+        await self._clear_checkpoint()
+        return {"agent": "TERMINATE", "task": "TERMINATE", "data": self.data}
+
+    @staticmethod
+    def _result(msg):
+        """
+        The final message leaves the workflow as plain json, the documents of
+        a run that ended without a report are converted to dicts
+        """
+        if isinstance(msg, dict) and isinstance(msg.get("data"), DocumentStore):
+            msg = {**msg, "data": msg["data"].to_list()}
+        return msg
+
+    async def _degrade(self, reason: str, data: list):
+        """
+        A limit was hit, write the report with the data collected so far
+        """
+        logger.warning(f"{reason}, writing the report with the data collected so far")
+        emit(BudgetExceeded(reason=reason))
+        msg = None
+        reporter = self.routers.get(REPORTER)
+        if reporter is not None:
+            msg = await self._call_agent(reporter, self.query, data, grace=True)
+        if msg is None or not self.check_response(msg):
+            msg = {"agent": "TERMINATE", "task": "TERMINATE", "data": data}
+        await self._clear_checkpoint()
+        return msg
+
+    async def _call_agent(self, router, task: str, data: list, id=None, grace=False):
+        """
+        Run one task of an agent within its timeout
+        an agent that times out is skipped, the data is passed on unchanged
+        grace: ignore the workflow deadline (final report after a limit was hit)
+        """
+        name = router.agent.name
+        emit(AgentStarted(agent=name, task=task, id=id))
+        started = time.perf_counter()
+        # the final report must be written even though the budget is spent
+        token = track_usage(None) if grace else None
+        try:
+            msg = await asyncio.wait_for(
+                router.recv_response(task, data),
+                timeout=self.budget.timeout_for(name, deadline=not grace),
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"{name} timed out on {task}")
+            emit(AgentFailed(agent=name, task=task, id=id, reason="timeout"))
+            return None if grace else {"agent": "planner", "data": data, "task": ""}
+        finally:
+            if token is not None:
+                reset_usage(token)
+        emit(
+            AgentFinished(
+                agent=name,
+                task=task,
+                id=id,
+                seconds=time.perf_counter() - started,
+            )
+        )
+        self._emit_sources(name, msg.get("data"))
+        return msg
+
+    def restore(self, state: dict):
+        """
+        Continue from a checkpoint, the planner must be restored too
+        (Planner.restore_plan)
+        """
+        self.query = state.get("query", "")
+        self.data = DocumentStore.from_data(state.get("data", []))
+        self._outputs = {
+            id: DocumentStore.from_data(data)
+            for id, data in state.get("outputs", {}).items()
+        }
+        self._done = set(state.get("done", []))
+
+    async def _save_checkpoint(self):
+        if self.checkpoint is None or not self.run_id:
+            return
+        planner = self.routers[self.initial_router].agent
+        if not hasattr(planner, "plan_snapshot"):
+            return
+        state = {
+            "query": self.query,
+            "plan": planner.plan_snapshot(),
+            "plan_done": planner.plan_done(),
+            "done": sorted(self._done),
+            "data": self.data if self.fan_out <= 1 else [],
+            "outputs": self._outputs,
+        }
+        try:
+            await asyncio.to_thread(self.checkpoint.save, self.run_id, state)
+        except Exception as e:
+            # a checkpoint is best effort, never fail the report because of it
+            logger.warning(f"failed to save checkpoint {self.run_id}: {e}")
+
+    async def _clear_checkpoint(self):
+        if self.checkpoint is None or not self.run_id:
+            return
+        await asyncio.to_thread(self.checkpoint.delete, self.run_id)
+
+    async def _run_task(self, task, data: list):
+        router = self.routers.get(task.agent)
+        if router is None:
+            logger.warning(f"unknown agent {task.agent}, skipping task {task.id}")
+            return {"agent": "planner", "data": data, "task": ""}
+        lock = self._agent_lock(task.agent, router.agent)
+        if lock is None:
+            return await self._call_agent(router, task.task, data, task.id)
+        async with lock:
+            return await self._call_agent(router, task.task, data, task.id)
+
+    def _agent_lock(self, name: str, agent):
+        """
+        Lock of an agent keeping per run state (see agent/context.py), two
+        of its tasks at once would mix that state. Agents without state
+        (new_state() is None) run their tasks at the same time
+        """
+        if name not in self._agent_locks:
+            new_state = getattr(agent, "new_state", None)
+            stateful = new_state is not None and new_state() is not None
+            self._agent_locks[name] = asyncio.Lock() if stateful else None
+        return self._agent_locks[name]
+
+    def _emit_sources(self, agent: str, data):
+        """
+        Publish the documents with an url that weren't seen before
+        """
+        if not isinstance(data, list):
+            return
+        sources = []
+        for d in data:
+            url = d.get("url") if hasattr(d, "get") else None
+            if not url or url in self._seen_sources:
+                continue
+            self._seen_sources.add(url)
+            sources.append({"title": d.get("title", ""), "url": url})
+        if sources:
+            emit(SourcesFound(agent=agent, sources=sources))
+
+    @staticmethod
+    def merge_data(branches: list) -> DocumentStore:
+        """
+        Merge the data of parallel branches, documents seen in several
+        branches (same url or same content) are kept once
+        """
+        return DocumentStore.merge(branches)
 
     def query_handler(self, query: dict):
         """
@@ -64,7 +435,11 @@ class Server:
 
         }
         """
-        return self.routers[query["agent"]], query["task"], query["data"]
+        return (
+            self.routers[query["agent"]],
+            query["task"],
+            DocumentStore.from_data(query["data"]),
+        )
 
     def check_response(self, msg: dict):
         """
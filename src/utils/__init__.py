@@ -1 +1,5 @@
 from .config import read_config, write_config
+from .cache import LRUCache, DiskCache
+from .json_stream import JsonArrayStream
+from .url import canonical_url
+from .tracing import span, start_trace, finish_trace, current_span, current_trace, get_trace_store
@@ -0,0 +1,268 @@
+"""
+Generic caches shared by the model, agent and browser layers
+    LRUCache: in memory, bounded by entries (and optionally bytes) with TTL
+    DiskCache: sqlite backed, bounded by bytes with TTL, survives restarts
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+import os
+import sqlite3
+import threading
+import time
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread safe LRU cache with optional TTL and byte budget
+    Args:
+        max_entries: maximum number of entries kept
+        ttl: default time to live in seconds, None means never expire
+        max_bytes: optional byte budget, requires sizeof
+        sizeof: function returning the size of a value in bytes
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda v: 0)
+
+        # key -> (value, expires_at, size)
+        self._data: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at, _ = item
+            if expires_at is not None and expires_at < time.time():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        """
+        Return (value, expires_at) without touching LRU order, stats or expiry
+        """
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            return item[0], item[1]
+
+    def items(self) -> list:
+        """
+        Return the (key, value) pairs not expired, without touching LRU order or stats
+        """
+        now = time.time()
+        with self._lock:
+            return [
+                (key, value)
+                for key, (value, expires_at, _) in self._data.items()
+                if expires_at is None or expires_at >= now
+            ]
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.time() + ttl
+        size = self._sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __contains__(self, key):
+        return self.peek(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _remove(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        while len(self._data) > self.max_entries or (
+            self.max_bytes is not None
+            and self._bytes > self.max_bytes
+            and len(self._data) > 1
+        ):
+            key = next(iter(self._data))
+            self._remove(key)
+            self.evictions += 1
+
+
+class DiskCache:
+    """
+    sqlite backed cache with TTL and size based LRU eviction
+    Values are bytes, callers decide how to serialise them
+    Args:
+        path: sqlite file path
+        max_bytes: total size of values kept on disk
+        ttl: default time to live in seconds, None means never expire
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl: Optional[float] = None,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)"
+        )
+        self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = None if ttl is None else now + ttl
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), expires_at, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _evict(self, now: float):
+        cur = self._conn.execute(
+            "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at < ?",
+            (now,),
+        )
+        self.evictions += cur.rowcount
+        (size,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if size <= self.max_bytes:
+            return
+        # drop least recently used entries until we fit in the budget
+        rows = self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at ASC"
+        ).fetchall()
+        victims = []
+        for key, s in rows:
+            if size <= self.max_bytes:
+                break
+            victims.append((key,))
+            size -= s
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        self.evictions += len(victims)
@@ -0,0 +1,37 @@
+"""
+Sentence embeddings shared across the project
+
+Reuses the MiniLM model loaded by api/controller/extraction.py so the model is
+only loaded once per process. sentence-transformers is optional, when it is
+not installed encode returns None and callers fall back to exact matching.
+"""
+
+from typing import Optional
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_available: Optional[bool] = None
+
+
+def encode(texts: list[str]) -> Optional[np.ndarray]:
+    """
+    Encode texts to L2 normalised embeddings (one row per text)
+    This is CPU bound, call it with asyncio.to_thread inside the event loop
+    """
+    global _available
+    if _available is False:
+        return None
+    try:
+        from ..api.controller.extraction import get_model
+    except ImportError as e:
+        logger.warning(f"sentence-transformers not available: {e}")
+        _available = False
+        return None
+    _available = True
+    return get_model().encode(
+        texts, show_progress_bar=False, batch_size=32, normalize_embeddings=True
+    )
@@ -0,0 +1,84 @@
+"""
+Incremental parser for a JSON array written chunk by chunk by a model
+
+    parser = JsonArrayStream()
+    async for chunk in model.acompletion_stream(prompt):
+        for obj in parser.feed(chunk):
+            ...
+
+Each element of the first top level array is returned as soon as it is
+complete, text around the array (markdown fences, explanations) is ignored.
+Elements may also be written as python literals with single quotes.
+"""
+
+from typing import Any
+
+import ast
+import json
+
+
+class JsonArrayStream:
+    def __init__(self):
+        self.started = False  # the opening [ was seen
+        self.finished = False  # the closing ] was seen
+        self.count = 0  # elements returned so far
+
+        self._depth = 0  # nesting inside the array, 0 means between elements
+        self._quote = None  # quote char of the string being read
+        self._escape = False
+        self._element: list[str] = []
+
+    def feed(self, text: str) -> list[Any]:
+        """
+        Consume a chunk, return the elements completed by it
+        """
+        elements = []
+        for char in text:
+            if self.finished:
+                break
+            if not self.started:
+                if char == "[":
+                    self.started = True
+                continue
+
+            if self._depth:
+                self._element.append(char)
+
+            if self._quote is not None:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == self._quote:
+                    self._quote = None
+                continue
+
+            if char in "\"'" and self._depth:
+                self._quote = char
+            elif char in "{[":
+                if not self._depth:
+                    self._element = [char]
+                self._depth += 1
+            elif char in "}]":
+                if not self._depth:
+                    # closing bracket of the array itself
+                    self.finished = True
+                    continue
+                self._depth -= 1
+                if not self._depth:
+                    element = self._parse("".join(self._element))
+                    self._element = []
+                    if element is not None:
+                        self.count += 1
+                        elements.append(element)
+        return elements
+
+    @staticmethod
+    def _parse(text: str):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            try:
+                return ast.literal_eval(text)
+            except Exception:
+                return None
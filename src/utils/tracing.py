@@ -0,0 +1,352 @@
+"""
+In process tracing
+
+A trace is opened for every report (Server.stream), the workflow hops, LLM
+calls, page fetches, crawls and vector searches made while it runs open
+spans in it with their timing and a few attributes (tokens, bytes, cache
+hit ...). Outside a trace span() costs next to nothing and records nothing.
+
+    trace = start_trace("report", run_id=run_id)
+    with span("llm", model="gpt") as s:
+        ...
+        s.set(tokens_out=12)
+    await finish_trace(trace)
+
+Every trace gets its own id, attributes like run_id only describe it.
+
+Finished traces are kept in memory and written to a folder as JSONL (one
+span per line) and Chrome trace events (open with chrome://tracing or
+https://ui.perfetto.dev). Only the last keep traces are kept, in memory and
+in the folder, older files are deleted.
+
+Configured in config.json:
+    "tracing": {"enabled": true, "path": "./tmp/traces", "keep": 50}
+"""
+
+from .config import read_config
+
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Optional
+
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ("trace", "name", "id", "parent_id", "start", "end", "lane", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.lane = _lane()
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def recording(self) -> bool:
+        return True
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, error: Optional[BaseException] = None):
+        if self.end is not None:
+            return
+        self.end = time.perf_counter()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.trace._add(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.id,
+            "span_id": self.id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.trace.wall_time(self.start),
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoSpan:
+    """
+    Span returned outside a trace
+    """
+
+    recording = False
+
+    def set(self, **attributes):
+        pass
+
+    def finish(self, error: Optional[BaseException] = None):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Trace:
+    def __init__(self, name: str, trace_id: str = ""):
+        self.name = name
+        self.id = trace_id or uuid.uuid4().hex
+        self.root: Optional[Span] = None
+        self.spans: list[Span] = []
+        self._origin = time.perf_counter()
+        self._origin_wall = time.time()
+        self._lock = threading.Lock()
+
+    def wall_time(self, perf: float) -> float:
+        return self._origin_wall + (perf - self._origin)
+
+    def _add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> dict:
+        """
+        Number of spans and total seconds by span name, where the time went
+        """
+        totals: dict = {}
+        for s in list(self.spans):
+            count, seconds = totals.get(s.name, (0, 0.0))
+            totals[s.name] = (count + 1, seconds + (s.duration or 0.0))
+        return {
+            name: {"count": count, "seconds": round(seconds, 4)}
+            for name, (count, seconds) in sorted(totals.items(), key=lambda x: -x[1][1])
+        }
+
+    def to_jsonl(self) -> str:
+        spans = sorted(self.spans, key=lambda s: s.start)
+        return "".join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n" for s in spans)
+
+    def to_chrome(self) -> dict:
+        """
+        Chrome trace event format, one complete ("X") event per span and one
+        row per asyncio task or thread
+        """
+        lanes: dict = {}
+        events = []
+        for s in sorted(self.spans, key=lambda s: s.start):
+            tid = lanes.setdefault(s.lane, len(lanes) + 1)
+            args = dict(s.attributes)
+            if s.error is not None:
+                args["error"] = s.error
+            events.append(
+                {
+                    "name": s.name,
+                    "cat": s.name.split(".")[0],
+                    "ph": "X",
+                    "ts": round((s.start - self._origin) * 1e6, 1),
+                    "dur": round((s.duration or 0.0) * 1e6, 1),
+                    "pid": 1,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+        events.append(
+            {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": f"{self.name} {self.id}"}}
+        )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_span: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+def _lane():
+    # spans of one asyncio task (or thread) nest, they share a row in the chrome view
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return ("task", id(task)) if task is not None else ("thread", threading.get_ident())
+
+
+class span:
+    """
+    Open a span in the current trace, usable with `with` in sync and async code
+        attach: the span becomes the parent of the spans opened inside it,
+            False for spans kept open across yields (streams)
+    """
+
+    __slots__ = ("name", "attributes", "attach", "_span", "_token")
+
+    def __init__(self, name: str, attach: bool = True, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.attach = attach
+        self._span = None
+        self._token = None
+
+    def __enter__(self):
+        trace = _trace.get()
+        if trace is None:
+            self._span = _NO_SPAN
+            return _NO_SPAN
+        parent = _span.get()
+        self._span = Span(trace, self.name, parent.id if parent else None, self.attributes)
+        if self.attach:
+            self._token = _span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is not None:
+            _span.reset(self._token)
+            self._token = None
+        self._span.finish(exc if isinstance(exc, Exception) else None)
+        return False
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def current_span():
+    return _span.get() or _NO_SPAN
+
+
+def start_trace(name: str, **attributes) -> Optional[Trace]:
+    """
+    Open a trace with a new id in the current context, None when tracing is
+    disabled. The root span named name is open until finish_trace
+    """
+    if not get_trace_store().enabled:
+        return None
+    trace = Trace(name)
+    _trace.set(trace)
+    trace.root = Span(trace, name, None, attributes)
+    _span.set(trace.root)
+    return trace
+
+
+async def finish_trace(trace: Optional[Trace], error: Optional[BaseException] = None):
+    if trace is None:
+        return
+    trace.root.finish(error)
+    _span.set(None)
+    _trace.set(None)
+    store = get_trace_store()
+    store.add(trace)
+    if store.path:
+        # writing the files blocks, keep it off the event loop
+        try:
+            await asyncio.to_thread(store.export, trace)
+        except OSError as e:
+            logger.warning(f"failed to export trace {trace.id}: {e}")
+
+
+class TraceStore:
+    """
+    Recent finished traces, exported to path by finish_trace when it's set
+    Args:
+        path: folder of the exported traces, None to keep them in memory only
+        keep: number of traces kept, in memory and in the folder
+    """
+
+    def __init__(self, path: Optional[str] = "./tmp/traces", keep: int = 50, enabled: bool = True):
+        self.path = path
+        self.keep = keep
+        self.enabled = enabled
+        self._traces: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._traces[trace.id] = trace
+            self._traces.move_to_end(trace.id)
+            while len(self._traces) > self.keep:
+                self._traces.popitem(last=False)
+        logger.info(f"trace {trace.id}: {trace.summary()}")
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        with self._lock:
+            return self._traces.get(trace_id)
+
+    def list(self) -> list[dict]:
+        with self._lock:
+            traces = list(self._traces.values())
+        return [
+            {
+                "id": t.id,
+                "name": t.name,
+                "start": t.wall_time(t.root.start),
+                "duration": t.root.duration,
+                "spans": len(t.spans),
+                "attributes": t.root.attributes,
+            }
+            for t in reversed(traces)
+        ]
+
+    def export(self, trace: Trace):
+        os.makedirs(self.path, exist_ok=True)
+        base = os.path.join(self.path, trace.id)
+        with open(base + ".jsonl", "w", encoding="utf-8") as f:
+            f.write(trace.to_jsonl())
+        with open(base + ".trace.json", "w", encoding="utf-8") as f:
+            json.dump(trace.to_chrome(), f, ensure_ascii=False, default=str)
+        self._prune()
+
+    def _prune(self):
+        """
+        Delete the files of all but the last keep traces, a long running
+        server doesn't fill the disk
+        """
+        exported: dict = {}  # trace id -> last modification
+        for name in os.listdir(self.path):
+            for suffix in _SUFFIXES:
+                if name.endswith(suffix):
+                    trace_id = name[: -len(suffix)]
+                    mtime = os.path.getmtime(os.path.join(self.path, name))
+                    exported[trace_id] = max(exported.get(trace_id, 0.0), mtime)
+        old = sorted(exported, key=exported.get)[: max(len(exported) - self.keep, 0)]
+        for trace_id in old:
+            for suffix in _SUFFIXES:
+                try:
+                    os.remove(os.path.join(self.path, trace_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+_SUFFIXES = (".trace.json", ".jsonl")
+
+_store: Optional[TraceStore] = None
+_store_lock = threading.Lock()
+
+
+def get_trace_store() -> TraceStore:
+    """
+    Return the process wide trace store
+    """
+    global _store
+    if _store is not None:
+        return _store
+    try:
+        conf = read_config().get("tracing", {})
+    except Exception:
+        conf = {}
+    with _store_lock:
+        if _store is None:
+            _store = TraceStore(
+                path=conf.get("path", "./tmp/traces"),
+                keep=conf.get("keep", 50),
+                enabled=conf.get("enabled", True),
+            )
+    return _store
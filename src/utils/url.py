@@ -0,0 +1,47 @@
+"""
+Canonical form of urls
+
+The documents of a workflow (agent/model), the content cache and the fetch
+guard (browser) all key pages by url, they must agree on when two urls are
+the same page.
+"""
+
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# tracking parameters dropped from urls before they are compared, matched
+# exactly except for the utm_ prefix
+TRACKING_PARAMS = frozenset(
+    ("fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_src", "_ga")
+)
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _tracking(param: str) -> bool:
+    param = param.lower()
+    return param.startswith("utm_") or param in TRACKING_PARAMS
+
+
+def canonical_url(url: str) -> str:
+    """
+    Normalise an url so the same page found twice gets the same key:
+    scheme and host lower cased, www., default port, fragment, trailing
+    slash and tracking parameters dropped, query sorted
+    """
+    if not url:
+        return ""
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url.strip()
+    scheme = parts.scheme.lower() or "https"
+    host = (parts.hostname or "").removeprefix("www.")
+    if ":" in host:
+        host = f"[{host}]"  # ipv6
+    if port is not None and port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _tracking(k)
+    ]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ""))
@@ -0,0 +1,186 @@
+"""
+Benchmark of Agent._extract_response against the previous implementation
+
+    python test/benchmark_extract_response.py
+
+Checks that both return the same result on sample responses and that on
+random short inputs the new one never loses a result (it may find a longer
+literal with brackets inside its strings, the previous one can't), then
+times them on responses of 10k to 200k characters.
+"""
+
+import os
+import sys
+import ast
+import json
+import random
+import re
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.agent.agent import Agent  # noqa: E402
+
+
+class _Agent(Agent):
+    async def run(self, response, data=None):
+        pass
+
+    def get_recv_format(self):
+        pass
+
+    def get_send_format(self):
+        pass
+
+
+def legacy_extract_response(res: str):
+    """
+    previous implementation, a bracket counting scan from every { and [
+    """
+    markdown_pattern = r"```(?:json\s*)?\n?(.*?)\n?```"
+    markdown_matches = re.findall(markdown_pattern, res, re.DOTALL)
+
+    for match in markdown_matches:
+        match = match.strip()
+        if match.startswith(("{", "[")):
+            try:
+                return json.loads(match)
+            except json.JSONDecodeError:
+                try:
+                    return ast.literal_eval(match)
+                except Exception:
+                    continue
+
+    json_candidates = []
+    for start_char, end_char in [("{", "}"), ("[", "]")]:
+        start_idx = 0
+        while True:
+            start_pos = res.find(start_char, start_idx)
+            if start_pos == -1:
+                break
+            bracket_count = 0
+            end_pos = start_pos
+            for i in range(start_pos, len(res)):
+                char = res[i]
+                if char == start_char:
+                    bracket_count += 1
+                elif char == end_char:
+                    bracket_count -= 1
+                    if bracket_count == 0:
+                        end_pos = i
+                        break
+            if bracket_count == 0:
+                candidate = res[start_pos : end_pos + 1].strip()
+                json_candidates.append(candidate)
+            start_idx = start_pos + 1
+
+    valid_candidates = []
+    for candidate in json_candidates:
+        try:
+            valid_candidates.append((candidate, json.loads(candidate)))
+        except json.JSONDecodeError:
+            try:
+                valid_candidates.append((candidate, ast.literal_eval(candidate)))
+            except Exception:
+                continue
+
+    if valid_candidates:
+        return max(valid_candidates, key=lambda x: len(x[0]))[1]
+    return None
+
+
+SAMPLES = [
+    '```json\n[{"task": "search the news", "agent": "search"}, {"task": "write", "agent": "reporter"}]\n```',
+    'Here is the plan:\n[\n  {"task": "find papers", "agent": "search"}\n]\nLet me know!',
+    "I picked these: ['https://a.com', 'https://b.org/x?y=1']",
+    '{"url": "https://example.com", "title": "Example", "tags": ["a", "b"]}',
+    'Sure. {"a": 1} and a bigger one {"b": [1, 2, {"c": 3}]}',
+    'Broken {"a": [1, 2} but this works [1, 2, 3]',
+    "no structured output at all",
+    '```\n{"k": "v"}\n```',
+    'Nested failure {"x": oops, "y": {"z": [1, 2, 3, 4, 5]}} end',
+    "[1, 2] [3, 4]",
+    '{"a": 1} [1]',
+    '[Note: here\'s the plan] {"agent": "searcher", "task": "x"}',
+    '[He said "ok] {"agent": "searcher", "task": "x"}',
+]
+
+
+def make_response(size: int, kind: str = "prose", seed: int = 0) -> str:
+    """
+    prose: a long answer with markdown, links and some json fragments
+    json: a long json array of search results inside plain text
+    truncated: the same array cut off, as when the model hits max tokens
+    unbalanced: prose with brackets that are never closed, e.g. "[sic" or ":-["
+    """
+    rng = random.Random(seed)
+    if kind in ("json", "truncated"):
+        rows = []
+        while sum(len(r) for r in rows) < size:
+            rows.append(
+                json.dumps(
+                    {
+                        "title": f"result {len(rows)} [{rng.randint(1, 9)}]",
+                        "url": f"https://example.com/{rng.randint(1, 10**6)}",
+                        "tags": ["news", "web"],
+                    }
+                )
+            )
+        text = "Results:\n[" + ", ".join(rows) + "]\nDone."
+        if kind == "truncated":
+            return text[: size - 7]
+        return text
+
+    words = ["search", "result", "the", "model", "[1]", "(see", "above)", "{x}", "data"]
+    if kind == "unbalanced":
+        words.append("[sic")
+    parts = []
+    while sum(len(p) for p in parts) < size:
+        roll = rng.random()
+        if roll < 0.05:
+            parts.append(json.dumps({"title": "t", "url": "https://x.y", "n": [1, 2]}))
+        elif roll < 0.1:
+            parts.append("[ref " + str(rng.randint(1, 99)) + "](https://x.y/" + "a" * 20 + ")")
+        else:
+            parts.append(" ".join(rng.choice(words) for _ in range(12)))
+    return "\n".join(parts)[:size]
+
+
+def bench(fn, text: str, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    agent = _Agent(None)
+    for sample in SAMPLES:
+        assert agent._extract_response(sample) == legacy_extract_response(sample), sample
+    print(f"{len(SAMPLES)} samples: same result")
+
+    rng = random.Random(0)
+    alphabet = "{}[]\"':, 1a\n\\"
+    longer = 0
+    for _ in range(20_000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 30)))
+        new, old = agent._extract_response(text), legacy_extract_response(text)
+        if new != old:
+            assert new is not None and (old is None or len(repr(new)) > len(repr(old))), text
+            longer += 1
+    print(f"20000 random inputs: {longer} longer results, none lost")
+
+    print(f"{'kind':>10} {'chars':>8} {'legacy (s)':>12} {'new (s)':>10} {'speedup':>8}")
+    for kind in ("prose", "json", "truncated", "unbalanced"):
+        for size in (10_000, 50_000, 100_000, 200_000):
+            text = make_response(size, kind, seed=size)
+            new = bench(agent._extract_response, text)
+            assert agent._extract_response(text) == legacy_extract_response(text)
+            old = bench(legacy_extract_response, text, repeat=1)
+            print(f"{kind:>10} {size:>8} {old:>12.3f} {new:>10.4f} {old / new:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark of the html extraction inline vs in the process pool
+
+    python test/benchmark_html_extraction.py
+
+Extracts pages of 1KB to 512KB, many at the same time like a search does,
+once inline on the event loop and once through HtmlExtractor's process
+pool. For each size it prints
+    ms/page: wall time per page
+    cpu ms/page: CPU used by the server process per page, that's the time
+        taken from the other coroutines (parsing inline, pickling and IPC
+        with the pool)
+    stall ms: longest stall of the event loop, a coroutine ticking every
+        millisecond measures how late it wakes up
+Offloading costs a copy of the page to the worker and back, it pays off
+once a page takes longer to parse than to send: that crossover is what
+inline_bytes ("extraction" in config.json) should be set to. Throughput of
+the pool depends on the number of cores, on a single core it can't beat
+inline extraction.
+"""
+
+import os
+import sys
+import asyncio
+import random
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.browser.extract import HtmlExtractor, extract_text  # noqa: E402
+
+SIZES = (1_000, 2_000, 4_000, 8_000, 16_000, 32_000, 64_000, 128_000, 256_000, 512_000)
+PAGES = 32
+
+WORDS = "the of and to in is was for on that with as by at from it an be this are".split()
+
+
+def make_page(size: int, seed: int) -> bytes:
+    """
+    A page with navigation, scripts, nested divs and the paragraphs at the end
+    """
+    rng = random.Random(seed)
+    head = "<html><head><title>page</title><script>var x = 1;</script></head><body>"
+    parts = [head]
+    length = len(head)
+    while length < size * 0.9:
+        words = " ".join(rng.choice(WORDS) for _ in range(12))
+        block = (
+            f'<div class="c{rng.randint(0, 99)}"><a href="/l/{rng.randint(0, 9999)}">'
+            f"{words}</a><span>{words} &amp; more</span></div>"
+        )
+        parts.append(block)
+        length += len(block)
+    for _ in range(6):
+        parts.append("<p>" + " ".join(rng.choice(WORDS) for _ in range(20)) + "</p>")
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+async def run(extractor: HtmlExtractor, pages: list[bytes]) -> tuple[float, float, float]:
+    """
+    Extract the pages concurrently, return (seconds, cpu seconds of this
+    process, longest loop stall)
+    """
+    stall = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal stall
+        while running:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stall = max(stall, time.perf_counter() - start - 0.001)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    cpu = time.process_time()
+    results = await asyncio.gather(*(extractor.extract(p) for p in pages))
+    cpu = time.process_time() - cpu
+    seconds = time.perf_counter() - start
+    running = False
+    await tick
+    assert results == [extract_text(p) for p in pages]
+    return seconds, cpu, stall
+
+
+async def main():
+    inline = HtmlExtractor(processes=0)
+    pool = HtmlExtractor(processes=min(4, os.cpu_count() or 1), inline_bytes=0)
+    # start the workers before timing
+    await run(pool, [make_page(2_000, 0)] * 8)
+
+    print(f"{PAGES} pages at once, {pool.processes} worker processes")
+    print(
+        f"{'bytes':>8} {'ms/page':>16} {'cpu ms/page':>16} {'stall ms':>16}"
+        f"\n{'':>8} {'inline':>8}{'pool':>8} {'inline':>8}{'pool':>8} {'inline':>8}{'pool':>8}"
+    )
+    crossover = None  # first size where the pool takes less CPU of this process
+    faster = None  # first size where the pool is faster
+    for size in SIZES:
+        pages = [make_page(size, seed) for seed in range(PAGES)]
+        inline_run = min([await run(inline, pages) for _ in range(3)])
+        pool_run = min([await run(pool, pages) for _ in range(3)])
+        per_page = [x / PAGES * 1000 for x in inline_run[:2] + pool_run[:2]]
+        print(
+            f"{size:>8} {per_page[0]:>8.3f}{per_page[2]:>8.3f}"
+            f" {per_page[1]:>8.3f}{per_page[3]:>8.3f}"
+            f" {inline_run[2] * 1000:>8.2f}{pool_run[2] * 1000:>8.2f}"
+        )
+        if crossover is None and pool_run[1] < inline_run[1]:
+            crossover = size
+        if faster is None and pool_run[0] < inline_run[0]:
+            faster = size
+    pool.shutdown()
+
+    print(f"offloading saves CPU of the event loop process from: {crossover} bytes per page")
+    print(f"offloading is faster from: {faster} bytes per page")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
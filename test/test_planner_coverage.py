@@ -0,0 +1,141 @@
+"""
+Tasks skipped once the documents cover the query (planner coverage)
+
+    python -m pytest test/test_planner_coverage.py
+
+A plan without depends_on is a chain, every task depends on the previous
+one. When coverage skips a task in the middle, the tasks after it must still
+get the documents collected before it, in parallel and in sequential mode.
+"""
+
+import os
+import sys
+import json
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.agent import Agent, Planner  # noqa: E402
+from src.model.model import Model  # noqa: E402
+from src.router import Router, Server  # noqa: E402
+
+PLAN = [
+    {"agent": "searcher", "task": "search a"},
+    {"agent": "searcher", "task": "search b"},
+    {"agent": "reporter", "task": "write the report"},
+]
+
+
+class _Model(Model):
+    def __init__(self, response: str):
+        self.response = response
+
+    def _completion(self, messages):
+        return self.response
+
+    def _completion_stream(self, messages):
+        yield self.response
+
+    async def _acompletion(self, messages):
+        return self.response
+
+    async def _acompletion_stream(self, messages):
+        yield self.response
+
+    def get_client(self):
+        pass
+
+    def get_model(self):
+        return "test"
+
+    def get_llm_config(self):
+        pass
+
+    def set_api(self, api):
+        pass
+
+
+class _Coverage:
+    """
+    Covered as soon as there is a document
+    """
+
+    threshold = 0.5
+
+    def __init__(self):
+        self.calls = 0
+
+    async def score(self, query, data):
+        self.calls += 1
+        return 1.0 if data else 0.0
+
+    def covered(self, score):
+        return score >= self.threshold
+
+
+class _Searcher(Agent):
+    def __init__(self):
+        self.name = "searcher"
+        self.description = "search"
+        self.tasks = []
+
+    async def run(self, response, data=None):
+        self.tasks.append(response)
+        data = list(data or [])
+        data.append({"url": f"https://example.com/{len(self.tasks)}", "summary": response})
+        return {"agent": "planner", "task": "", "data": data}
+
+    def get_recv_format(self):
+        pass
+
+    def get_send_format(self):
+        pass
+
+
+class _Reporter(_Searcher):
+    def __init__(self):
+        super().__init__()
+        self.name = "reporter"
+        self.documents = None
+
+    async def run(self, response, data=None):
+        self.documents = len(data or [])
+        return {"agent": "TERMINATE", "task": "TERMINATE", "data": "report"}
+
+
+def _run(fan_out: int):
+    planner = Planner(_Model(json.dumps(PLAN)), "query", stream=False, plan_cache=False, fast_path=False)
+    planner._coverage = _Coverage()
+    searcher, reporter = _Searcher(), _Reporter()
+
+    server = Server(fan_out=fan_out)
+    server.add_router("planner", Router(server, planner))
+    server.set_initial_router("planner", "query")
+    for agent in (searcher, reporter):
+        planner.add_model(agent.name, agent.description)
+        server.add_router(agent.name, Router(server, agent))
+
+    result = asyncio.run(server.start("query"))
+    return result, planner, searcher, reporter
+
+
+def test_parallel_skip_keeps_documents():
+    result, planner, searcher, reporter = _run(fan_out=3)
+    assert result["data"] == "report"
+    assert searcher.tasks == ["search a"]
+    assert planner._todo_list.skipped == {"2"}
+    assert reporter.documents == 1
+
+
+def test_sequential_checks_coverage():
+    result, planner, searcher, reporter = _run(fan_out=1)
+    assert result["data"] == "report"
+    assert planner._coverage.calls > 0
+    assert searcher.tasks == ["search a"]
+    assert reporter.documents == 1
+
+
+if __name__ == "__main__":
+    test_parallel_skip_keeps_documents()
+    test_sequential_checks_coverage()
+    print("ok")